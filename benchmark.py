@@ -0,0 +1,365 @@
+import sys, os
+import json
+import copy
+import time
+import random
+import platform
+import argparse
+import datetime
+import statistics
+import subprocess
+import tempfile
+
+
+def generate_machine(folder, depth=3, fan_out=4, transitions_per_state=3, transition_files=4, seed=0):
+    """
+    Writes a synthetic machine into folder: states.json with a root state `sm` and fan_out children
+    per compound state down to depth, and transitions_per_state transitions (triggers t0, t1, ...)
+    from every leaf to random leaves, spread over transition_files files in folder/trans.
+    Returns (states file, transitions folder, number of states, number of transitions).
+    """
+    rng = random.Random(seed)
+    leaves = []
+    state_count = 0
+
+    def build(name, path, level):
+        nonlocal state_count
+        state_count += 1
+        full_path = path + [name]
+        if level == depth:
+            leaves.append('_'.join(full_path))
+            return name
+        children = [build(f's{i}', full_path, level + 1) for i in range(fan_out)]
+        return {'name': name, 'children': children, 'initial': 's0'}
+
+    states = [build('sm', [], 0)]
+
+    transitions = []
+    for source in leaves:
+        for i in range(transitions_per_state):
+            transitions.append({'trigger': f't{i}',
+                                'conditions': f'c{len(transitions)}',
+                                'source': source,
+                                'dest': rng.choice(leaves)})
+
+    states_file = os.path.join(folder, 'states.json')
+    with open(states_file, 'w') as f:
+        json.dump(states, f, indent=4)
+
+    transitions_folder = os.path.join(folder, 'trans')
+    os.makedirs(transitions_folder, exist_ok=True)
+    file_count = max(1, transition_files)
+    for i in range(file_count):
+        with open(os.path.join(transitions_folder, f'trans{i}.json'), 'w') as f:
+            json.dump(transitions[i::file_count], f, indent=4)
+
+    return states_file, transitions_folder, state_count, len(transitions)
+
+
+def measure(function, setup=None, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+class BenchmarkRunner:
+    """
+    Times the hot paths of StateMachineWidget and the transitions table on a generated machine.
+    Every case is run `repeat` times, its setup is not timed.
+    """
+
+    def __init__(self, states_file, transitions_folder, repeat=5, triggers=2000, transitions_per_state=3, backend='graph'):
+        self.repeat = repeat
+        self.trigger_count = triggers
+        self.transitions_per_state = transitions_per_state
+        self.results = {}
+
+        from PyQt5.QtGui import QIcon
+        from state_machine_ui import StateMachineWidget
+        from state_machine_core import MachineBackend
+
+        self.widget = StateMachineWidget(icon=QIcon())
+        self.widget.set_machine_backend(MachineBackend[backend])
+        self.widget.resize(1600, 1200)
+        self.widget.STATES_CONFIG = states_file
+        self.widget.TRANSITIONS_CONFIG_FOLDER = transitions_folder
+        self.widget.enable_default_enter = True
+        self.widget.enable_default_exit = True
+
+        with open(states_file, 'r') as f:
+            self.raw_states = json.load(f)
+
+    def add_result(self, name, timings, ops=1):
+        self.results[name] = {
+            'min': min(timings),
+            'median': statistics.median(timings),
+            'mean': statistics.mean(timings),
+            'repeat': len(timings),
+            'ops': ops,
+        }
+
+    def run(self, only=None):
+        cases = [
+            ('load_transitions', self.bench_load_transitions),
+            ('build_states', self.bench_build_states),
+            ('connect_states', self.bench_connect_states),
+            ('set_init_state', self.bench_set_init_state),
+            ('trigger_transition', self.bench_trigger_transition),
+            ('paint', self.bench_paint),
+            ('hit_test', self.bench_hit_test),
+            ('table_set_transitions', self.bench_table_set_transitions),
+            ('filter_proxy', self.bench_filter_proxy),
+            ('filter_snapshot', self.bench_filter_snapshot),
+        ]
+        # the cases build on each other, a skipped one still runs once untimed to set the widget up
+        for name, case in cases:
+            case(timed=only is None or name in only)
+        return self.results
+
+    def reset_states(self):
+        from state_machine_core import create_matter_class
+
+        widget = self.widget
+        widget.matter_class = create_matter_class()
+        widget.enter_function_names = set()
+        widget.exit_function_names = set()
+        widget.states = []
+        widget.state_by_path = None
+        widget.merged_transitions = {}
+        # _build_states() rewrites the leaves of the list into dicts
+        widget.json_states = copy.deepcopy(self.raw_states)
+
+    def bench_load_transitions(self, timed=True):
+        widget = self.widget
+        if timed:
+            self.add_result('load_transitions', measure(widget._load_transitions, repeat=self.repeat))
+        widget.json_transitions = widget._load_transitions()
+
+    def bench_build_states(self, timed=True):
+        widget = self.widget
+        if timed:
+            timings = measure(lambda: widget._build_states(widget.json_states), self.reset_states, self.repeat)
+            self.add_result('build_states', timings)
+        self.reset_states()
+        widget._build_states(widget.json_states)
+        widget._layout_states()
+
+    def bench_connect_states(self, timed=True):
+        widget = self.widget
+
+        def setup():
+            for state in widget.states:
+                state.outgoing_transitions = []
+            widget.merged_transitions = {}
+
+        if timed:
+            timings = measure(lambda: widget._connect_states(widget.json_transitions), setup, self.repeat)
+            self.add_result('connect_states', timings, len(widget.json_transitions))
+        setup()
+        widget._connect_states(widget.json_transitions)
+
+    def bench_set_init_state(self, timed=True):
+        widget = self.widget
+        self.initial_state_name = widget._find_the_1st_initial_state(widget.json_states)
+        if timed:
+            self.add_result('set_init_state', measure(lambda: widget.set_init_state(self.initial_state_name), repeat=self.repeat))
+        else:
+            widget.set_init_state(self.initial_state_name)
+
+        for transition in widget.json_transitions:
+            widget.setup_conditions_allowed_slot(transition['conditions'], 'Yes')
+
+    def bench_trigger_transition(self, timed=True):
+        widget = self.widget
+        widget.set_animation(False)
+        triggers = [f't{i % self.transitions_per_state}' for i in range(self.trigger_count)]
+
+        def run():
+            for trigger in triggers:
+                widget.trigger_transition(trigger)
+
+        if timed:
+            timings = measure(run, lambda: widget.set_init_state(self.initial_state_name), self.repeat)
+            self.add_result('trigger_transition', timings, len(triggers))
+
+    def bench_paint(self, timed=True):
+        widget = self.widget
+        # grab() runs paintEvent() synchronously, also when the widget is not shown
+        # the first paint also computes the name rects the hit test needs
+        widget.grab()
+        if timed:
+            self.add_result('paint', measure(widget.grab, repeat=self.repeat))
+
+    def bench_hit_test(self, timed=True):
+        widget = self.widget
+        points = [(x * widget.width() // 20, y * widget.height() // 20) for x in range(20) for y in range(20)]
+
+        def run():
+            for x, y in points:
+                if widget.inside_the_state(x, y) is None:
+                    widget.above_the_transition(x, y)
+
+        if timed:
+            self.add_result('hit_test', measure(run, repeat=self.repeat), len(points))
+
+    def bench_table_set_transitions(self, timed=True):
+        from conditions_table_view import MyTableView
+
+        self.table_view = MyTableView()
+        transitions = self.widget.json_transitions
+        if timed:
+            timings = measure(lambda: self.table_view.set_transitions(transitions), repeat=self.repeat)
+            self.add_result('table_set_transitions', timings, len(transitions))
+        else:
+            self.table_view.set_transitions(transitions)
+
+    def bench_filter_proxy(self, timed=True):
+        proxy_model = self.table_view.proxy_model
+
+        def setup():
+            proxy_model.set_filter_text('')
+
+        if timed:
+            timings = measure(lambda: proxy_model.set_filter_text('t1'), setup, self.repeat)
+            self.add_result('filter_proxy', timings, self.table_view.table_model.rowCount())
+        setup()
+
+    def bench_filter_snapshot(self, timed=True):
+        from filter_proxy_model import compile_filter_pattern, match_filter_snapshot
+
+        proxy_model = self.table_view.proxy_model
+        pattern = compile_filter_pattern('t1')
+
+        def run():
+            # what DebouncedFilter does, without the debounce delay and the worker thread
+            accepted_paths = match_filter_snapshot(proxy_model.filter_snapshot(), pattern)
+            proxy_model.apply_filter_result(pattern, accepted_paths)
+
+        def setup():
+            proxy_model.set_filter_text('')
+
+        if timed:
+            timings = measure(run, setup, self.repeat)
+            self.add_result('filter_snapshot', timings, self.table_view.table_model.rowCount())
+        setup()
+
+
+def git_revision():
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        return result.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def load_history(history_file):
+    if not os.path.exists(history_file):
+        return []
+    with open(history_file, 'r') as f:
+        return json.load(f)
+
+
+def compare_runs(previous, current, threshold):
+    # returns the cases at least threshold (0.2 = 20%) slower than in the previous run
+    regressions = []
+    print(f'\ncompared with {previous.get("label") or previous.get("revision")} ({previous["time"]})')
+    for name, result in current['results'].items():
+        old_result = previous['results'].get(name)
+        if old_result is None or old_result['min'] == 0:
+            continue
+        # per operation, so a case which changed its amount of work stays comparable
+        change = (result['min'] / result['ops']) / (old_result['min'] / old_result['ops']) - 1
+        flag = ''
+        if change >= threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print(f'{name:<24} {change*100:+8.1f}%{flag}')
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the load, trigger, paint and filter paths on a synthetic machine.')
+    parser.add_argument('--depth', type=int, default=3, help='levels of nested states below the root, default 3')
+    parser.add_argument('--fan-out', type=int, default=4, help='children per compound state, default 4')
+    parser.add_argument('--transitions', type=int, default=3, help='transitions per leaf state, default 3')
+    parser.add_argument('--files', type=int, default=4, help='number of transition files, default 4')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the generated transitions, default 0')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per case, default 5')
+    parser.add_argument('--triggers', type=int, default=2000, help='triggers per trigger_transition run, default 2000')
+    parser.add_argument('--backend', default='graph', choices=['graph', 'nested'], help='machine backend, default graph')
+    parser.add_argument('--only', nargs='*', help='cases to time, all of them when omitted')
+    parser.add_argument('--history', default='benchmark_history.json', help='JSON file the results are appended to')
+    parser.add_argument('--label', default=None, help='name of this run in the history, e.g. a release')
+    parser.add_argument('--threshold', type=float, default=0.2, help='slowdown reported as a regression, default 0.2 (20%%)')
+    parser.add_argument('--check', action='store_true', help='exit with 1 when a regression is found')
+    parser.add_argument('--no-save', action='store_true', help='do not append the results to the history')
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt5.QtWidgets import QApplication
+    from PyQt5.QtCore import QT_VERSION_STR
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+
+    params = {
+        'depth': args.depth,
+        'fan_out': args.fan_out,
+        'transitions_per_state': args.transitions,
+        'transition_files': args.files,
+        'seed': args.seed,
+        'triggers': args.triggers,
+    }
+    # only the nested runs are marked, the graph runs still compare with the ones saved before the option
+    if args.backend != 'graph':
+        params['backend'] = args.backend
+
+    with tempfile.TemporaryDirectory() as folder:
+        states_file, transitions_folder, state_count, transition_count = generate_machine(
+            folder, args.depth, args.fan_out, args.transitions, args.files, args.seed)
+        print(f'{state_count} states, {transition_count} transitions in {args.files} files\n')
+
+        # the callbacks print every call, which would be timed as well
+        stdout = sys.stdout
+        runner = BenchmarkRunner(states_file, transitions_folder, args.repeat, args.triggers, args.transitions, args.backend)
+        with open(os.devnull, 'w') as devnull:
+            sys.stdout = devnull
+            try:
+                results = runner.run(args.only)
+            finally:
+                sys.stdout = stdout
+
+    for name, result in results.items():
+        print(f'{name:<24} min {result["min"]*1000:10.3f} ms   median {result["median"]*1000:10.3f} ms   {result["ops"] / result["min"]:12.0f} ops/s')
+
+    run = {
+        'time': datetime.datetime.now().isoformat(timespec='seconds'),
+        'label': args.label,
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'qt': QT_VERSION_STR,
+        'platform': platform.platform(),
+        'params': params,
+        'results': results,
+    }
+
+    history = load_history(args.history)
+    regressions = []
+    previous = next((item for item in reversed(history) if item.get('params') == params), None)
+    if previous is not None:
+        regressions = compare_runs(previous, run, args.threshold)
+
+    if not args.no_save:
+        history.append(run)
+        with open(args.history, 'w') as f:
+            json.dump(history, f, indent=4)
+
+    return 1 if args.check and regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
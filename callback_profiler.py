@@ -0,0 +1,184 @@
+import time
+import threading
+from contextlib import contextmanager
+
+from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QCheckBox, QComboBox, QPushButton, QLabel,
+                             QTableWidget, QTableWidgetItem, QHeaderView, QAbstractItemView)
+from PyQt5.QtCore import Qt, QTimer
+
+
+class CallbackProfiler:
+    """
+    Call count, cumulative and max latency of the machine's callbacks, per callback name and per
+    trigger. Off by default: only the wrappers created while it is enabled are instrumented, so a
+    disabled profiler costs nothing per call.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        # trigger running in the current thread, callbacks outside of a trigger (timeouts) have none
+        self.local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            # name -> [count, total seconds, max seconds]
+            self.callbacks = {}
+            self.triggers = {}
+            self.trigger_callbacks = {}
+
+    @staticmethod
+    def _add(table, key, elapsed):
+        entry = table.get(key)
+        if entry is None:
+            table[key] = [1, elapsed, elapsed]
+        else:
+            entry[0] += 1
+            entry[1] += elapsed
+            if elapsed > entry[2]:
+                entry[2] = elapsed
+
+    def record(self, name, elapsed):
+        trigger = getattr(self.local, 'trigger', None)
+        with self.lock:
+            self._add(self.callbacks, name, elapsed)
+            if trigger is not None:
+                self._add(self.trigger_callbacks, (trigger, name), elapsed)
+
+    @contextmanager
+    def trigger(self, trigger):
+        if not self.enabled:
+            yield
+            return
+        self.local.trigger = trigger
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.local.trigger = None
+            with self.lock:
+                self._add(self.triggers, trigger, elapsed)
+
+    def instrument(self, name, function):
+        # wraps a callback of the matter class, the timing includes the signal it emits
+        def profiled_function(matter, event):
+            start = time.perf_counter()
+            try:
+                return function(matter, event)
+            finally:
+                self.record(name, time.perf_counter() - start)
+        profiled_function.__name__ = function.__name__
+        return profiled_function
+
+    @staticmethod
+    def _entry_stats(entry):
+        count, total, maximum = entry
+        return {'count': count, 'total': total, 'mean': total / count, 'max': maximum}
+
+    def stats(self):
+        # times are in seconds
+        with self.lock:
+            return {
+                'callbacks': {name: self._entry_stats(entry) for name, entry in self.callbacks.items()},
+                'triggers': {name: self._entry_stats(entry) for name, entry in self.triggers.items()},
+                'trigger_callbacks': {key: self._entry_stats(entry) for key, entry in self.trigger_callbacks.items()},
+            }
+
+    def top(self, count=10, group='callbacks', key='total'):
+        # e.g. top(5) are the 5 callbacks with the most cumulative latency
+        items = self.stats()[group].items()
+        return sorted(items, key=lambda item: item[1][key], reverse=True)[:count]
+
+
+class ProfilerPanel(QWidget):
+    """
+    Table of the CallbackProfiler's stats, refreshed while the panel is shown.
+    """
+
+    GROUPS = [('Callback', 'callbacks'), ('Trigger', 'triggers'), ('Trigger / Callback', 'trigger_callbacks')]
+    COLUMNS = ['Name', 'Count', 'Total (ms)', 'Mean (ms)', 'Max (ms)']
+
+    def __init__(self, profiler, set_enabled, icon=None):
+        super().__init__()
+        self.profiler = profiler
+        self.set_enabled = set_enabled
+
+        self.setWindowTitle('Profiler')
+        if icon is not None:
+            self.setWindowIcon(icon)
+        self.resize(640, 400)
+
+        self.enable_checkbox = QCheckBox('Profile callbacks')
+        self.enable_checkbox.setChecked(profiler.enabled)
+        self.group_options = QComboBox()
+        self.group_options.addItems([label for label, group in self.GROUPS])
+        self.reset_button = QPushButton('Reset')
+
+        top_widget = QWidget()
+        top_widget.setLayout(QHBoxLayout())
+        top_widget.layout().setContentsMargins(0, 0, 0, 0)
+        top_widget.layout().addWidget(self.enable_checkbox)
+        top_widget.layout().addStretch()
+        top_widget.layout().addWidget(QLabel('Group by'))
+        top_widget.layout().addWidget(self.group_options)
+        top_widget.layout().addWidget(self.reset_button)
+
+        self.table = QTableWidget(0, len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.table.verticalHeader().setVisible(False)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.setSortingEnabled(True)
+
+        self.setLayout(QVBoxLayout())
+        self.layout().addWidget(top_widget)
+        self.layout().addWidget(self.table)
+
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setInterval(500)
+        self.refresh_timer.timeout.connect(self.refresh)
+
+        self.enable_checkbox.stateChanged.connect(self.enable_changed_slot)
+        self.group_options.currentIndexChanged.connect(self.refresh)
+        self.reset_button.clicked.connect(self.reset_slot)
+
+    def enable_changed_slot(self, state):
+        self.set_enabled(state == Qt.CheckState.Checked)
+
+    def reset_slot(self):
+        self.profiler.reset()
+        self.refresh()
+
+    def refresh(self):
+        group = self.GROUPS[self.group_options.currentIndex()][1]
+        stats = self.profiler.stats()[group]
+
+        sort_column = self.table.horizontalHeader().sortIndicatorSection()
+        sort_order = self.table.horizontalHeader().sortIndicatorOrder()
+        self.table.setSortingEnabled(False)
+        self.table.setRowCount(len(stats))
+        for row, (name, entry) in enumerate(stats.items()):
+            if isinstance(name, tuple):
+                name = ' / '.join(name)
+            values = [entry['count'], entry['total'] * 1000, entry['mean'] * 1000, entry['max'] * 1000]
+            self.table.setItem(row, 0, QTableWidgetItem(name))
+            for column, value in enumerate(values, start=1):
+                item = QTableWidgetItem()
+                # numbers sort as numbers
+                item.setData(Qt.DisplayRole, value if column == 1 else round(value, 3))
+                item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                self.table.setItem(row, column, item)
+        self.table.setSortingEnabled(True)
+        self.table.sortItems(sort_column, sort_order)
+
+    def showEvent(self, a0):
+        self.enable_checkbox.setChecked(self.profiler.enabled)
+        self.refresh()
+        self.refresh_timer.start()
+        return super().showEvent(a0)
+
+    def hideEvent(self, a0):
+        self.refresh_timer.stop()
+        return super().hideEvent(a0)
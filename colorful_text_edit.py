@@ -5,6 +5,7 @@ from PyQt5.QtGui import QPainter, QColor, QPen, QPolygonF, QPainterPath, QFont,
 from PyQt5.QtCore import Qt, QSettings, QPointF, QEvent, pyqtSignal
 
 import datetime
+from contextlib import contextmanager
 from enum import Enum 
 
 
@@ -42,6 +43,26 @@ class ColorfulTextEdit(QPlainTextEdit):
         font.setFixedPitch(True)  # 强制等宽
         self.setFont(font)
 
+        self.pending_html = None
+        # time of the event being logged inside batched_append(), instead of the time of the append
+        self.log_time = None
+
+    @contextmanager
+    def batched_append(self):
+        # logs appended inside the block go into the document with one appendHtml()
+        if self.pending_html is not None:
+            yield
+            return
+        self.pending_html = []
+        try:
+            yield
+        finally:
+            pending_html = self.pending_html
+            self.pending_html = None
+            self.log_time = None
+            if pending_html:
+                self.appendHtml(''.join(pending_html))
+
     def contextMenuEvent(self, event):
         self.parent().contextMenuEvent(event)
 
@@ -59,7 +80,7 @@ class ColorfulTextEdit(QPlainTextEdit):
     def append_log(self, object_name, function_name, function_params=None, return_code=None, 
                    left_variable=None, function_type:FunctionType = FunctionType.other, 
                    actions=None):
-        now = datetime.datetime.now()
+        now = self.log_time if self.log_time is not None else datetime.datetime.now()
         timestamp = now.strftime(TIMESTAMP_FORMAT)
 
         color_ts = f'<span style="color: #2ca20f;">[{timestamp}]</span>'
@@ -104,4 +125,7 @@ class ColorfulTextEdit(QPlainTextEdit):
 
         head_text = (f'<p style="white-space: pre-wrap;">{text}</p>')
 
-        self.appendHtml(head_text)
\ No newline at end of file
+        if self.pending_html is not None:
+            self.pending_html.append(head_text)
+        else:
+            self.appendHtml(head_text)
\ No newline at end of file
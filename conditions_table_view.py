@@ -10,7 +10,7 @@ import importlib
 from PyQt5 import QtWidgets, uic
 from PyQt5.QtWidgets import QItemDelegate, QMenu, QGridLayout, QApplication, QWidget, QTableView, QSizePolicy, QTableView, QFrame, QRadioButton, QComboBox, QLineEdit, QButtonGroup, QPushButton, QCheckBox, QHeaderView, QSplitter, QAction, QVBoxLayout, QMessageBox, QFileDialog, QStyledItemDelegate, QStyle, QHBoxLayout, QLabel
 from PyQt5.QtGui import QStandardItemModel, QStandardItem, QCursor, QIcon, QPixmap, QFont, QColor
-from PyQt5.QtCore import Qt, pyqtSignal, QObject, QTimer, QTextStream, QFile, QIODevice, QItemSelectionModel, QThread, QSortFilterProxyModel, QModelIndex, QRegularExpression
+from PyQt5.QtCore import Qt, pyqtSignal, QObject, QAbstractTableModel, QTimer, QTextStream, QFile, QIODevice, QItemSelectionModel, QThread, QSortFilterProxyModel, QModelIndex, QRegularExpression
 import csv
 import re
 import signal
@@ -21,6 +21,7 @@ import six
 import threading
 
 from colorful_text_edit import FunctionType
+from filter_proxy_model import RecursiveFilterProxyModel, DebouncedFilter, FilterSnapshot
 
 
 class ComboBoxDelegate(QItemDelegate):
@@ -60,35 +61,7 @@ class ComboBoxDelegate(QItemDelegate):
         self.value_changed.emit(row, text)
 
 
-class RecursiveFilterProxyModel(QSortFilterProxyModel):
-    def filterAcceptsRow(self, source_row: int, source_parent: QModelIndex) -> bool:
-        for column in range(self.sourceModel().columnCount(source_parent)):
-            sub_index = self.sourceModel().index(source_row, column, source_parent)
-            text = self.sourceModel().data(sub_index, Qt.DisplayRole)
-            if text is not None:
-                regExp = self.filterRegExp().pattern()
-                if regExp:
-                    # print('regExp')
-                    try:
-                        if re.search(regExp, str(text)):
-                            return True
-                    except re.error:
-                        pass
-                else:
-                    # print('regularExp')
-                    regularExp = self.filterRegularExpression()
-                    if regularExp.match(str(text)).hasMatch():
-                        return True
-        
-        index = self.sourceModel().index(source_row, 0, parent=source_parent)
-        # 递归检查子项是否匹配
-        rows = self.sourceModel().rowCount(index)
-        for row in range(rows):
-            if self.filterAcceptsRow(row, index):
-                return True
-
-        return super().filterAcceptsRow(source_row, source_parent)
-
+class ConditionsFilterProxyModel(RecursiveFilterProxyModel):
     def data(self, index, role=Qt.DisplayRole):
         if role == Qt.ForegroundRole:
             if index.column() == 0:    # source
@@ -109,6 +82,126 @@ class RecursiveFilterProxyModel(QSortFilterProxyModel):
 
         return None
 
+class TransitionsTableModel(QAbstractTableModel):
+    HEADER = ['Source', 'Trigger/Event', 'Condition/Action/Guard/Trans', 'Dest', 'Allowed']
+    TRANSITION_KEYS = ['source', 'trigger', 'conditions', 'dest']
+    CONDITION_COLUMN = 2
+    ALLOWED_COLUMN = 4
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.json_transitions = []
+        # one list of display texts per column, the allowed flags are kept as 0/1 bytes
+        self.columns = [[] for _ in self.TRANSITION_KEYS]
+        self.allowed = bytearray()
+        self.condition_rows = {}
+        self.snapshot = None
+
+    def set_transitions(self, json_transitions):
+        self.beginResetModel()
+        self.json_transitions = json_transitions if json_transitions is not None else []
+        self.columns = [[transition[key] if len(transition[key]) > 0 else '-' for transition in self.json_transitions]
+                        for key in self.TRANSITION_KEYS]
+        self.allowed = bytearray(b'\x01') * len(self.json_transitions)
+        self.snapshot = None
+
+        self.condition_rows = {}
+        for row, condition in enumerate(self.columns[self.CONDITION_COLUMN]):
+            rows = self.condition_rows.get(condition)
+            if rows is None:
+                self.condition_rows[condition] = [row]
+            else:
+                rows.append(row)
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.allowed)
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.HEADER)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+
+        column = index.column()
+        if role == Qt.DisplayRole or role == Qt.EditRole:
+            if column == self.ALLOWED_COLUMN:
+                return 'Yes' if self.allowed[index.row()] else 'No'
+            return self.columns[column][index.row()]
+        elif role == Qt.TextAlignmentRole:
+            if column == self.ALLOWED_COLUMN:
+                return Qt.AlignmentFlag.AlignHCenter | Qt.AlignmentFlag.AlignVCenter
+            return Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignVCenter
+        return None
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if not index.isValid() or index.column() != self.ALLOWED_COLUMN or role != Qt.EditRole:
+            return False
+
+        self.set_row_allowed(index.row(), value)
+        return True
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        flags = Qt.ItemIsEnabled | Qt.ItemIsSelectable
+        if index.column() == self.ALLOWED_COLUMN:
+            flags |= Qt.ItemIsEditable
+        return flags
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self.HEADER[section]
+        return str(section + 1)
+
+    def row_data(self, row):
+        row_data = [column[row] for column in self.columns]
+        row_data.append('Yes' if self.allowed[row] else 'No')
+        return row_data
+
+    def condition(self, row):
+        return self.columns[self.CONDITION_COLUMN][row]
+
+    def set_row_allowed(self, row, allowed):
+        flag = 1 if str(allowed).lower() == 'yes' else 0
+        if self.allowed[row] != flag:
+            self.allowed[row] = flag
+            self.snapshot = None
+            index = self.index(row, self.ALLOWED_COLUMN)
+            self.dataChanged.emit(index, index)
+
+    def conditions(self):
+        return self.condition_rows.keys()
+
+    def set_condition_allowed(self, condition, allowed):
+        for row in self.condition_rows.get(condition, ()):
+            self.set_row_allowed(row, allowed)
+
+    def set_conditions_allowed(self, conditions_allowed):
+        for condition, allowed in conditions_allowed.items():
+            self.set_condition_allowed(condition, allowed)
+
+    def get_all_conditions_allowed(self):
+        # rows of the same condition are kept in sync, so the first row speaks for all of them
+        return {condition: 'Yes' if self.allowed[rows[0]] else 'No' for condition, rows in self.condition_rows.items()}
+
+    def filter_snapshot(self):
+        if self.snapshot is None:
+            rows = len(self.allowed)
+            allowed_texts = ['Yes' if allowed else 'No' for allowed in self.allowed]
+            self.snapshot = FilterSnapshot(paths=[(row,) for row in range(rows)],
+                                           parents=[-1] * rows,
+                                           texts=list(zip(*self.columns, allowed_texts)))
+        return self.snapshot
+
+
 class MyTableView(QTableView):
     condition_allowed_changed = pyqtSignal(str, str)
     focus_signal = pyqtSignal(FunctionType, list)
@@ -116,7 +209,6 @@ class MyTableView(QTableView):
 
     def __init__(self, parent=None):
         super().__init__(parent)
-        self.regex_cache = {}
         self.initUI()
 
         self.search_regex_option = Qt.CheckState.Unchecked
@@ -216,12 +308,14 @@ class MyTableView(QTableView):
         
 
     def initUI(self):
-        self.table_model = QStandardItemModel(self)
-        self.proxy_model = RecursiveFilterProxyModel()
+        self.table_model = TransitionsTableModel(self)
+        self.proxy_model = ConditionsFilterProxyModel()
         self.proxy_model.setSourceModel(self.table_model)
         self.proxy_model.setFilterCaseSensitivity(Qt.CaseInsensitive)  # 不区分大小写
         self.setModel(self.proxy_model)
 
+        self.debounced_filter = DebouncedFilter(self.proxy_model, parent=self)
+
     def contextMenuEvent(self, event):
         # 1. 获取鼠标位置对应的模型索引
         index = self.indexAt(event.pos())
@@ -253,14 +347,14 @@ class MyTableView(QTableView):
     def copy_item_text(self, index, column):
         source_index = self.proxy_model.mapToSource(index)
         
-        item_text = self.table_model.itemData(source_index)[0]
+        item_text = self.table_model.data(source_index)
 
         clipboard = QApplication.clipboard()
         clipboard.setText(item_text)
 
     def focus_item_text(self, index, column):
         source_index = self.proxy_model.mapToSource(index)
-        current_text = self.table_model.itemData(source_index)[0]
+        current_text = self.table_model.data(source_index)
 
         row_data = self.get_selected_row()
         if column == 1 or column == 2:
@@ -279,7 +373,7 @@ class MyTableView(QTableView):
 
     def init_state_item_text(self, index, column):
         source_index = self.proxy_model.mapToSource(index)
-        current_text = self.table_model.itemData(source_index)[0]
+        current_text = self.table_model.data(source_index)
 
         row_data = self.get_selected_row()
         if column == 0 or column == 3:
@@ -291,10 +385,6 @@ class MyTableView(QTableView):
                 print(f'init_state_signal={current_text}')
 
     def __setupTableView(self):
-        self.table_model.clear()
-        database_table_header = ['Source', 'Trigger/Event', 'Condition/Action/Guard/Trans', 'Dest', 'Allowed']
-        self.table_model.setHorizontalHeaderLabels(database_table_header)
-
         self.setColumnWidth(0, 300)
         self.setColumnWidth(1, 250)
         self.setColumnWidth(2, 200)
@@ -321,56 +411,15 @@ class MyTableView(QTableView):
         proxy_index = self.proxy_model.index(row, 2) # condition
         source_index = self.proxy_model.mapToSource(proxy_index)
         if source_index.isValid():
-            condition = self.table_model.itemData(source_index)[0]
+            condition = self.table_model.data(source_index)
             self.condition_allowed_changed.emit(condition, text)
             print(f'emit condition_item={condition} allowed={text}')
 
             # print(f'condition={condition} return {text}')
-            for _row in range(self.table_model.rowCount()):
-                condition_item = self.table_model.item(_row, 2)
-                allowed_item = self.table_model.item(_row, 4)
-                if condition_item and condition_item and condition == condition_item.text() and allowed_item.text() != text:
-                    allowed_item.setText(text)
+            self.table_model.set_condition_allowed(condition, text)
 
     def set_transitions(self, json_transitions):
-        self.clear_transitions()
-
-        for row, transition in enumerate(json_transitions):
-            source = transition['source']
-            trigger = transition['trigger']
-            conditions = transition['conditions']
-            dest = transition['dest']
-
-            column = 0
-            item = QStandardItem('-' if len(source) == 0 else source)
-            item.setEditable(False)
-            item.setTextAlignment(Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignVCenter)
-            self.table_model.setItem(row, column, item)
-            
-            column = column + 1
-            item = QStandardItem('-' if len(trigger) == 0 else trigger)
-            item.setEditable(False)
-            item.setTextAlignment(Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignVCenter)
-            self.table_model.setItem(row, column, item)
-            
-            column = column + 1
-            item = QStandardItem('-' if len(conditions) == 0 else conditions)
-            item.setEditable(False)
-            item.setTextAlignment(Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignVCenter)
-            self.table_model.setItem(row, column, item)
-            
-            # print(f'set_transitions condition_item={item.text()} allowed=Yes')
-            
-            column = column + 1
-            item = QStandardItem('-' if len(dest) == 0 else dest)
-            item.setEditable(False)
-            item.setTextAlignment(Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignVCenter)
-            self.table_model.setItem(row, column, item)
-
-            column = column + 1
-            item = QStandardItem(str('Yes'))
-            item.setTextAlignment(Qt.AlignmentFlag.AlignHCenter | Qt.AlignmentFlag.AlignVCenter)
-            self.table_model.setItem(row, column, item)            
+        self.table_model.set_transitions(json_transitions)
 
     def get_selected_row(self):
         selections = self.selectionModel()
@@ -380,65 +429,25 @@ class MyTableView(QTableView):
             proxy_index = selected[0]
             # 将代理模型中的索引转换为源模型中的索引
             source_index = self.proxy_model.mapToSource(proxy_index)
-            row = source_index.row()
-            row_data = []
-            for column in range(self.table_model.columnCount()):
-                item = self.table_model.item(row, column)
-                if item is not None:
-                    row_data.append(item.text())
-            return row_data
+            return self.table_model.row_data(source_index.row())
         return None
 
     def clear_transitions(self):
-        self.table_model.clear()
-        self.__setupTableView()
+        self.table_model.set_transitions([])
 
     def filter_tree_view_slot(self, text):
-        if self.search_regex_option == Qt.CheckState.Checked:
-            # print('search_regex_option is checked')
-            if text in self.regex_cache:
-                regex = self.regex_cache[text]
-            else:
-                regex = QRegularExpression(text)
-                self.regex_cache[text] = regex
-
-            if regex.isValid():
-                # print(f"set regex: '{text}'")
-                self.proxy_model.setFilterRegularExpression(text)
-                return
-
-        # print(f"set filter wildcard: '{text}'")
-        self.proxy_model.setFilterWildcard(text)
+        regex = self.search_regex_option == Qt.CheckState.Checked
+        self.debounced_filter.request(text, regex)
 
     def regex_check_box_state_changed_slot(self, state):
         print(f'regex_check_box_state_changed_slot state={state}')
         self.search_regex_option = state
 
     def _get_all_conditions_allowed(self):
-        condition_allowed = dict()
-        for row in range(self.table_model.rowCount()):
-            condition_item = self.table_model.item(row, 2)
-            allowed_item = self.table_model.item(row, 4)
-            if condition_item and condition_item:
-                # print(f'current condition_item={condition_item.text()} allowed={allowed_item.text()}')
-                condition_allowed[condition_item.text()] = allowed_item.text()
-        return condition_allowed
+        return self.table_model.get_all_conditions_allowed()
     
     def _set_all_conditions_allowed(self, conditions_allowed):
-        for row in range(self.table_model.rowCount()):
-            condition_item = self.table_model.item(row, 2)
-            allowed_item = self.table_model.item(row, 4)
-
-            # 检查 item 是否为 None
-            if condition_item and allowed_item:
-                condition_text = condition_item.text()
-                if condition_text in conditions_allowed:
-                    value = conditions_allowed[condition_text]
-                    try:
-                        allowed_item.setText(value)
-                        # print(f'_set_all_conditions_allowed condition_item={condition_item.text()} allowed={value}')
-                    except Exception as e:
-                        print(f"更新允许状态时出现错误: {e} value={value}")
+        self.table_model.set_conditions_allowed(conditions_allowed)
 
 class MySearchComboBox(QComboBox):
     def __init__(self, parent=None):
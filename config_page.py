@@ -7,19 +7,30 @@ import importlib
 
 from PyQt5.QtWidgets import QApplication, QWidget, QCheckBox, QVBoxLayout, QHBoxLayout, QLabel, QComboBox, QMessageBox, QInputDialog, QPushButton, QLineEdit, QFileDialog, QMainWindow, QMenuBar, QMenu, QFormLayout, QGridLayout
 from PyQt5.QtGui import QIcon
-from PyQt5.QtCore import pyqtSignal, Qt
+from PyQt5.QtCore import pyqtSignal, Qt, QFileSystemWatcher, QTimer
 
 from pathlib import Path
 
+from trigger_queue import TriggerPolicy
+from state_machine_core import MachineBackend
+
 
 class Theme(Enum):
     white = 0
     black = 1
 
+# the items of the animation speed combo box
+ANIMATION_SPEEDS = [0.5, 1.0, 2.0, 4.0]
+
 class ConfigPage(QWidget):
     config_changed_signal = pyqtSignal()
     animation_changed_signal = pyqtSignal(bool)
+    animation_speed_changed_signal = pyqtSignal(float)
     theme_changed_signal = pyqtSignal(Theme)
+    custom_matter_changed_signal = pyqtSignal()
+    trigger_queue_policy_changed_signal = pyqtSignal(TriggerPolicy)
+    worker_thread_changed_signal = pyqtSignal(bool)
+    machine_backend_changed_signal = pyqtSignal(MachineBackend)
 
     def __init__(self, icon=None):
         super().__init__()
@@ -28,10 +39,17 @@ class ConfigPage(QWidget):
         
         self.icon = icon
 
+        self.custom_matter_watcher = QFileSystemWatcher(self)
+        # editors often write a file several times in a row, wait for them to settle
+        self.custom_matter_changed_timer = QTimer(self)
+        self.custom_matter_changed_timer.setSingleShot(True)
+        self.custom_matter_changed_timer.setInterval(300)
+
         self.initUI()
         self.load_config()
 
         self.connect_signal_and_slot()
+        self.update_custom_matter_watcher()
 
     def initUI(self):
 
@@ -114,6 +132,45 @@ class ConfigPage(QWidget):
         column += 1
         layout.addWidget(self.animation_options, row, column)
 
+        row += 1
+        column = 0
+        self.animation_speed_options = QComboBox()
+        self.animation_speed_options.addItems([f'{speed:g}x' for speed in ANIMATION_SPEEDS])
+        self.animation_speed_options.setCurrentIndex(ANIMATION_SPEEDS.index(1.0))
+        self.animation_speed_options.setToolTip('How fast the transition highlights are played, Esc skips the one playing')
+        layout.addWidget(QLabel('Animation Speed'), row, column)
+        column += 1
+        layout.addWidget(self.animation_speed_options, row, column)
+
+        row += 1
+        column = 0
+        self.trigger_queue_options = QComboBox()
+        self.trigger_queue_options.addItems([policy.capitalized_name for policy in TriggerPolicy])
+        self.trigger_queue_options.setToolTip('What to do with a new trigger when the trigger queue is full: '
+                                              'wait for a free slot, drop it, or merge it into the same trigger still waiting')
+        layout.addWidget(QLabel('Full Trigger Queue'), row, column)
+        column += 1
+        layout.addWidget(self.trigger_queue_options, row, column)
+
+        row += 1
+        column = 0
+        self.callback_thread_options = QComboBox()
+        self.callback_thread_options.addItems(['GUI Thread', 'Worker Thread'])
+        self.callback_thread_options.setToolTip('Run the triggers and the custom matter callbacks in a worker thread, so a slow one does not freeze the UI')
+        layout.addWidget(QLabel('Run Callbacks In'), row, column)
+        column += 1
+        layout.addWidget(self.callback_thread_options, row, column)
+
+        row += 1
+        column = 0
+        self.machine_backend_options = QComboBox()
+        self.machine_backend_options.addItems(['Graph', 'Nested'])
+        self.machine_backend_options.setToolTip('Nested runs the triggers without the graph bookkeeping of the transitions library, faster on big machines. '
+                                                'The graph is then built only when asked for. Takes effect on the next reload')
+        layout.addWidget(QLabel('Machine Backend'), row, column)
+        column += 1
+        layout.addWidget(self.machine_backend_options, row, column)
+
         row += 1
         column = 0
 
@@ -131,6 +188,22 @@ class ConfigPage(QWidget):
         column += 1
         layout.addWidget(default_gate_widget, row, column)
 
+        row += 1
+        column = 0
+        self.watch_custom_matter_checkbox = QCheckBox("Watch the custom matter file")
+        self.watch_custom_matter_checkbox.setToolTip('Reload the custom matter when its file is saved, the machine and its current state are kept')
+        layout.addWidget(QLabel('Hot Reload'), row, column)
+        column += 1
+        layout.addWidget(self.watch_custom_matter_checkbox, row, column)
+
+        row += 1
+        column = 0
+        self.fast_start_checkbox = QCheckBox("Show the window first, load the machine afterwards")
+        self.fast_start_checkbox.setToolTip('The config is read in the background and the panels are filled one after the other, takes effect on the next start')
+        layout.addWidget(QLabel('Fast Start'), row, column)
+        column += 1
+        layout.addWidget(self.fast_start_checkbox, row, column)
+
         row += 1
         column = 0
         self.theme_options = QComboBox()
@@ -145,6 +218,28 @@ class ConfigPage(QWidget):
 
         # self.resize(700, 150)
 
+    def get_module_full_path(self, module_dir):
+        if getattr(sys, 'frozen', False):
+            print(f'frozen env={sys._MEIPASS}')
+            base_path = os.getcwd()
+            # print(f'base_path={base_path}, module_dir={module_dir}')
+            return os.path.join(base_path, module_dir)
+            # base_path = sys._MEIPASS
+            # module_full_path = os.path.join(base_path, module_dir)
+        else:
+            print(f'non frozen env')
+            # 如果是直接运行 Python 脚本
+            return os.path.abspath(module_dir)
+
+    def get_custom_matter_file(self):
+        if not self.enable_custom_matter.isChecked() or len(self.custom_matter_input.text()) == 0:
+            return None
+        module_dir = os.path.dirname(self.custom_matter_input.text())
+        module_path_name = os.path.basename(self.custom_matter_input.text())
+        if module_dir:
+            return os.path.join(self.get_module_full_path(module_dir), module_path_name)
+        return os.path.abspath(module_path_name)
+
     def get_matter_lib(self, reload_module=True):
         lib = None
         if self.enable_custom_matter.isChecked() and len(self.custom_matter_input.text()) > 0:
@@ -158,19 +253,10 @@ class ConfigPage(QWidget):
             module_dir = os.path.dirname(self.custom_matter_input.text())
             if module_dir:
                 print(f'module_dir={module_dir}')
-                # 将模块所在的目录添加到 sys.path 中
-                if getattr(sys, 'frozen', False):
-                    print(f'frozen env={sys._MEIPASS}')
-                    base_path = os.getcwd()
-                    # print(f'base_path={base_path}, module_dir={module_dir}')
-                    module_full_path = os.path.join(base_path, module_dir)
-                    # base_path = sys._MEIPASS
-                    # module_full_path = os.path.join(base_path, module_dir)
-                else:
-                    print(f'non frozen env')
-                    # 如果是直接运行 Python 脚本
-                    module_full_path = os.path.abspath(module_dir)
-                sys.path.append(module_full_path)
+                # 将模块所在的目录添加到 sys.path 中, only once so reloading does not keep growing it
+                module_full_path = self.get_module_full_path(module_dir)
+                if module_full_path not in sys.path:
+                    sys.path.append(module_full_path)
 
             try:
                 # 导入模块
@@ -193,6 +279,7 @@ class ConfigPage(QWidget):
         self.config_has_been_changed = True
 
         self.save_config()
+        self.update_custom_matter_watcher()
 
     def input_text_changed_slot(self):
         self.config_has_been_changed = True
@@ -200,6 +287,32 @@ class ConfigPage(QWidget):
     def custom_matter_input_text_changed_slot(self):
         self.config_has_been_changed = True
         self.save_config()
+        self.update_custom_matter_watcher()
+
+    def watch_custom_matter_changed_slot(self, state):
+        self.save_config()
+        self.update_custom_matter_watcher()
+
+    def update_custom_matter_watcher(self):
+        watched_files = self.custom_matter_watcher.files()
+        if watched_files:
+            self.custom_matter_watcher.removePaths(watched_files)
+
+        if not self.watch_custom_matter_checkbox.isChecked():
+            return
+        file_path = self.get_custom_matter_file()
+        if file_path is not None and os.path.exists(file_path):
+            self.custom_matter_watcher.addPath(file_path)
+
+    def custom_matter_file_changed_slot(self, file_path):
+        self.custom_matter_changed_timer.start()
+
+    def custom_matter_changed_timeout_slot(self):
+        # a file saved by replacing it drops out of the watcher, watch the new one
+        self.update_custom_matter_watcher()
+        file_path = self.get_custom_matter_file()
+        if file_path is not None and os.path.exists(file_path):
+            self.custom_matter_changed_signal.emit()
 
     def connect_signal_and_slot(self):
         self.main_resource_button.clicked.connect(self.select_main_resource)
@@ -210,8 +323,12 @@ class ConfigPage(QWidget):
         self.custom_matter_button.clicked.connect(self.select_custom_matter)
 
         self.animation_options.currentIndexChanged.connect(lambda enabled=bool(self.animation_options.currentIndex()): self.animation_changed_signal.emit(enabled))
+        self.animation_speed_options.currentIndexChanged.connect(lambda index: self.animation_speed_changed_signal.emit(ANIMATION_SPEEDS[index]))
 
         self.theme_options.currentIndexChanged.connect(self.theme_options_changed)
+        self.trigger_queue_options.currentIndexChanged.connect(self.trigger_queue_options_changed)
+        self.callback_thread_options.currentIndexChanged.connect(lambda index: self.worker_thread_changed_signal.emit(bool(index)))
+        self.machine_backend_options.currentIndexChanged.connect(lambda index: self.machine_backend_changed_signal.emit(MachineBackend(index)))
 
         self.enable_default_enter_checkbox.stateChanged.connect(self.enable_default_gate_checkbox_changed)
         self.enable_default_exit_checkbox.stateChanged.connect(self.enable_default_gate_checkbox_changed)
@@ -222,10 +339,17 @@ class ConfigPage(QWidget):
         self.secondary_resource_input.textChanged.connect(self.input_text_changed_slot)
         self.custom_matter_input.textChanged.connect(self.custom_matter_input_text_changed_slot)
 
+        self.watch_custom_matter_checkbox.stateChanged.connect(self.watch_custom_matter_changed_slot)
+        self.custom_matter_watcher.fileChanged.connect(self.custom_matter_file_changed_slot)
+        self.custom_matter_changed_timer.timeout.connect(self.custom_matter_changed_timeout_slot)
+
 
     def enable_default_gate_checkbox_changed(self, state):
         self.config_has_been_changed = True
 
+    def trigger_queue_options_changed(self, index):
+        self.trigger_queue_policy_changed_signal.emit(TriggerPolicy(index))
+
     def theme_options_changed(self, index):
         theme = Theme(index)
         self.theme_changed_signal.emit(theme)
@@ -293,10 +417,17 @@ class ConfigPage(QWidget):
                 "configs": self.configs,
                 "current_config": current_config_name,
                 "animation_enabled": self.animation_options.currentIndex(),
+                "animation_speed": self.animation_speed_options.currentIndex(),
+                "trigger_queue_policy": self.trigger_queue_options.currentIndex(),
+                "callback_thread": self.callback_thread_options.currentIndex(),
+                "machine_backend": self.machine_backend_options.currentIndex(),
 
                 "enable_default_enter": self.enable_default_enter_checkbox.isChecked(),
                 "enable_default_exit": self.enable_default_exit_checkbox.isChecked(),
 
+                "watch_custom_matter": self.watch_custom_matter_checkbox.isChecked(),
+                "fast_start": self.fast_start_checkbox.isChecked(),
+
                 "current_theme": self.theme_options.currentIndex()
             }
             with open("config.json", "w") as f:
@@ -309,22 +440,48 @@ class ConfigPage(QWidget):
                 self.configs = data.get("configs", {})
                 current_config = data.get("current_config")
                 animation_enabled = data.get("animation_enabled")
+                animation_speed = data.get("animation_speed")
+                trigger_queue_policy = data.get("trigger_queue_policy")
+                callback_thread = data.get("callback_thread")
+                machine_backend = data.get("machine_backend")
 
                 enable_default_enter = data.get("enable_default_enter")
                 enable_default_exit = data.get("enable_default_exit")
 
+                watch_custom_matter = data.get("watch_custom_matter")
+                fast_start = data.get("fast_start")
+
                 current_theme = data.get("current_theme")
 
 
             if animation_enabled:
                 self.animation_options.setCurrentIndex(animation_enabled)
 
+            # 0 is a valid index, the default is 1x
+            if animation_speed is not None:
+                self.animation_speed_options.setCurrentIndex(animation_speed)
+
+            if trigger_queue_policy:
+                self.trigger_queue_options.setCurrentIndex(trigger_queue_policy)
+
+            if callback_thread:
+                self.callback_thread_options.setCurrentIndex(callback_thread)
+
+            if machine_backend:
+                self.machine_backend_options.setCurrentIndex(machine_backend)
+
             if enable_default_enter:
                 self.enable_default_enter_checkbox.setChecked(enable_default_enter)
 
             if enable_default_exit:
                 self.enable_default_exit_checkbox.setChecked(enable_default_exit)
 
+            if watch_custom_matter:
+                self.watch_custom_matter_checkbox.setChecked(watch_custom_matter)
+
+            if fast_start:
+                self.fast_start_checkbox.setChecked(fast_start)
+
             if current_theme:
                 self.theme_options.setCurrentIndex(current_theme)
 
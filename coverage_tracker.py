@@ -0,0 +1,194 @@
+import json
+import math
+import datetime
+from array import array
+from functools import partial
+
+from PyQt5.QtGui import QColor
+
+
+class CoverageTracker:
+    """
+    Counts how often each state of a machine was entered and each (source, trigger, dest) transition
+    was tried and taken during a session, e.g. a replay or a soak run. States and transitions get an
+    ID when the tracker is attached, the callbacks it hangs on the machine only bump array slots.
+    """
+
+    def __init__(self):
+        self.machine = None
+        self.name = None
+        self.started = None
+        # finished sessions, as returned by report()
+        self.sessions = []
+
+        # ID -> full state path, ID -> (source, trigger, dest, conditions)
+        self.state_names = []
+        self.transitions = []
+        self.state_entries = array('Q')
+        self.transition_attempts = array('Q')
+        self.transition_taken = array('Q')
+
+        # (state or transition, callback list attribute, list before the session) to put back
+        self.installed = []
+
+        # bumped whenever a counter moves, so the heat map is only computed again when it changed
+        self.revision = 0
+
+    def is_running(self):
+        return self.machine is not None
+
+    def start_session(self, machine, name=None):
+        self.stop_session()
+        self.machine = machine
+        self.name = name
+        self.started = datetime.datetime.now()
+
+        self.state_names = list(machine.get_nested_state_names())
+        for state_id, state_name in enumerate(self.state_names):
+            self._install(machine.get_state(state_name), 'on_enter', partial(self._entered, state_id))
+
+        self.transitions = []
+        for trigger, event in machine.events.items():
+            for source, transitions in event.transitions.items():
+                for transition in transitions:
+                    transition_id = len(self.transitions)
+                    conditions = tuple(condition.func if condition.target else f'!{condition.func}'
+                                       for condition in transition.conditions)
+                    # an internal transition stays in its source
+                    self.transitions.append((source, trigger, transition.dest or source, conditions))
+                    # prepare runs before the conditions are checked, after once the transition is done
+                    self._install(transition, 'prepare', partial(self._attempted, transition_id))
+                    self._install(transition, 'after', partial(self._taken, transition_id))
+
+        self.state_entries = array('Q', bytes(8 * len(self.state_names)))
+        self.transition_attempts = array('Q', bytes(8 * len(self.transitions)))
+        self.transition_taken = array('Q', bytes(8 * len(self.transitions)))
+        self.revision += 1
+
+    def stop_session(self):
+        # returns the report of the session, None when none was running
+        if self.machine is None:
+            return None
+        for target, attribute, callbacks in self.installed:
+            setattr(target, attribute, callbacks)
+        self.installed = []
+
+        report = self.report()
+        self.sessions.append(report)
+        self.machine = None
+        return report
+
+    def _install(self, target, attribute, callback):
+        # a new list, the machine may share the old one with the states JSON it was built from
+        callbacks = getattr(target, attribute)
+        setattr(target, attribute, callbacks + [callback])
+        self.installed.append((target, attribute, callbacks))
+
+    # the callbacks get the EventData, send_event is on
+    def _entered(self, state_id, event_data):
+        self.state_entries[state_id] += 1
+        self.revision += 1
+
+    def _attempted(self, transition_id, event_data):
+        # attempts are not part of the heat, the revision stays
+        self.transition_attempts[transition_id] += 1
+
+    def _taken(self, transition_id, event_data):
+        self.transition_taken[transition_id] += 1
+        self.revision += 1
+
+    def report(self):
+        states = dict(zip(self.state_names, self.state_entries))
+        transitions = [
+            {'source': source, 'trigger': trigger, 'dest': dest, 'conditions': list(conditions),
+             'attempts': attempts, 'taken': taken}
+            for (source, trigger, dest, conditions), attempts, taken
+            in zip(self.transitions, self.transition_attempts, self.transition_taken)
+        ]
+
+        # a condition shared by several transitions counts for all of them
+        conditions = {}
+        for transition in transitions:
+            for condition in transition['conditions']:
+                entry = conditions.setdefault(condition, {'evaluated': 0, 'passed': 0})
+                entry['evaluated'] += transition['attempts']
+                entry['passed'] += transition['taken']
+
+        return {
+            'name': self.name,
+            'started': self.started.isoformat(timespec='seconds') if self.started else None,
+            'stopped': datetime.datetime.now().isoformat(timespec='seconds'),
+            'states': states,
+            'transitions': transitions,
+            'conditions': conditions,
+            'never_entered': [name for name, count in states.items() if count == 0],
+            'never_taken': [transition for transition in transitions if transition['taken'] == 0],
+            'never_evaluated_conditions': [name for name, entry in conditions.items() if entry['evaluated'] == 0],
+            'never_passed_conditions': [name for name, entry in conditions.items() if entry['evaluated'] and entry['passed'] == 0],
+        }
+
+    def save_sessions(self, file_path):
+        sessions = list(self.sessions)
+        if self.machine is not None:
+            sessions.append(self.report())
+        with open(file_path, 'w') as f:
+            json.dump(sessions, f, indent=4)
+
+    def heat(self):
+        """
+        Returns ({state path: 0..1}, {(source, dest): 0..1}) on a log scale of the counts, None for
+        what was never entered or taken. Transitions between the same states are summed.
+        """
+        state_heat = {}
+        max_entries = max(self.state_entries, default=0)
+        for name, count in zip(self.state_names, self.state_entries):
+            state_heat[name] = scale(count, max_entries)
+
+        taken = {}
+        for (source, trigger, dest, conditions), count in zip(self.transitions, self.transition_taken):
+            taken[(source, dest)] = taken.get((source, dest), 0) + count
+        max_taken = max(taken.values(), default=0)
+        transition_heat = {key: scale(count, max_taken) for key, count in taken.items()}
+        return state_heat, transition_heat
+
+
+def scale(count, maximum):
+    if count == 0:
+        return None
+    return math.log1p(count) / math.log1p(maximum)
+
+
+def heat_color(heat, alpha=255):
+    # blue for rarely, red for the most often, None (never) is gray
+    if heat is None:
+        return QColor(128, 128, 128, alpha)
+    color = QColor()
+    color.setHsvF((1 - heat) * 240 / 360, 0.85, 0.95, alpha / 255)
+    return color
+
+
+def format_report(report, limit=50):
+    lines = []
+    states = report['states']
+    transitions = report['transitions']
+    entered = len(states) - len(report['never_entered'])
+    taken = len(transitions) - len(report['never_taken'])
+    lines.append(f'states entered       {entered}/{len(states)}')
+    lines.append(f'transitions taken    {taken}/{len(transitions)}')
+    lines.append(f'conditions passed    {len(report["conditions"]) - len(report["never_evaluated_conditions"]) - len(report["never_passed_conditions"])}/{len(report["conditions"])}')
+
+    def section(title, items):
+        if not items:
+            return
+        lines.append('')
+        lines.append(f'{title} ({len(items)})')
+        for item in items[:limit]:
+            lines.append(f'  {item}')
+        if len(items) > limit:
+            lines.append(f'  ... {len(items) - limit} more')
+
+    section('never entered', report['never_entered'])
+    section('never taken', [f'{t["source"]} -{t["trigger"]}-> {t["dest"]}  tried {t["attempts"]}' for t in report['never_taken']])
+    section('conditions never evaluated', report['never_evaluated_conditions'])
+    section('conditions never passed', report['never_passed_conditions'])
+    return '\n'.join(lines)
@@ -0,0 +1,99 @@
+import threading
+
+from PyQt5.QtCore import Qt, QObject, QTimer, pyqtSignal
+
+
+class DeferredLoader(QObject):
+    """
+    Runs a list of loading steps one event loop turn at a time, so the window can be shown and
+    painted before the work is done. A step marked background runs in a worker thread and must not
+    touch any widget. Every step gets the result of the step before it.
+    """
+
+    progress_signal = pyqtSignal(int, int, str)
+    finished_signal = pyqtSignal()
+    failed_signal = pyqtSignal(str, object)
+
+    background_done_signal = pyqtSignal(int, object, object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.steps = []
+        self.index = 0
+        self.result = None
+        self.running = False
+        # bumped by cancel(), a background step finishing after it is ignored
+        self.generation = 0
+
+        self.background_done_signal.connect(self.background_done_slot, Qt.QueuedConnection)
+
+    def add_step(self, label, function, background=False):
+        self.steps.append((label, function, background))
+
+    def is_running(self):
+        return self.running
+
+    def start(self):
+        self.index = 0
+        self.result = None
+        self.running = True
+        self.schedule_next()
+
+    def cancel(self):
+        self.generation += 1
+        self.running = False
+        self.steps = []
+
+    def schedule_next(self):
+        if self.index < len(self.steps):
+            label = self.steps[self.index][0]
+            self.progress_signal.emit(self.index, len(self.steps), label)
+        # let the event loop paint the window and the progress first
+        QTimer.singleShot(0, lambda generation=self.generation: self.run_next(generation))
+
+    def run_next(self, generation):
+        if generation != self.generation or not self.running:
+            return
+
+        if self.index >= len(self.steps):
+            self.running = False
+            self.progress_signal.emit(len(self.steps), len(self.steps), '')
+            self.finished_signal.emit()
+            return
+
+        label, function, background = self.steps[self.index]
+        if background:
+            previous_result = self.result
+
+            def run():
+                try:
+                    result, error = function(previous_result), None
+                except Exception as e:
+                    result, error = None, e
+                self.background_done_signal.emit(generation, result, error)
+
+            threading.Thread(target=run, daemon=True).start()
+            return
+
+        try:
+            self.result = function(self.result)
+        except Exception as e:
+            self.fail(label, e)
+            return
+        self.index += 1
+        self.schedule_next()
+
+    def background_done_slot(self, generation, result, error):
+        if generation != self.generation or not self.running:
+            return
+        if error is not None:
+            self.fail(self.steps[self.index][0], error)
+            return
+        self.result = result
+        self.index += 1
+        self.schedule_next()
+
+    def fail(self, label, error):
+        print(f'loading failed at {label}: {error}')
+        self.running = False
+        self.failed_signal.emit(label, error)
@@ -0,0 +1,205 @@
+import sys, os
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from PyQt5.QtGui import QImage, QPainter, QPicture, QIcon
+from PyQt5.QtCore import QSize, QRect
+
+from state_machine_core import resolve_path
+
+
+IMAGE_FORMATS = ['png', 'svg']
+# the graph of the transitions library, as graphviz dot or, without graphviz installed, mermaid
+GRAPH_FORMAT = 'graph'
+
+# the QApplication of a headless process, created on first use
+export_app = None
+
+
+def init_headless_app():
+    global export_app
+    from PyQt5.QtWidgets import QApplication
+
+    export_app = QApplication.instance()
+    if export_app is None:
+        # no window is ever shown, so there is no need for a display
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+        export_app = QApplication(sys.argv[:1])
+    return export_app
+
+
+def diagram_bounds(state_machine):
+    # paint once into a QPicture to get the area actually drawn, text and self transitions included
+    picture = QPicture()
+    painter = QPainter(picture)
+    state_machine.paint_diagram(painter)
+    painter.end()
+    return picture.boundingRect()
+
+
+def render_diagram(state_machine, file_path, scale=1.0, margin=20, background=True):
+    """
+    Renders the diagram of a StateMachineWidget into a PNG or SVG file, picked by the file extension.
+    The widget does not need to be shown, the view of the window (offset, scale) is left untouched.
+    """
+    image_format = os.path.splitext(file_path)[1][1:].lower()
+    if image_format not in IMAGE_FORMATS:
+        raise ValueError(f'Unsupported image format {image_format}, use one of {IMAGE_FORMATS}')
+
+    view = (state_machine.offset_x, state_machine.offset_y, state_machine.scale_factor)
+    try:
+        state_machine.offset_x = 0.0
+        state_machine.offset_y = 0.0
+        state_machine.scale_factor = scale
+
+        bounds = diagram_bounds(state_machine)
+        if bounds.isEmpty():
+            bounds = QRect(0, 0, 1, 1)
+
+        # move the top left corner of the drawing to (margin, margin)
+        state_machine.offset_x = margin - bounds.x()
+        state_machine.offset_y = margin - bounds.y()
+        size = QSize(bounds.width() + margin * 2, bounds.height() + margin * 2)
+
+        if image_format == 'svg':
+            from PyQt5.QtSvg import QSvgGenerator
+
+            device = QSvgGenerator()
+            device.setFileName(file_path)
+            device.setSize(size)
+            device.setViewBox(QRect(0, 0, size.width(), size.height()))
+            device.setTitle(os.path.splitext(os.path.basename(file_path))[0])
+        else:
+            device = QImage(size, QImage.Format_ARGB32)
+            device.fill(0)
+
+        painter = QPainter(device)
+        if background:
+            painter.fillRect(0, 0, size.width(), size.height(), state_machine.background_color)
+        state_machine.paint_diagram(painter)
+        painter.end()
+
+        if image_format == 'png' and not device.save(file_path, 'PNG'):
+            raise IOError(f'Can not write {file_path}')
+    finally:
+        state_machine.offset_x, state_machine.offset_y, state_machine.scale_factor = view
+        # the hit test rects were computed for the image, let the window compute its own again
+        state_machine.update()
+
+    return file_path
+
+
+def export_graph(state_machine, file_path_base, title=None):
+    """
+    Writes the transitions library's graph of the machine, file_path_base gets .dot or .mmd by the
+    graph engine available. The graph is built here, the machine itself may run without one.
+    """
+    graph = state_machine.get_graph(title=title)
+    if graph is None:
+        raise ValueError('No machine loaded')
+
+    extension = '.mmd' if 'mermaid' in type(graph).__module__ else '.dot'
+    file_path = file_path_base + extension
+    with open(file_path, 'w', encoding='utf-8') as f:
+        f.write(graph.source)
+    return file_path
+
+
+def export_config(config_name, config, base_dir, output_dir, image_format='png', scale=1.0, theme=0):
+    # runs in a worker process, everything it gets must be picklable
+    init_headless_app()
+
+    from state_machine_ui import StateMachineWidget
+    from config_page import Theme
+    from state_machine_core import MachineBackend
+
+    state_machine = StateMachineWidget(icon=QIcon())
+    # no trigger runs here, the graph is built only for the graph format
+    state_machine.set_machine_backend(MachineBackend.nested)
+    if Theme(theme) == Theme.black:
+        state_machine.set_black_theme()
+
+    # the custom matter is not loaded, its callbacks do not change the diagram
+    state_machine.load_machine(config_name,
+                               resolve_path(base_dir, config.get('main_resource', '')),
+                               resolve_path(base_dir, config.get('secondary_resource', '')),
+                               False,
+                               False)
+    if not state_machine.states:
+        raise ValueError(f'No state found in {config.get("main_resource")}')
+    # as the app does after a load, compound states are fitted around their children
+    state_machine._adjust_all_states()
+
+    if image_format == GRAPH_FORMAT:
+        file_path = export_graph(state_machine, os.path.join(output_dir, config_name), title=config_name)
+    else:
+        file_path = os.path.join(output_dir, f'{config_name}.{image_format}')
+        render_diagram(state_machine, file_path, scale=scale)
+
+    state_machine.trigger_queue.clear()
+    state_machine.deleteLater()
+    return file_path
+
+
+def export_configs(config_file='config.json', output_dir='diagrams', image_format='png', names=None, scale=1.0, max_workers=None):
+    """
+    Renders the diagram of every config of config.json (or only the ones in names) in parallel
+    processes. Returns {config name: file path or the exception raised for it}.
+    """
+    with open(config_file, 'r') as f:
+        data = json.load(f)
+
+    # relative paths in config.json are relative to the folder the app runs in, which is the config's
+    base_dir = os.path.dirname(os.path.abspath(config_file))
+    configs = data.get('configs', {})
+    theme = data.get('current_theme', 0)
+    if names:
+        missing = [name for name in names if name not in configs]
+        if missing:
+            raise KeyError(f'Config not found: {", ".join(missing)}')
+        configs = {name: configs[name] for name in names}
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    results = {}
+    if not configs:
+        return results
+
+    max_workers = min(max_workers or os.cpu_count() or 1, len(configs))
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {name: executor.submit(export_config, name, config, base_dir, output_dir, image_format, scale, theme)
+                   for name, config in configs.items()}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                results[name] = e
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Render the state machine diagrams of config.json to images without opening a window.')
+    parser.add_argument('names', nargs='*', help='configs to render, all of them when omitted')
+    parser.add_argument('-c', '--config', default='config.json', help='config file, default config.json')
+    parser.add_argument('-o', '--output', default='diagrams', help='output folder, default diagrams')
+    parser.add_argument('-f', '--format', default='png', choices=IMAGE_FORMATS + [GRAPH_FORMAT],
+                        help='image format, default png. graph writes the graph source of the transitions library instead')
+    parser.add_argument('-s', '--scale', type=float, default=1.0, help='scale of the diagram, default 1.0')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='number of processes, default one per CPU')
+    args = parser.parse_args(argv)
+
+    results = export_configs(args.config, args.output, args.format, args.names, args.scale, args.jobs)
+
+    failed = 0
+    for name, result in results.items():
+        if isinstance(result, Exception):
+            failed += 1
+            print(f'{name}: failed, {result}')
+        else:
+            print(f'{name}: {result}')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,280 @@
+import re
+import threading
+from collections import namedtuple
+
+from PyQt5.QtCore import Qt, QObject, QSortFilterProxyModel, QModelIndex, QTimer, pyqtSignal
+
+
+# paths[i] is the tuple of rows from the root to the item, parents[i] the position of its parent
+# (or -1) and texts[i] the display text of each column. Parents always come before their children.
+FilterSnapshot = namedtuple('FilterSnapshot', ['paths', 'parents', 'texts'])
+
+
+def wildcard_to_regex(text):
+    # '*' matches any sequence, '?' matches a single character, everything else is literal
+    parts = []
+    for char in text:
+        if char == '*':
+            parts.append('.*')
+        elif char == '?':
+            parts.append('.')
+        else:
+            parts.append(re.escape(char))
+    return ''.join(parts)
+
+
+def compile_filter_pattern(text, regex=False, case_sensitivity=Qt.CaseInsensitive):
+    if not text:
+        return None
+
+    flags = 0 if case_sensitivity == Qt.CaseSensitive else re.IGNORECASE
+    if regex:
+        try:
+            return re.compile(text, flags)
+        except re.error:
+            # an unfinished regex falls back to the wildcard search
+            pass
+    return re.compile(wildcard_to_regex(text), flags)
+
+
+def build_filter_snapshot(model):
+    paths = []
+    parents = []
+    texts = []
+
+    stack = [(QModelIndex(), (), -1)]
+    while stack:
+        parent_index, parent_path, parent_position = stack.pop()
+        columns = model.columnCount(parent_index)
+        for row in range(model.rowCount(parent_index)):
+            row_texts = []
+            for column in range(columns):
+                text = model.data(model.index(row, column, parent_index), Qt.DisplayRole)
+                if text is not None:
+                    row_texts.append(str(text))
+
+            path = parent_path + (row,)
+            position = len(paths)
+            paths.append(path)
+            parents.append(parent_position)
+            texts.append(tuple(row_texts))
+
+            index = model.index(row, 0, parent_index)
+            if model.hasChildren(index):
+                stack.append((index, path, position))
+
+    return FilterSnapshot(paths, parents, texts)
+
+
+def match_filter_snapshot(snapshot, pattern, is_cancelled=None):
+    search = pattern.search
+    count = len(snapshot.paths)
+    accepted = bytearray(count)
+
+    for position, row_texts in enumerate(snapshot.texts):
+        if is_cancelled is not None and position & 0x3ff == 0 and is_cancelled():
+            return None
+        for text in row_texts:
+            if search(text):
+                accepted[position] = 1
+                break
+
+    # a parent is accepted as soon as one of its descendants is
+    parents = snapshot.parents
+    for position in range(count - 1, -1, -1):
+        if accepted[position] and parents[position] >= 0:
+            accepted[parents[position]] = 1
+
+    paths = snapshot.paths
+    return {paths[position] for position in range(count) if accepted[position]}
+
+
+class RecursiveFilterProxyModel(QSortFilterProxyModel):
+    """
+    Accepts a row when any of its cells or any of its descendants matches the filter.
+    The pattern is compiled once per filter change and the result of every subtree is
+    memoized, so each source item is matched at most once per filter.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pattern = None
+        self.accepted_cache = {}
+        self.accepted_paths = None
+        self.snapshot = None
+
+    def setSourceModel(self, source_model):
+        old_model = self.sourceModel()
+        if old_model is not None:
+            for signal in self._source_change_signals(old_model):
+                try:
+                    signal.disconnect(self.source_changed_slot)
+                except TypeError:
+                    pass
+            try:
+                old_model.rowsAboutToBeInserted.disconnect(self.rows_about_to_be_inserted_slot)
+            except TypeError:
+                pass
+
+        # connect before the base class does, so the cache is dropped before the proxy re-filters
+        if source_model is not None:
+            for signal in self._source_change_signals(source_model):
+                signal.connect(self.source_changed_slot)
+            source_model.rowsAboutToBeInserted.connect(self.rows_about_to_be_inserted_slot)
+
+        self.source_changed_slot()
+        super().setSourceModel(source_model)
+
+    @staticmethod
+    def _source_change_signals(model):
+        return [model.dataChanged,
+                model.rowsAboutToBeRemoved,
+                model.rowsAboutToBeMoved,
+                model.layoutAboutToBeChanged,
+                model.modelAboutToBeReset]
+
+    def clear_cache(self, *args):
+        self.accepted_cache.clear()
+
+    def source_changed_slot(self, *args):
+        # a precomputed result no longer matches the source, fall back to matching on demand
+        self.clear_cache()
+        self.accepted_paths = None
+        self.snapshot = None
+
+    def rows_about_to_be_inserted_slot(self, parent, first, last):
+        self.clear_cache()
+        self.snapshot = None
+        # appended rows (e.g. a lazily fetched branch) leave the paths of existing rows untouched
+        if first < self.sourceModel().rowCount(parent):
+            self.accepted_paths = None
+
+    def filter_snapshot(self):
+        source_model = self.sourceModel()
+        build_snapshot = getattr(source_model, 'filter_snapshot', None)
+        if build_snapshot is not None:
+            # the model keeps its own snapshot up to date
+            self.snapshot = build_snapshot()
+        elif self.snapshot is None:
+            self.snapshot = build_filter_snapshot(source_model)
+        return self.snapshot
+
+    def set_filter_text(self, text, regex=False):
+        self.apply_filter_result(compile_filter_pattern(text, regex, self.filterCaseSensitivity()))
+
+    def apply_filter_result(self, pattern, accepted_paths=None):
+        self.pattern = pattern
+        self.accepted_paths = accepted_paths
+        self.clear_cache()
+        # invalidateFilter() removes the filtered rows range by range, which is quadratic on big
+        # trees; re-mapping the whole proxy in one layout change is much cheaper
+        self.invalidate()
+
+    def filterAcceptsRow(self, source_row: int, source_parent: QModelIndex) -> bool:
+        if self.pattern is None:
+            return True
+        if self.accepted_paths is not None:
+            return self.source_path(source_row, source_parent) in self.accepted_paths
+        return self.subtree_matches(source_row, source_parent)
+
+    def source_path(self, source_row, source_parent):
+        path = [source_row]
+        index = source_parent
+        while index.isValid():
+            path.append(index.row())
+            index = index.parent()
+        path.reverse()
+        return tuple(path)
+
+    def subtree_matches(self, source_row, source_parent):
+        model = self.sourceModel()
+        index = model.index(source_row, 0, source_parent)
+        key = (index.internalId(), source_row)
+
+        accepted = self.accepted_cache.get(key)
+        if accepted is not None:
+            return accepted
+
+        accepted = self.row_matches(source_row, source_parent)
+        if not accepted:
+            for row in range(model.rowCount(index)):
+                if self.subtree_matches(row, index):
+                    accepted = True
+                    break
+
+        self.accepted_cache[key] = accepted
+        return accepted
+
+    def row_matches(self, source_row, source_parent):
+        model = self.sourceModel()
+        search = self.pattern.search
+        for column in range(model.columnCount(source_parent)):
+            text = model.data(model.index(source_row, column, source_parent), Qt.DisplayRole)
+            if text is not None and search(str(text)):
+                return True
+        return False
+
+
+class DebouncedFilter(QObject):
+    """
+    Waits until typing pauses, matches the filter against a snapshot of the source model in a
+    worker thread and hands the accepted rows to the proxy in one go. A newer request cancels
+    the one still running.
+    """
+
+    filter_applied = pyqtSignal(str)
+    result_ready_signal = pyqtSignal(int, str, object, object)
+
+    def __init__(self, proxy_model, delay=150, parent=None):
+        super().__init__(parent)
+        self.proxy_model = proxy_model
+
+        self.generation = 0
+        self.pending_text = ''
+        self.pending_regex = False
+        self.running_snapshot = None
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(delay)
+        self.timer.timeout.connect(self.start_filtering)
+
+        self.result_ready_signal.connect(self.apply_result_slot, Qt.QueuedConnection)
+
+    def request(self, text, regex=False):
+        self.generation += 1
+        self.pending_text = text
+        self.pending_regex = regex
+        self.timer.start()
+
+    def start_filtering(self):
+        self.generation += 1
+        generation = self.generation
+        text = self.pending_text
+
+        pattern = compile_filter_pattern(text, self.pending_regex, self.proxy_model.filterCaseSensitivity())
+        if pattern is None:
+            self.apply_result_slot(generation, text, None, None)
+            return
+
+        snapshot = self.proxy_model.filter_snapshot()
+        self.running_snapshot = snapshot
+
+        def run():
+            accepted_paths = match_filter_snapshot(snapshot, pattern, lambda: self.generation != generation)
+            if accepted_paths is not None:
+                self.result_ready_signal.emit(generation, text, pattern, accepted_paths)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def apply_result_slot(self, generation, text, pattern, accepted_paths):
+        if generation != self.generation:
+            return
+
+        if pattern is not None and self.proxy_model.filter_snapshot() is not self.running_snapshot:
+            # the source model changed while matching, start over on a fresh snapshot
+            self.start_filtering()
+            return
+
+        self.proxy_model.apply_filter_result(pattern, accepted_paths)
+        self.filter_applied.emit(text)
@@ -0,0 +1,455 @@
+import json
+
+from PyQt5.QtCore import Qt, QAbstractItemModel, QModelIndex, pyqtSignal
+
+from filter_proxy_model import FilterSnapshot
+
+
+READ_ONLY_VALUE_KEYS = ['children', 'on_enter', 'on_exit']
+
+# rows created per fetchMore(), the view asks for more while it scrolls
+FETCH_BATCH_SIZE = 256
+
+
+def is_container(value):
+    return isinstance(value, (dict, list))
+
+
+def json_entries(value):
+    if isinstance(value, dict):
+        return value.items()
+    return ((f'[{index}]', child) for index, child in enumerate(value))
+
+
+def is_list_key(text):
+    return text.startswith('[') and text.endswith(']') and text[1:-1].isdigit()
+
+
+def text_to_json_value(text, old_value):
+    # an edited cell keeps the type the document had, if the new text still fits it
+    if isinstance(old_value, bool):
+        if text.lower() in ('true', 'false'):
+            return text.lower() == 'true'
+    elif isinstance(old_value, int):
+        try:
+            return int(text)
+        except ValueError:
+            pass
+    elif isinstance(old_value, float):
+        try:
+            return float(text)
+        except ValueError:
+            pass
+    elif old_value is None and text == 'None':
+        return None
+    return text
+
+
+def item_to_json_value(value_item):
+    # the viewer adds new containers (children, on_enter, ...) as an empty read only value
+    if value_item.text() == '' and not value_item.flags() & Qt.ItemIsEditable:
+        return []
+    return value_item.text()
+
+
+class JsonTreeItem:
+    """
+    One cell of the JSON tree. It mimics the part of the QStandardItem API the viewer uses,
+    children hang off the key item (column 0) as [key_item, value_item] rows.
+    """
+
+    def __init__(self, text=''):
+        self._text = text
+        self._flags = Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsEditable
+        self.model = None
+        self.parent_item = None
+        self.row_number = 0
+        self.column_number = 0
+        self.rows = []
+        # the JSON container whose rows have not all been created yet
+        self.pending = None
+        self.pending_entries = None
+
+    def text(self):
+        return self._text
+
+    def setText(self, text):
+        if text == self._text:
+            return
+        self._text = text
+        if self.model is not None:
+            self.model.item_changed(self)
+
+    def flags(self):
+        return self._flags
+
+    def setFlags(self, flags):
+        self._flags = flags
+        if self.model is not None:
+            self.model.item_flags_changed(self)
+
+    def parent(self):
+        # like QStandardItem, top level items have no parent
+        if self.parent_item is None or self.parent_item.parent_item is None:
+            return None
+        return self.parent_item
+
+    def row(self):
+        return self.row_number
+
+    def column(self):
+        return self.column_number
+
+    def rowCount(self):
+        self.fetch()
+        return len(self.rows)
+
+    def child(self, row, column=0):
+        self.fetch()
+        if 0 <= row < len(self.rows):
+            return self.rows[row][column]
+        return None
+
+    def appendRow(self, items):
+        self.fetch()
+        if self.model is not None:
+            self.model.append_row(self, items)
+        else:
+            self.attach_row(items)
+
+    def removeRow(self, row):
+        self.fetch()
+        if self.model is not None:
+            self.model.remove_row(self, row)
+        else:
+            self.detach_row(row)
+
+    def fetch(self):
+        if self.pending is None:
+            return
+        if self.model is not None:
+            self.model.fetch_item(self)
+        else:
+            self.attach_rows(create_rows(self.unfetched_entries()))
+            self.set_pending(None)
+
+    def set_pending(self, container):
+        self.pending = container
+        self.pending_entries = None
+
+    def unfetched_entries(self, count=None):
+        if self.pending_entries is None:
+            self.pending_entries = list(json_entries(self.pending))
+        start = len(self.rows)
+        if count is None:
+            return self.pending_entries[start:]
+        return self.pending_entries[start:start + count]
+
+    def attach_row(self, items):
+        row = len(self.rows)
+        for column, item in enumerate(items):
+            item.parent_item = self
+            item.row_number = row
+            item.column_number = column
+            item.set_model(self.model)
+        self.rows.append(list(items))
+
+    def attach_rows(self, rows):
+        for items in rows:
+            self.attach_row(items)
+
+    def detach_row(self, row):
+        for item in self.rows.pop(row):
+            item.parent_item = None
+            item.set_model(None)
+        for row_number in range(row, len(self.rows)):
+            for item in self.rows[row_number]:
+                item.row_number = row_number
+
+    def set_model(self, model):
+        self.model = model
+        for items in self.rows:
+            for item in items:
+                item.set_model(model)
+
+
+def create_rows(entries):
+    rows = []
+    for key, value in entries:
+        key_item = JsonTreeItem(str(key))
+        key_item.setFlags(key_item.flags() & ~Qt.ItemIsEditable)
+
+        if is_container(value):
+            value_item = JsonTreeItem()
+            value_item.setFlags(value_item.flags() & ~Qt.ItemIsEditable)
+            if len(value) > 0:
+                key_item.set_pending(value)
+        else:
+            value_item = JsonTreeItem(str(value))
+            if key_item.text() in READ_ONLY_VALUE_KEYS:
+                value_item.setFlags(value_item.flags() & ~Qt.ItemIsEditable)
+
+        rows.append([key_item, value_item])
+    return rows
+
+
+class JsonTreeModel(QAbstractItemModel):
+    """
+    Two column (Key, Value) tree over a JSON document. Rows of a branch are only created when
+    the view fetches it, so opening a big definition costs nothing until it is expanded.
+    Every edit is written through to `document`, which can be saved as it is.
+    """
+
+    itemChanged = pyqtSignal(object)
+
+    HEADER = ['Key', 'Value']
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.root_item = JsonTreeItem()
+        self.root_item.model = self
+        self.document = None
+
+        # bumped on every edit, so the filter snapshot knows when it is stale
+        self.revision = 0
+        self.snapshot = None
+        self.snapshot_revision = None
+
+    def set_json_data(self, json_data):
+        self.beginResetModel()
+        self.root_item = JsonTreeItem()
+        self.root_item.model = self
+        # edits must not leak into the caller's data, so the model works on its own copy
+        self.document = json.loads(json.dumps(json_data)) if json_data is not None else None
+        if is_container(self.document) and len(self.document) > 0:
+            self.root_item.set_pending(self.document)
+        self.revision += 1
+        self.endResetModel()
+
+    def invisibleRootItem(self):
+        return self.root_item
+
+    def itemFromIndex(self, index):
+        if not index.isValid():
+            return None
+        return index.internalPointer()
+
+    def indexFromItem(self, item):
+        if item is None or item is self.root_item or item.parent_item is None:
+            return QModelIndex()
+        return self.createIndex(item.row_number, item.column_number, item)
+
+    def _item(self, index):
+        if index.isValid():
+            return index.internalPointer()
+        return self.root_item
+
+    def index(self, row, column, parent=QModelIndex()):
+        parent_item = self._item(parent)
+        if 0 <= row < len(parent_item.rows) and 0 <= column < len(self.HEADER):
+            return self.createIndex(row, column, parent_item.rows[row][column])
+        return QModelIndex()
+
+    def parent(self, index=None):
+        if index is None:
+            return super().parent()
+        if not index.isValid():
+            return QModelIndex()
+        parent_item = index.internalPointer().parent_item
+        if parent_item is None or parent_item is self.root_item:
+            return QModelIndex()
+        return self.createIndex(parent_item.row_number, 0, parent_item)
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.column() > 0:
+            return 0
+        return len(self._item(parent).rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return len(self.HEADER)
+
+    def hasChildren(self, parent=QModelIndex()):
+        if parent.column() > 0:
+            return False
+        item = self._item(parent)
+        return len(item.rows) > 0 or item.pending is not None
+
+    def canFetchMore(self, parent):
+        if parent.column() > 0:
+            return False
+        return self._item(parent).pending is not None
+
+    def fetchMore(self, parent):
+        if parent.column() > 0:
+            return
+        self.fetch_item(self._item(parent), FETCH_BATCH_SIZE)
+
+    def fetch_item(self, item, count=None):
+        if item.pending is None:
+            return
+
+        entries = item.unfetched_entries(count)
+        if len(item.rows) + len(entries) >= len(item.pending_entries):
+            item.set_pending(None)
+
+        rows = create_rows(entries)
+        if len(rows) == 0:
+            return
+        first = len(item.rows)
+        self.beginInsertRows(self.indexFromItem(item), first, first + len(rows) - 1)
+        item.attach_rows(rows)
+        self.endInsertRows()
+
+    def fetch_paths(self, paths):
+        # creates the rows along the given paths, e.g. so filter matches in unfetched branches show up
+        for path in sorted(paths):
+            item = self.root_item
+            for row in path:
+                if row >= len(item.rows):
+                    self.fetch_item(item, max(row + 1 - len(item.rows), FETCH_BATCH_SIZE))
+                if row >= len(item.rows):
+                    break
+                item = item.rows[row][0]
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.DisplayRole or role == Qt.EditRole:
+            return index.internalPointer().text()
+        return None
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if not index.isValid() or role != Qt.EditRole:
+            return False
+        index.internalPointer().setText(str(value))
+        return True
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        return index.internalPointer().flags()
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation != Qt.Horizontal:
+            return None
+        if role == Qt.DisplayRole:
+            return self.HEADER[section]
+        if role == Qt.TextAlignmentRole:
+            return Qt.AlignHCenter | Qt.AlignVCenter
+        return None
+
+    def json_value(self, item):
+        if item is None or item is self.root_item:
+            return self.document
+        container = self.json_value(item.parent_item)
+        return container[self.json_key(item, container)]
+
+    def json_key(self, item, container):
+        if isinstance(container, list):
+            return item.row_number
+        return item.parent_item.rows[item.row_number][0].text()
+
+    def set_json_value(self, item, value):
+        if item is None or item is self.root_item:
+            self.document = value
+            return
+        container = self.json_value(item.parent_item)
+        container[self.json_key(item, container)] = value
+
+    def write_value(self, value_item):
+        old_value = self.json_value(value_item)
+        if is_container(old_value):
+            # containers show an empty value, there is nothing to write
+            return
+        self.set_json_value(value_item, text_to_json_value(value_item.text(), old_value))
+
+    def item_changed(self, item):
+        if item.column_number == 1:
+            self.write_value(item)
+        self.revision += 1
+        index = self.indexFromItem(item)
+        self.dataChanged.emit(index, index)
+        self.itemChanged.emit(item)
+
+    def item_flags_changed(self, item):
+        index = self.indexFromItem(item)
+        self.dataChanged.emit(index, index)
+
+    def append_row(self, parent_item, items):
+        key_text = items[0].text()
+        container = self.json_value(parent_item)
+        if not is_container(container):
+            # a plain value (e.g. a state given by its name) turns into a container
+            container = [] if is_list_key(key_text) else {}
+            self.set_json_value(parent_item, container)
+        value = item_to_json_value(items[1])
+        if isinstance(container, list):
+            container.append(value)
+        else:
+            container[key_text] = value
+
+        row = len(parent_item.rows)
+        self.beginInsertRows(self.indexFromItem(parent_item), row, row)
+        parent_item.attach_row(items)
+        self.revision += 1
+        self.endInsertRows()
+
+    def remove_row(self, parent_item, row):
+        if not 0 <= row < len(parent_item.rows):
+            return
+        container = self.json_value(parent_item)
+        if isinstance(container, list):
+            del container[row]
+        else:
+            del container[parent_item.rows[row][0].text()]
+
+        self.beginRemoveRows(self.indexFromItem(parent_item), row, row)
+        parent_item.detach_row(row)
+        self.revision += 1
+        self.endRemoveRows()
+
+    def filter_snapshot(self):
+        if self.snapshot is not None and self.snapshot_revision == self.revision:
+            return self.snapshot
+
+        paths = []
+        parents = []
+        texts = []
+
+        # rows which were not fetched yet are read straight from the JSON document
+        stack = [(self.root_item, None, (), -1)]
+        while stack:
+            item, entries, parent_path, parent_position = stack.pop()
+
+            first_raw_row = 0
+            if item is not None:
+                for row, (key_item, value_item) in enumerate(item.rows):
+                    path = parent_path + (row,)
+                    position = len(paths)
+                    paths.append(path)
+                    parents.append(parent_position)
+                    value_text = value_item.text()
+                    texts.append((key_item.text(), value_text) if value_text else (key_item.text(),))
+                    if key_item.rows or key_item.pending is not None:
+                        stack.append((key_item, None, path, position))
+
+                if item.pending is None:
+                    continue
+                first_raw_row = len(item.rows)
+                entries = item.unfetched_entries()
+
+            for row, (key, value) in enumerate(entries, first_raw_row):
+                path = parent_path + (row,)
+                position = len(paths)
+                paths.append(path)
+                parents.append(parent_position)
+                if is_container(value):
+                    texts.append((str(key),))
+                    if len(value) > 0:
+                        stack.append((None, json_entries(value), path, position))
+                else:
+                    texts.append((str(key), str(value)))
+
+        self.snapshot = FilterSnapshot(paths, parents, texts)
+        self.snapshot_revision = self.revision
+        return self.snapshot
@@ -0,0 +1,221 @@
+"""
+Snapshot of a running machine: the (nested) state of the model, its own attributes, the timeouts
+still pending and the allowed flags of the conditions. Written as a small header followed by
+JSON, compressed when it is worth it:
+
+    magic 4s | version H | flags H | payload length I | payload crc32 I | payload
+
+Only plain data goes in: attributes JSON can not hold are left out when saving, and a file whose
+content does not have the expected keys and types is rejected when loading.
+"""
+import json
+import time
+import zlib
+import struct
+import hashlib
+import datetime
+
+from transitions.core import EventData
+
+from timeout_scheduler import get_timeout_scheduler
+
+
+MAGIC = b'SMSN'
+# version 1 was a pickle, it is not read any more
+VERSION = 2
+HEADER = struct.Struct('<4sHHII')
+
+FLAG_ZLIB = 1
+# smaller payloads are not worth compressing
+COMPRESS_ABOVE = 256
+
+
+SNAPSHOT_KEYS = ('version', 'time', 'config_name', 'signature', 'state', 'attributes', 'timeouts', 'conditions_allowed')
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def definition_signature(json_states, json_transitions):
+    # a snapshot only fits the machine it was taken from
+    text = json.dumps([json_states, json_transitions], sort_keys=True, default=str)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def is_plain(value):
+    # what comes back from JSON as it went in: no tuples, no keys other than strings
+    stack = [value]
+    while stack:
+        value = stack.pop()
+        if value is None or isinstance(value, (bool, int, float, str)):
+            continue
+        if isinstance(value, list):
+            stack.extend(value)
+        elif isinstance(value, dict):
+            if not all(isinstance(key, str) for key in value):
+                return False
+            stack.extend(value.values())
+        else:
+            return False
+    return True
+
+
+def is_state(value):
+    # a state name, or a list of them (nested lists too) for parallel states
+    if isinstance(value, str):
+        return True
+    return isinstance(value, list) and len(value) > 0 and all(is_state(item) for item in value)
+
+
+def capture_attributes(model, state_attribute='state'):
+    # what the model holds itself, the methods transitions put on it are built again by the machine
+    attributes = {}
+    for name, value in vars(model).items():
+        if name == state_attribute or callable(value):
+            continue
+        if not is_plain(value):
+            print(f'snapshot skips the attribute {name}: {type(value).__name__} is not plain data')
+            continue
+        attributes[name] = value
+    return attributes
+
+
+def restore_attributes(model, attributes):
+    for name, value in attributes.items():
+        setattr(model, name, value)
+
+
+def capture_timeouts(machine, model):
+    # [[state name, seconds left]] of the timeouts scheduled for the model
+    timeouts = []
+    now = time.monotonic()
+    for state_name in machine.get_nested_state_names():
+        runner = getattr(machine.get_state(state_name), 'runner', None)
+        entry = runner.get(id(model)) if runner else None
+        if entry is not None and not entry[4]:
+            timeouts.append([state_name, max(0.0, entry[0] - now)])
+    return timeouts
+
+
+def cancel_timeouts(machine, model):
+    scheduler = get_timeout_scheduler()
+    for state_name in machine.get_nested_state_names():
+        runner = getattr(machine.get_state(state_name), 'runner', None)
+        entry = runner.pop(id(model), None) if runner else None
+        if entry is not None:
+            scheduler.cancel(entry)
+
+
+def restore_timeouts(machine, model, timeouts):
+    # scheduled the way ScheduledTimeout.enter() does, with what was left of them
+    scheduler = get_timeout_scheduler()
+    for state_name, remaining in timeouts:
+        state = machine.get_state(state_name)
+        if not hasattr(state, 'runner'):
+            continue
+        event_data = EventData(state, None, machine, model, args=(), kwargs={})
+        state.runner[id(model)] = scheduler.schedule(remaining, state._process_timeout, event_data)
+
+
+def capture(machine, model, conditions_allowed=None, signature=None, config_name=None):
+    if not is_state(model.state):
+        raise SnapshotError(f'The state {model.state!r} can not be saved')
+    return {
+        'version': VERSION,
+        'time': datetime.datetime.now().isoformat(timespec='seconds'),
+        'config_name': config_name,
+        'signature': signature,
+        'state': model.state,
+        'attributes': capture_attributes(model),
+        'timeouts': capture_timeouts(machine, model),
+        'conditions_allowed': dict(conditions_allowed or {}),
+    }
+
+
+def restore(machine, model, snapshot):
+    """
+    Puts the model back to the snapshot: its timeouts are replaced by the ones of the snapshot, no
+    enter or exit callback runs. The conditions_allowed of the snapshot are left to the caller.
+    """
+    cancel_timeouts(machine, model)
+    machine.set_state(snapshot['state'], model=model)
+    restore_attributes(model, snapshot['attributes'])
+    restore_timeouts(machine, model, snapshot['timeouts'])
+
+
+def check(snapshot):
+    # the keys and types restore() and its callers rely on, raises SnapshotError
+    def fail(what):
+        raise SnapshotError(f'The snapshot is invalid: {what}')
+
+    if not isinstance(snapshot, dict):
+        fail('not an object')
+    missing = [key for key in SNAPSHOT_KEYS if key not in snapshot]
+    if missing:
+        fail(f'{", ".join(missing)} missing')
+    if snapshot['version'] != VERSION:
+        fail(f'version {snapshot["version"]!r}')
+    for key in ('time', 'config_name', 'signature'):
+        if snapshot[key] is not None and not isinstance(snapshot[key], str):
+            fail(f'{key} is not a string')
+    if not is_state(snapshot['state']):
+        fail(f'state {snapshot["state"]!r}')
+    if not isinstance(snapshot['attributes'], dict) or not is_plain(snapshot['attributes']):
+        fail('attributes are not plain data')
+    timeouts = snapshot['timeouts']
+    if not isinstance(timeouts, list) or not all(
+            isinstance(timeout, list) and len(timeout) == 2 and isinstance(timeout[0], str)
+            and isinstance(timeout[1], (int, float)) and not isinstance(timeout[1], bool) and timeout[1] >= 0
+            for timeout in timeouts):
+        fail('timeouts are not [state name, seconds left] pairs')
+    conditions_allowed = snapshot['conditions_allowed']
+    if not isinstance(conditions_allowed, dict) or not all(allowed in ('Yes', 'No') for allowed in conditions_allowed.values()):
+        fail('conditions_allowed is not a mapping of condition to Yes/No')
+    return snapshot
+
+
+def dumps(snapshot):
+    check(snapshot)
+    try:
+        payload = json.dumps(snapshot, allow_nan=False).encode('utf-8')
+    except ValueError as e:
+        raise SnapshotError(f'The snapshot can not be saved: {e}')
+    flags = 0
+    if len(payload) > COMPRESS_ABOVE:
+        payload = zlib.compress(payload, 1)
+        flags |= FLAG_ZLIB
+    return HEADER.pack(MAGIC, VERSION, flags, len(payload), zlib.crc32(payload)) + payload
+
+
+def loads(data):
+    if len(data) < HEADER.size:
+        raise SnapshotError('Not a snapshot, the file is too short')
+    magic, version, flags, length, crc = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise SnapshotError('Not a snapshot')
+    if version != VERSION:
+        raise SnapshotError(f'Snapshot version {version} is not supported, this app reads version {VERSION}')
+
+    payload = data[HEADER.size:HEADER.size + length]
+    if len(payload) != length or zlib.crc32(payload) != crc:
+        raise SnapshotError('The snapshot is damaged')
+    try:
+        if flags & FLAG_ZLIB:
+            payload = zlib.decompress(payload)
+        snapshot = json.loads(payload.decode('utf-8'))
+    except (zlib.error, ValueError, RecursionError) as e:
+        raise SnapshotError(f'The snapshot is damaged: {e}')
+    return check(snapshot)
+
+
+def write_snapshot(file_path, snapshot):
+    # checked before the file is opened, a rejected snapshot leaves no empty file behind
+    data = dumps(snapshot)
+    with open(file_path, 'wb') as f:
+        f.write(data)
+
+
+def read_snapshot(file_path):
+    with open(file_path, 'rb') as f:
+        return loads(f.read())
@@ -0,0 +1,381 @@
+import sys, os
+import json
+import argparse
+import importlib.util
+from collections import namedtuple
+
+
+SEPARATOR = '_'
+
+ERROR = 'error'
+WARNING = 'warning'
+
+# subject is the state path or 'transition <index>', index is the one in the merged transitions
+Issue = namedtuple('Issue', ['severity', 'kind', 'subject', 'message'])
+
+# a state tagged like this is meant to be the end of a run, it is no dead end
+FINAL_TAGS = ('final',)
+
+
+def collect_states(json_states):
+    """
+    Walks the states JSON once, returns ({full path: state data}, {full path: parent path}, issues).
+    Paths are the full paths the machine knows, a second sibling of the same name can never be found
+    and is reported instead.
+    """
+    states = {}
+    parents = {}
+    issues = []
+
+    stack = [(None, state_data) for state_data in reversed(json_states or [])]
+    while stack:
+        parent_path, state_data = stack.pop()
+        if isinstance(state_data, dict):
+            name = state_data.get('name')
+        else:
+            name = state_data
+
+        if not isinstance(name, str) or not name:
+            issues.append(Issue(ERROR, 'malformed-state', parent_path or '<root>', f'state without a name: {state_data!r}'))
+            continue
+        if SEPARATOR in name:
+            issues.append(Issue(ERROR, 'invalid-name', name, f'`{SEPARATOR}` is not allowed in the state name `{name}`'))
+            continue
+
+        path = name if parent_path is None else parent_path + SEPARATOR + name
+        if path in states:
+            issues.append(Issue(ERROR, 'duplicate-state', path, f'{path} is defined twice, only the first one is used'))
+            continue
+
+        states[path] = state_data
+        parents[path] = parent_path
+        if isinstance(state_data, dict):
+            for child in reversed(state_data.get('children', [])):
+                stack.append((path, child))
+
+    return states, parents, issues
+
+
+def diagram_lookup(states, parents):
+    """
+    Returns ({name: path}, {(parent path, name): path}) to resolve names the way
+    StateMachineWidget._find_state_by_name() does: the first segment is the first state of that name
+    in the order _build_states() appends them (a state after its children), the next segments go down
+    the children, the first match wins and there is no backtracking.
+    """
+    children = {}
+    for path in states:
+        children.setdefault(parents[path], []).append(path)
+
+    first_by_name = {}
+    child_by_name = {}
+    stack = [(path, False) for path in reversed(children.get(None, []))]
+    while stack:
+        path, children_done = stack.pop()
+        name = path.rsplit(SEPARATOR, 1)[-1]
+        if children_done or not isinstance(states[path], dict):
+            first_by_name.setdefault(name, path)
+            child_by_name.setdefault((parents[path], name), path)
+            continue
+        stack.append((path, True))
+        for child in reversed(children.get(path, [])):
+            stack.append((child, False))
+    return first_by_name, child_by_name
+
+
+def find_drawn_state(lookup, name):
+    # the path the diagram draws name at, None when it does not find it
+    first_by_name, child_by_name = lookup
+    parts = name.split(SEPARATOR)
+    path = first_by_name.get(parts[0])
+    for part in parts[1:]:
+        if path is None:
+            break
+        path = child_by_name.get((path, part))
+    return path
+
+
+def initial_path(states, path):
+    # the state the machine really is in after entering path, compound states go down their initial
+    while True:
+        state_data = states.get(path)
+        if not isinstance(state_data, dict) or not state_data.get('initial'):
+            return path
+        child = path + SEPARATOR + state_data['initial']
+        if child not in states:
+            return path
+        path = child
+
+
+def first_initial_state(json_states, states):
+    # same as StateMachineWidget._find_the_1st_initial_state(): the first state with an initial, depth first
+    stack = [(None, state_data) for state_data in reversed(json_states or [])]
+    while stack:
+        parent_path, state_data = stack.pop()
+        if not isinstance(state_data, dict) or not isinstance(state_data.get('name'), str):
+            continue
+        path = state_data['name'] if parent_path is None else parent_path + SEPARATOR + state_data['name']
+        if state_data.get('initial'):
+            return initial_path(states, path + SEPARATOR + state_data['initial'])
+        for child in reversed(state_data.get('children', [])):
+            stack.append((path, child))
+    return None
+
+
+def is_final(state_data):
+    if not isinstance(state_data, dict):
+        return False
+    if state_data.get('final') is True:
+        return True
+    tags = state_data.get('tags', [])
+    if isinstance(tags, str):
+        tags = [tags]
+    return any(tag in FINAL_TAGS for tag in tags)
+
+
+def conditions_key(conditions):
+    if isinstance(conditions, list):
+        return tuple(conditions)
+    return conditions
+
+
+def validate_machine(json_states, json_transitions, custom_matter=None):
+    """
+    Checks the states JSON and the merged transitions before a machine is built from them, returns a
+    list of Issue. Every state and every transition is visited a bounded number of times, so it stays
+    linear in the size of the definition. custom_matter is the module of the custom callbacks, when
+    given the conditions it does not define are reported.
+    """
+    states, parents, issues = collect_states(json_states)
+    lookup = diagram_lookup(states, parents)
+
+    for path, state_data in states.items():
+        if isinstance(state_data, dict) and state_data.get('initial'):
+            initial = state_data['initial']
+            if not isinstance(initial, str) or path + SEPARATOR + initial not in states:
+                issues.append(Issue(ERROR, 'invalid-initial', path, f'initial `{initial}` is not a child of {path}'))
+
+    # source path -> [(dest path, transition index)]
+    outgoing = {}
+    wildcard_dests = []
+    seen = {}
+    conditions_names = {}
+
+    for index, transition in enumerate(json_transitions or []):
+        subject = f'transition {index}'
+        if not isinstance(transition, dict) or any(key not in transition for key in ('trigger', 'source', 'dest')):
+            issues.append(Issue(ERROR, 'malformed-transition', subject, f'trigger, source and dest are required: {transition!r}'))
+            continue
+
+        trigger = transition['trigger']
+        source = transition['source']
+        dest = transition['dest']
+        conditions = transition.get('conditions')
+        if not isinstance(source, str) or not isinstance(dest, str):
+            issues.append(Issue(ERROR, 'malformed-transition', subject, f'source and dest must be state paths: {transition!r}'))
+            continue
+        if len(dest) == 0:
+            dest = source
+
+        key = (source, trigger, conditions_key(conditions))
+        if key in seen:
+            issues.append(Issue(WARNING, 'duplicate-transition', subject,
+                                f'{trigger} from {source} with the same conditions as transition {seen[key]}, only the first one can fire'))
+        else:
+            seen[key] = index
+
+        if conditions:
+            for name in (conditions if isinstance(conditions, list) else [conditions]):
+                conditions_names.setdefault(name, index)
+
+        if source == '*':
+            # valid for the machine, the diagram can not draw it
+            issues.append(Issue(WARNING, 'unresolved-source', subject, f'{trigger}: the wildcard source is not drawn'))
+        elif not check_reference(issues, lookup, states, subject, trigger, 'source', source):
+            continue
+        if not check_reference(issues, lookup, states, subject, trigger, 'dest', dest):
+            continue
+
+        if source == '*':
+            wildcard_dests.append(dest)
+        else:
+            outgoing.setdefault(source, []).append(dest)
+
+    if custom_matter is not None:
+        for name, index in conditions_names.items():
+            if not callable(getattr(custom_matter, name, None)):
+                issues.append(Issue(WARNING, 'missing-condition', f'transition {index}',
+                                    f'condition {name} is not defined in the custom matter, the Yes/No of the table is used'))
+
+    issues.extend(find_unreachable_states(json_states, states, parents, outgoing, wildcard_dests))
+    issues.extend(find_dead_ends(states, parents, outgoing, wildcard_dests))
+    return issues
+
+
+def check_reference(issues, lookup, states, subject, trigger, role, name):
+    # the machine only knows full paths, the diagram resolves names with _find_state_by_name().
+    # Returns whether the machine uses the transition, the diagram is checked either way
+    drawn = find_drawn_state(lookup, name)
+    if name in states:
+        if drawn is None:
+            issues.append(Issue(WARNING, f'undrawn-{role}', subject, f'{trigger}: the diagram does not find the {role} {name}'))
+        elif drawn != name:
+            issues.append(Issue(WARNING, f'undrawn-{role}', subject, f'{trigger}: the diagram draws the {role} {name} at {drawn}'))
+        return True
+
+    if drawn is None:
+        issues.append(Issue(ERROR, f'unresolved-{role}', subject, f'{trigger}: {role} {name} does not exist'))
+    elif role == 'source':
+        issues.append(Issue(WARNING, 'partial-source', subject,
+                            f'{trigger}: the diagram draws the source {name} at {drawn}, the machine needs the full path and never fires it'))
+    else:
+        issues.append(Issue(WARNING, 'partial-dest', subject,
+                            f'{trigger}: the diagram draws the dest {name} at {drawn}, the machine needs the full path and raises when it fires'))
+    return False
+
+
+def find_unreachable_states(json_states, states, parents, outgoing, wildcard_dests):
+    start = first_initial_state(json_states, states)
+    if start is None:
+        if not states:
+            return []
+        return [Issue(ERROR, 'no-initial', '<root>', 'no state has an initial, the machine starts in a state of its own')]
+
+    reachable = set()
+    queue = []
+
+    def reach(path):
+        # being in a state means being in all of its parents as well, their transitions apply too
+        path = initial_path(states, path)
+        while path is not None and path not in reachable:
+            reachable.add(path)
+            queue.append(path)
+            path = parents[path]
+
+    reach(start)
+    for dest in wildcard_dests:
+        reach(dest)
+
+    while queue:
+        path = queue.pop()
+        for dest in outgoing.get(path, ()):
+            reach(dest)
+
+    return [Issue(WARNING, 'unreachable-state', path, f'{path} can not be reached from {start}')
+            for path in states if path not in reachable]
+
+
+def find_dead_ends(states, parents, outgoing, wildcard_dests):
+    # a leaf no transition leaves, neither its own nor one of its parents'. Two different dests of
+    # a source are enough to know it leaves every state below it
+    if len(set(wildcard_dests)) > 1:
+        return []
+
+    exit_dests = {}
+    for source, dests in outgoing.items():
+        distinct = []
+        for dest in dests:
+            if dest not in distinct:
+                distinct.append(dest)
+                if len(distinct) == 2:
+                    break
+        exit_dests[source] = distinct
+
+    issues = []
+    for path, state_data in states.items():
+        if isinstance(state_data, dict) and state_data.get('children'):
+            continue
+        if is_final(state_data):
+            continue
+
+        leaves = any(dest != path for dest in wildcard_dests)
+        ancestor = path
+        while not leaves and ancestor is not None:
+            leaves = any(dest != path for dest in exit_dests.get(ancestor, ()))
+            ancestor = parents[ancestor]
+
+        if not leaves:
+            issues.append(Issue(WARNING, 'dead-end-state', path, f'no transition leaves {path}'))
+    return issues
+
+
+def summarize(issues):
+    errors = sum(1 for issue in issues if issue.severity == ERROR)
+    return f'{errors} errors, {len(issues) - errors} warnings'
+
+
+def format_issue(issue):
+    return f'{issue.severity:<7} {issue.kind:<20} {issue.subject}: {issue.message}'
+
+
+def load_custom_matter(file_path):
+    # the CLI imports the matter file by path, the app goes through ConfigPage.get_matter_lib()
+    module_name = os.path.splitext(os.path.basename(file_path))[0]
+    spec = importlib.util.spec_from_file_location(module_name, file_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def validate_files(states_file, transitions_folder, custom_matter_file=None):
+    from state_machine_core import read_machine_files
+
+    json_states, json_transitions, invalid_files = read_machine_files(states_file, transitions_folder)
+    issues = [Issue(ERROR, 'invalid-json', file_path, 'not a valid JSON file') for file_path in invalid_files]
+    if json_states is None and states_file not in invalid_files:
+        issues.append(Issue(ERROR, 'missing-file', states_file, 'states file not found'))
+    if json_transitions is None:
+        issues.append(Issue(ERROR, 'missing-file', transitions_folder, 'transitions folder not found'))
+
+    custom_matter = load_custom_matter(custom_matter_file) if custom_matter_file else None
+    return issues + validate_machine(json_states, json_transitions, custom_matter)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check the states and transitions of a machine without building it.')
+    parser.add_argument('names', nargs='*', help='configs of config.json to check, all of them when omitted')
+    parser.add_argument('-c', '--config', default='config.json', help='config file, default config.json')
+    parser.add_argument('--states', help='states JSON file, checked instead of the configs')
+    parser.add_argument('--transitions', help='transitions folder, with --states')
+    parser.add_argument('--matter', help='custom matter file, with --states')
+    parser.add_argument('--strict', action='store_true', help='exit with 1 on warnings too')
+    parser.add_argument('--limit', type=int, default=50, help='issues printed per config, 0 for all, default 50')
+    args = parser.parse_args(argv)
+
+    from state_machine_core import resolve_path
+
+    if args.states:
+        targets = {args.states: (args.states, args.transitions or '', args.matter)}
+    else:
+        with open(args.config, 'r') as f:
+            configs = json.load(f).get('configs', {})
+        base_dir = os.path.dirname(os.path.abspath(args.config))
+        names = args.names or list(configs)
+        missing = [name for name in names if name not in configs]
+        if missing:
+            parser.error(f'Config not found: {", ".join(missing)}')
+        targets = {}
+        for name in names:
+            config = configs[name]
+            matter = config.get('custom_matter') if config.get('enable_custom_matter') else None
+            targets[name] = (resolve_path(base_dir, config.get('main_resource', '')),
+                             resolve_path(base_dir, config.get('secondary_resource', '')),
+                             resolve_path(base_dir, matter))
+
+    failed = False
+    for name, (states_file, transitions_folder, matter_file) in targets.items():
+        issues = validate_files(states_file, transitions_folder, matter_file)
+        print(f'{name}: {summarize(issues)}')
+        shown = issues if args.limit <= 0 else issues[:args.limit]
+        for issue in shown:
+            print(f'  {format_issue(issue)}')
+        if len(shown) < len(issues):
+            print(f'  ... {len(issues) - len(shown)} more')
+
+        if any(issue.severity == ERROR or args.strict for issue in issues):
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,128 @@
+import csv
+import time
+import datetime
+
+
+class PaintStats:
+    """
+    Numbers of the last frame painted by the StateMachineWidget: paint time, interval since the
+    previous frame, states and transitions drawn or culled, font metric cache hits and misses, the
+    time of the last hit test and of the slowest mouse move handled since the previous frame. Every
+    frame can be appended to a CSV while recording.
+    """
+
+    CSV_FIELDS = ['time', 'frame', 'paint_ms', 'frame_interval_ms',
+                  'states_drawn', 'states_culled', 'transitions_drawn', 'transitions_culled',
+                  'font_cache_hits', 'font_cache_misses', 'hit_test_ms', 'mouse_moves', 'mouse_move_ms']
+
+    def __init__(self):
+        self.frame = 0
+        self.frame_start = None
+        self.last_frame_start = None
+        self.last = None
+
+        self.hit_test_ms = None
+        self.mouse_move_ms = None
+
+        self.csv_file = None
+        self.csv_writer = None
+
+        self.reset_counters()
+
+    def reset_counters(self):
+        self.states_drawn = 0
+        self.states_culled = 0
+        self.transitions_drawn = 0
+        self.transitions_culled = 0
+        # counted since the previous frame, hit tests measure text as well
+        self.font_cache_hits = 0
+        self.font_cache_misses = 0
+        self.mouse_moves = 0
+
+    def begin_frame(self):
+        self.frame_start = time.perf_counter()
+
+    def end_frame(self):
+        now = time.perf_counter()
+        frame_interval = None
+        if self.last_frame_start is not None:
+            frame_interval = (self.frame_start - self.last_frame_start) * 1000
+        self.last_frame_start = self.frame_start
+        self.frame += 1
+
+        self.last = {
+            'time': datetime.datetime.now().isoformat(timespec='milliseconds'),
+            'frame': self.frame,
+            'paint_ms': (now - self.frame_start) * 1000,
+            'frame_interval_ms': frame_interval,
+            'states_drawn': self.states_drawn,
+            'states_culled': self.states_culled,
+            'transitions_drawn': self.transitions_drawn,
+            'transitions_culled': self.transitions_culled,
+            'font_cache_hits': self.font_cache_hits,
+            'font_cache_misses': self.font_cache_misses,
+            'hit_test_ms': self.hit_test_ms,
+            'mouse_moves': self.mouse_moves,
+            'mouse_move_ms': self.mouse_move_ms,
+        }
+        if self.csv_writer is not None:
+            self.csv_writer.writerow(self.last)
+
+        self.reset_counters()
+        self.hit_test_ms = None
+        self.mouse_move_ms = None
+
+    def record_hit_test(self, elapsed):
+        self.hit_test_ms = elapsed * 1000
+
+    def record_mouse_move(self, elapsed):
+        # several moves may come between two frames, the slowest one is kept
+        self.mouse_moves += 1
+        self.mouse_move_ms = max(self.mouse_move_ms or 0.0, elapsed * 1000)
+
+    def font_cache_hit_rate(self, stats=None):
+        stats = stats if stats is not None else self.last
+        if stats is None:
+            return None
+        lookups = stats['font_cache_hits'] + stats['font_cache_misses']
+        if lookups == 0:
+            return None
+        return stats['font_cache_hits'] / lookups
+
+    def is_recording(self):
+        return self.csv_writer is not None
+
+    def start_recording(self, file_path):
+        self.stop_recording()
+        self.csv_file = open(file_path, 'w', newline='')
+        self.csv_writer = csv.DictWriter(self.csv_file, fieldnames=self.CSV_FIELDS)
+        self.csv_writer.writeheader()
+
+    def stop_recording(self):
+        if self.csv_file is not None:
+            self.csv_file.close()
+        self.csv_file = None
+        self.csv_writer = None
+
+    def overlay_lines(self):
+        stats = self.last
+        if stats is None:
+            return ['no frame yet']
+
+        def ms(value):
+            return '-' if value is None else f'{value:.2f} ms'
+
+        hit_rate = self.font_cache_hit_rate(stats)
+        lines = [
+            f'frame        {stats["frame"]}',
+            f'paint        {ms(stats["paint_ms"])}',
+            f'interval     {ms(stats["frame_interval_ms"])}',
+            f'states       {stats["states_drawn"]} drawn / {stats["states_culled"]} culled',
+            f'transitions  {stats["transitions_drawn"]} drawn / {stats["transitions_culled"]} culled',
+            f'font cache   {"-" if hit_rate is None else f"{hit_rate*100:.1f}%"} hits ({stats["font_cache_misses"]} misses)',
+            f'hit test     {ms(stats["hit_test_ms"])}',
+            f'mouse move   {ms(stats["mouse_move_ms"])} ({stats["mouse_moves"]} since last frame)',
+        ]
+        if self.is_recording():
+            lines.append('recording CSV')
+        return lines
@@ -1,12 +1,110 @@
-import sys
+import sys, os
+import json
+from enum import Enum
 from transitions import Machine
 from transitions.core import MachineError
-from transitions.extensions.states import Timeout, Tags, add_state_features
+from transitions.extensions.states import Tags, add_state_features
 from transitions.extensions.factory import HierarchicalGraphMachine as HGMachine
+from transitions.extensions.factory import HierarchicalMachine as HMachine
 
-@add_state_features(Timeout, Tags)
+from timeout_scheduler import ScheduledTimeout
+
+# timeouts share one scheduler instead of starting a thread per state entry
+@add_state_features(ScheduledTimeout, Tags)
 class CustomStateMachine(HGMachine):
     pass
 
+# same states, features and callbacks without the diagram bookkeeping, every trigger is cheaper
+@add_state_features(ScheduledTimeout, Tags)
+class CustomNestedStateMachine(HMachine):
+    pass
+
+class MachineBackend(Enum):
+    graph = 0
+    nested = 1
+
+MACHINE_CLASSES = {
+    MachineBackend.graph: CustomStateMachine,
+    MachineBackend.nested: CustomNestedStateMachine,
+}
+
+def create_machine(backend, model, states, transitions, initial=None, ignore_invalid_triggers=True):
+    extra_args = dict(auto_transitions=False)
+    if backend == MachineBackend.graph:
+        extra_args.update(show_conditions=True, show_state_attributes=True)
+    if initial is not None:
+        extra_args['initial'] = initial
+
+    return MACHINE_CLASSES[backend](model=model,
+                                    states=states,
+                                    send_event=True,
+                                    ignore_invalid_triggers=ignore_invalid_triggers,
+                                    transitions=transitions,
+                                    **extra_args)
+
+def build_graph(states, transitions, initial=None, state=None, title=None):
+    # the graph of a machine of any backend, built only when somebody asks for it.
+    # callbacks are never called, so a bare Matter is enough as model
+    model = Matter()
+    machine = create_machine(MachineBackend.graph, model, states, transitions, initial)
+    if state is not None:
+        machine.set_state(state, model=model)
+    return model.get_graph(title=title)
+
 class Matter(object):
-    pass
\ No newline at end of file
+    pass
+
+def create_matter_class():
+    # every machine gets its own subclass to hang its callbacks on, Matter itself stays untouched
+    return type('Matter', (Matter,), {})
+
+# the readers of the config files, shared by the app and the headless tools without any widget
+
+def resolve_path(base_dir, path):
+    # paths of config.json are relative to the folder it is in
+    if not path or os.path.isabs(path):
+        return path
+    return os.path.join(base_dir, path)
+
+def read_states_file(states_config):
+    # None when the file does not exist, raises json.JSONDecodeError
+    try:
+        with open(states_config, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def read_transitions_folder(transitions_config_folder):
+    # returns (merged transitions, files which are not valid JSON), the transitions are None
+    # when the folder does not exist. Touches no widget, may run in any thread.
+    merged_json = []
+    invalid_files = []
+    try:
+        filenames = os.listdir(transitions_config_folder)
+    except FileNotFoundError:
+        return None, invalid_files
+
+    # 遍历指定目录下的所有文件
+    for filename in filenames:
+        if filename.endswith('.json'):
+            file_path = os.path.join(transitions_config_folder, filename)
+            try:
+                with open(file_path, 'r') as f:
+                    data = json.load(f)
+                    merged_json.extend(data)
+            except FileNotFoundError:
+                print(f"文件 {file_path} 未找到。")
+            except json.JSONDecodeError:
+                invalid_files.append(file_path)
+    return merged_json, invalid_files
+
+def read_machine_files(states_config, transitions_config_folder):
+    # what StateMachineWidget.load_machine() takes as preloaded
+    invalid_files = []
+    try:
+        json_states = read_states_file(states_config)
+    except json.JSONDecodeError:
+        json_states = None
+        invalid_files.append(states_config)
+    json_transitions, invalid_transitions_files = read_transitions_folder(transitions_config_folder)
+    return json_states, json_transitions, invalid_files + invalid_transitions_files
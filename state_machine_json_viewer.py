@@ -5,32 +5,9 @@ from PyQt5.QtWidgets import QApplication, QWidget, QPushButton, QGridLayout, QVB
 from PyQt5.QtCore import Qt, QSettings, QPointF, QEvent, pyqtSignal, QTimer, QSortFilterProxyModel, QModelIndex, QRegularExpression
 from PyQt5.QtGui import QStandardItemModel, QStandardItem, QCursor, QIcon, QPixmap
 
+from filter_proxy_model import RecursiveFilterProxyModel, DebouncedFilter
+from json_tree_model import JsonTreeModel, JsonTreeItem
 
-class RecursiveFilterProxyModel(QSortFilterProxyModel):
-    def filterAcceptsRow(self, source_row: int, source_parent: QModelIndex) -> bool:
-        for column in range(self.sourceModel().columnCount(source_parent)):
-            sub_index = self.sourceModel().index(source_row, column, source_parent)
-            text = self.sourceModel().data(sub_index, Qt.DisplayRole)
-            if text is not None:
-                regExp = self.filterRegExp().pattern()
-                if regExp:
-                    try:
-                        if re.search(regExp, str(text)):
-                            return True
-                    except re.error:
-                        pass
-                else:
-                    regularExp = self.filterRegularExpression()
-                    if regularExp.match(str(text)).hasMatch():
-                        return True
-
-        index = self.sourceModel().index(source_row, 0, parent=source_parent)
-        rows = self.sourceModel().rowCount(index)
-        for row in range(rows):
-            if self.filterAcceptsRow(row, index):
-                return True
-
-        return super().filterAcceptsRow(source_row, source_parent)
 
 class TreeViewMonitorDataChange(QTreeView):
     def __init__(self, parent=None):
@@ -119,22 +96,17 @@ class StateMachineJsonViewer(QWidget):
         
         self.editing_item_old_text = None
 
+        # only the upper levels are expanded up front, deeper branches are fetched when opened
+        self.expand_depth = 1
+
         self.initUI(json_data)
 
     def set_json_data(self, json_data):
-        self.tree_model.clear()
-        self.tree_model.setHorizontalHeaderLabels(['Key', 'Value'])
-
-        for col in range(self.tree_model.columnCount()):
-            header_item = self.tree_model.horizontalHeaderItem(col)
-            if header_item is not None:
-                header_item.setTextAlignment(Qt.AlignHCenter | Qt.AlignVCenter)
-
-        self.populate_model(self.tree_model.invisibleRootItem(), json_data)
+        self.tree_model.set_json_data(json_data)
 
         self.tree.header().setSectionResizeMode(0, QHeaderView.ResizeToContents)
         self.tree.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
-        self.tree.expandAll()
+        self.tree.expandToDepth(self.expand_depth)
 
     def set_white_theme(self):
         self.setStyleSheet("""
@@ -243,14 +215,12 @@ class StateMachineJsonViewer(QWidget):
         self.save_search_btn.setMaximumWidth(110)
         self.save_search_btn.setMaximumHeight(110)
 
-        self.regex_cache = {}
-
         self.regex_check_box = QCheckBox('Regex')
         self.regex_check_box.setCheckState(Qt.CheckState.Unchecked)
         self.regex_check_box.setMaximumWidth(60)
         self.regex_check_box.setMaximumHeight(110)
 
-        self.tree_model = QStandardItemModel(self)
+        self.tree_model = JsonTreeModel(self)
         self.proxy_model = RecursiveFilterProxyModel()
         self.proxy_model.setSourceModel(self.tree_model)
         self.proxy_model.setFilterCaseSensitivity(Qt.CaseInsensitive)  # 不区分大小写
@@ -260,6 +230,9 @@ class StateMachineJsonViewer(QWidget):
         self.tree.setModel(self.proxy_model)
         self.tree.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
 
+        self.debounced_filter = DebouncedFilter(self.proxy_model, parent=self)
+        self.debounced_filter.filter_applied.connect(self.filter_applied_slot)
+
         self.set_json_data(json_data)
 
         self.tree.setContextMenuPolicy(3)
@@ -282,43 +255,6 @@ class StateMachineJsonViewer(QWidget):
 
         self.setLayout(layout)
 
-    def populate_model(self, parent, data):
-        if isinstance(data, dict):
-            for key, value in data.items():
-                
-                key_item = QStandardItem(key)
-                key_item.setFlags(key_item.flags() & ~Qt.ItemIsEditable)
-
-                if isinstance(value, (dict, list)):
-                    self.populate_model(key_item, value)
-                    
-                    value_item = QStandardItem()
-                    value_item.setFlags(value_item.flags() & ~Qt.ItemIsEditable)
-
-                    parent.appendRow([key_item, value_item])
-                else:
-                    value_item = QStandardItem(str(value))
-                    if key_item.text() in ['children', 'on_enter', 'on_exit']:
-                        value_item.setFlags(value_item.flags() & ~Qt.ItemIsEditable)                
-                    parent.appendRow([key_item, value_item])
-        elif isinstance(data, list):
-            for index, value in enumerate(data):
-                
-                key_item = QStandardItem(f"[{index}]")
-                key_item.setFlags(key_item.flags() & ~Qt.ItemIsEditable)
-                
-                if isinstance(value, (dict, list)):
-                    self.populate_model(key_item, value)
-
-                    value_item = QStandardItem()
-                    value_item.setFlags(value_item.flags() & ~Qt.ItemIsEditable)                
-                    parent.appendRow([key_item, value_item])
-                else:
-                    value_item = QStandardItem(str(value))
-                    if key_item.text() in ['children', 'on_enter', 'on_exit']:
-                        value_item.setFlags(value_item.flags() & ~Qt.ItemIsEditable)
-                    parent.appendRow([key_item, value_item])
-
     def get_parent(self, item, times):
         parent = item
         for i in range(times):
@@ -487,10 +423,10 @@ class StateMachineJsonViewer(QWidget):
         if ok:
             row = parent_item.rowCount()
             
-            key_item = QStandardItem(f"[{row}]")
+            key_item = JsonTreeItem(f"[{row}]")
             key_item.setFlags(key_item.flags() & ~Qt.ItemIsEditable)
 
-            value_item = QStandardItem(value)
+            value_item = JsonTreeItem(value)
             parent_item.appendRow([key_item, value_item])
             self.tree.expand(index)
 
@@ -518,10 +454,10 @@ class StateMachineJsonViewer(QWidget):
         self.tree.expand(index)
 
     def add_children(self, parent_item):
-        key_item = QStandardItem("children")
+        key_item = JsonTreeItem("children")
         key_item.setFlags(key_item.flags() & ~Qt.ItemIsEditable)
         
-        value_item = QStandardItem("")
+        value_item = JsonTreeItem("")
         value_item.setFlags(value_item.flags() & ~Qt.ItemIsEditable)
 
         parent_item.appendRow([key_item, value_item])
@@ -582,10 +518,10 @@ class StateMachineJsonViewer(QWidget):
         return parent.text() == 'children'
 
     def add_key_value(self, parent_item, key, value):
-        key_item = QStandardItem(key)
+        key_item = JsonTreeItem(key)
         key_item.setFlags(key_item.flags() & ~Qt.ItemIsEditable)
 
-        value_item = QStandardItem(value)
+        value_item = JsonTreeItem(value)
         if len(value) == 0:
             value_item.setFlags(value_item.flags() & ~Qt.ItemIsEditable)
 
@@ -603,10 +539,10 @@ class StateMachineJsonViewer(QWidget):
                     child_item_data.setText(value)
                     found = True
             if not found:
-                key_item = QStandardItem(key)
+                key_item = JsonTreeItem(key)
                 key_item.setFlags(key_item.flags() & ~Qt.ItemIsEditable)
 
-                value_item = QStandardItem(value)
+                value_item = JsonTreeItem(value)
                 if len(value) == 0:
                     value_item.setFlags(value_item.flags() & ~Qt.ItemIsEditable)
                 
@@ -740,69 +676,39 @@ class StateMachineJsonViewer(QWidget):
             self.state_rename_signal.emit(names, self.editing_item_old_text)
 
     def save_as_json(self):
-        root_item = self.tree_model.invisibleRootItem()
-        json_data = self.model_to_json(root_item)
-
         file_path, _ = QFileDialog.getSaveFileName(self, "Save JSON File", "", "JSON Files (*.json)")
         if file_path:
             try:
+                # the model keeps the document in sync with every edit, json.dump streams it to the file
                 with open(file_path, 'w', encoding='utf-8') as f:
-                    json.dump(json_data, f, ensure_ascii=False, indent=4)
+                    json.dump(self.tree_model.document, f, ensure_ascii=False, indent=4)
                 QMessageBox.information(self, 'Success', 'JSON file saved successfully.')
             except Exception as e:
                 QMessageBox.critical(self, 'Error', f'Failed to save JSON file: {str(e)}')
 
-    def model_to_json(self, parent_item):
-        if parent_item.rowCount() == 0:
-            return None
-
-        if all(self.is_digit_item(parent_item.child(i)) for i in range(parent_item.rowCount())):
-            result = []
-            for i in range(parent_item.rowCount()):
-                child = parent_item.child(i)
-                child_value_item = child.parent().child(child.row(), 1) if child.parent() else None
-                child_value = child_value_item.text().strip() if child_value_item and child_value_item.text().strip() else None
-                if child_value is None and child.rowCount() > 0:
-                    child_value = self.model_to_json(child)
-                if child_value is not None:
-                    result.append(child_value)
-            return result if result else None
-        else:
-            result = {}
-            for i in range(parent_item.rowCount()):
-                child = parent_item.child(i)
-                key = child.text()
-                value_item = child.parent().child(child.row(), 1) if child.parent() else None
-                value = value_item.text().strip() if value_item and value_item.text().strip() else None
-                if value is None and child.rowCount() > 0:
-                    value = self.model_to_json(child)
-                if value is not None:
-                    result[key] = value
-            return result if result else None
-
-
-    # def filter_tree_view_slot(self, text):
-    #     self.proxy_model.setFilterRegularExpression(text)
-    #     self.tree.expandAll()
-
     def filter_tree_view_slot(self, text):
-        if self.regex_check_box.isChecked():
-            if text in self.regex_cache:
-                regex = self.regex_cache[text]
-            else:
-                regex = QRegularExpression(text)
-                self.regex_cache[text] = regex
-
-            if regex.isValid():
-                # print(f"set regex: '{text}'")
-                self.proxy_model.setFilterRegularExpression(regex)
-                self.tree.expandAll()
-                return
+        self.debounced_filter.request(text, self.regex_check_box.isChecked())
+
+    def filter_applied_slot(self, text):
+        accepted_paths = self.proxy_model.accepted_paths
+        if not text or accepted_paths is None:
+            # expandAll() would fetch the whole lazy model
+            self.tree.collapseAll()
+            self.tree.expandToDepth(self.expand_depth)
+            return
 
-        # print(f"set filter wildcard: '{text}'")
-        self.proxy_model.setFilterRegularExpression(text)
-        self.proxy_model.setFilterCaseSensitivity(Qt.CaseInsensitive)  # 不区分大小写
-        self.tree.expandAll()
+        self.tree_model.fetch_paths(accepted_paths)
+        # only the parents of the accepted rows are opened, parents come before their children
+        source_indexes = {(): QModelIndex()}
+        for path in sorted({path[:i] for path in accepted_paths for i in range(1, len(path))}):
+            parent = source_indexes.get(path[:-1])
+            if parent is None:
+                continue
+            source_index = self.tree_model.index(path[-1], 0, parent)
+            if not source_index.isValid():
+                continue
+            source_indexes[path] = source_index
+            self.tree.expand(self.proxy_model.mapFromSource(source_index))
 
 if __name__ == '__main__':
     json_data = [
@@ -1,26 +1,38 @@
 import sys, os
 import json
+import threading
+import time
+import datetime
 import math
 import configparser
 from enum import Enum 
 
 from PyQt5.QtWidgets import (QApplication, QWidget, QVBoxLayout, QComboBox, QPushButton, QHBoxLayout, 
-                             QPlainTextEdit, QShortcut, QSizePolicy, QSplitter, QMenu, QMainWindow, QMessageBox)
+                             QPlainTextEdit, QShortcut, QSizePolicy, QSplitter, QMenu, QMainWindow, QMessageBox, QFileDialog, QProgressBar)
 from PyQt5.QtGui import QPainter, QColor, QPen, QPolygonF, QPainterPath, QFontMetrics, QFont, QIcon, QKeySequence, QPalette
-from PyQt5.QtCore import Qt, QSettings, QPointF, QEvent, pyqtSignal, QTimer
+from PyQt5.QtCore import Qt, QSettings, QPointF, QRectF, QEvent, pyqtSignal, QTimer
 from transitions.core import MachineError
 
 
-from state_machine_core import Matter, CustomStateMachine
+from state_machine_core import MachineBackend, create_machine, create_matter_class, build_graph, read_states_file, read_transitions_folder, read_machine_files
 from transitions.core import EventData
 from transitions.extensions.nesting import NestedEvent
 
 from conditions_table_view import TableViewContainsSearchWidget
-from config_page import ConfigPage, Theme
+from config_page import ConfigPage, Theme, ANIMATION_SPEEDS
 from colorful_text_edit import ColorfulTextEdit, FunctionType
 from text_edit_search import TextEditSearch
 
 from state_machine_json_viewer import StateMachineJsonViewer
+from trigger_queue import TriggerQueue, TriggerPolicy
+from timeout_scheduler import QtTimeoutDriver, get_timeout_scheduler
+from transition_animator import TransitionAnimator
+from callback_profiler import CallbackProfiler, ProfilerPanel
+from paint_stats import PaintStats
+from deferred_loader import DeferredLoader
+from machine_validator import validate_machine, summarize, format_issue, ERROR
+from coverage_tracker import CoverageTracker, heat_color, format_report
+from machine_snapshot import SnapshotError, capture, restore, cancel_timeouts, definition_signature, write_snapshot, read_snapshot
 
 
 LEVEL_COLORS_WHITE_THEME = [
@@ -54,6 +66,23 @@ def get_attr_optional(stuff, attr):
         print(f"Attribute {attr} not found.")
         return None
 
+def get_matter_functions(stuff):
+    if stuff is None:
+        return {}
+    return {name: value for name, value in vars(stuff).items() if callable(value) and hasattr(value, '__code__')}
+
+class BatchedSignal:
+    """
+    Stands in for a pyqtSignal in the generated callbacks: emit() only records the call, the
+    widget sends all calls of a trigger to the UI at once.
+    """
+    def __init__(self, widget, kind):
+        self.widget = widget
+        self.kind = kind
+
+    def emit(self, *args):
+        self.widget.record_event(self.kind, args)
+
 class State:
     def __init__(self, name, children=None, parent=None):
         self.name = name
@@ -80,18 +109,24 @@ class State:
 
 class StateMachineWidget(QWidget):
 
-    called_trigger_signal = pyqtSignal(str, list)
-    called_condition_signal = pyqtSignal(str, str, str, bool, list)
-    called_enter_state_signal = pyqtSignal(str, str, str, list)
-    called_exit_state_signal = pyqtSignal(str, str, str, list)
+    # [(kind, args, time), ...] of one trigger, kind is 'trigger', 'condition', 'enter' or 'exit'
+    called_events_signal = pyqtSignal(list)
+    schedule_flush_signal = pyqtSignal()
 
     called_set_initial_state_signal = pyqtSignal(str)
     called_new_state_machine_signal = pyqtSignal(str)
 
+    # triggers may run in the worker thread, which must not touch the widget directly
+    repaint_signal = pyqtSignal()
+    clear_focus_signal = pyqtSignal()
+
+    # the report of a coverage session the widget had to stop itself
+    coverage_stopped_signal = pyqtSignal(object)
+
     def __init__(self, icon=None):
         super().__init__()
         
-        self.original_matter_attributes = set(dir(Matter))
+        self.matter_class = create_matter_class()
 
         self.icon = icon
 
@@ -106,8 +141,35 @@ class StateMachineWidget(QWidget):
 
         self.animation_enabled = False
 
-        self.transitions_timer = QTimer()
-        self.transitions_timer_is_running = False
+        self.transition_animator = TransitionAnimator(parent=self)
+        self.transition_animator.frame_signal.connect(self.animation_frame_slot)
+        # Esc shows where the playing highlight ends and goes on with the next one waiting
+        self.skip_animation_shortcut = QShortcut(QKeySequence(Qt.Key_Escape), self, self.transition_animator.skip)
+        # only while the diagram has the focus, Esc closes the search boxes of the other panels
+        self.skip_animation_shortcut.setContext(Qt.WidgetWithChildrenShortcut)
+        self.setFocusPolicy(Qt.ClickFocus)
+
+        # triggers only wait here once too many transition highlights are waiting to be played
+        self.trigger_queue = TriggerQueue(self.run_trigger, self.transition_animator.backlog_full, parent=self)
+        self.repaint_signal.connect(self.update)
+        self.clear_focus_signal.connect(self.clear_focus_slot)
+
+        # callbacks record their events here, they are sent once per trigger, or once per frame
+        # for callbacks run outside of a trigger (e.g. timeouts)
+        self.event_batch = []
+        self.event_batch_lock = threading.Lock()
+        # per thread, in_trigger is only read by the callbacks of the thread running the trigger
+        self.trigger_local = threading.local()
+        self.called_trigger_events = BatchedSignal(self, 'trigger')
+        self.called_condition_events = BatchedSignal(self, 'condition')
+        self.called_enter_state_events = BatchedSignal(self, 'enter')
+        self.called_exit_state_events = BatchedSignal(self, 'exit')
+
+        self.flush_events_timer = QTimer(self)
+        self.flush_events_timer.setSingleShot(True)
+        self.flush_events_timer.setInterval(16)
+        self.flush_events_timer.timeout.connect(self.flush_events)
+        self.schedule_flush_signal.connect(self.schedule_flush_slot)
         
         self.hightlight_state = None
         self.weak_state = None
@@ -129,97 +191,304 @@ class StateMachineWidget(QWidget):
 
         self.font = QFont()
         self.font.setPointSize(10)
+        # (family, point size, italic, text) -> width, text None is the height
+        self.text_metrics_cache = {}
+
+        self.paint_stats = PaintStats()
+        self.debug_overlay_enabled = False
+
+        self.coverage = CoverageTracker()
+        self.coverage_heat_map_enabled = False
+        # ({State: heat}, {transition key: heat}) of the frame being painted, None without the heat map
+        self.coverage_heat = None
+        # (coverage revision, state_by_path, heat) of the last heat computed
+        self.coverage_heat_cache = None
+        # scene rect being painted, states and transitions outside of it are not drawn
+        self.cull_rect = None
 
         self.merged_transitions = {}
+        self.transition_links = []
+        self.transition_segments = {}
+
+        # names of the wrappers set up on the matter class, so a hot reload can rebind them one by one
+        self.enter_function_names = set()
+        self.exit_function_names = set()
+        self.conditions_allowed = {}
+
+        self.custom_matter = None
+
+        self.profiler = CallbackProfiler()
 
         self.states = []
+        # full path -> State, rebuilt on demand after the states changed
+        self.state_by_path = None
         
         self.json_states = None
         self.json_transitions = None
+        self.validation_issues = []
+
+        # created by set_init_state(), fast start shows the window before
+        self.model = None
+        self.machine = None
+        # config name -> (signature, machine, model), building a machine is much slower than resetting it
+        self.machine_cache = {}
+        self.machine_cache_size = 4
+        self.machine_backend = MachineBackend.graph
+        self.machine_signature = None
+        # hash of the states and transitions of the current config
+        self.json_signature = None
+        self.config_name = None
 
     def set_animation(self, animation_enabled):
         # print(f'animation_enabled={animation_enabled}')
         self.animation_enabled = animation_enabled
+        self.transition_animator.set_enabled(animation_enabled)
+
+    def set_animation_speed(self, speed):
+        self.transition_animator.set_speed(speed)
+
+    def record_event(self, kind, args):
+        with self.event_batch_lock:
+            self.event_batch.append((kind, args, datetime.datetime.now()))
+            first_event = len(self.event_batch) == 1
+        if first_event and not getattr(self.trigger_local, 'in_trigger', False):
+            self.schedule_flush_signal.emit()
+
+    def schedule_flush_slot(self):
+        if not self.flush_events_timer.isActive():
+            self.flush_events_timer.start()
+
+    def flush_events(self):
+        with self.event_batch_lock:
+            events = self.event_batch
+            self.event_batch = []
+        if events:
+            self.called_events_signal.emit(events)
+
+    def set_profiling(self, enabled):
+        if enabled == self.profiler.enabled:
+            return
+        self.profiler.enabled = enabled
+
+        # rebind every wrapper, with or without the instrumentation
+        for name in self.enter_function_names:
+            self.setup_enter_state_function(name)
+        for name in self.exit_function_names:
+            self.setup_exit_state_function(name)
+        for name, allowed in list(self.conditions_allowed.items()):
+            self.setup_conditions_allowed_slot(name, allowed)
+
+    def profiled(self, name, function):
+        if self.profiler.enabled:
+            return self.profiler.instrument(name, function)
+        return function
+
+    def set_trigger_queue_policy(self, policy):
+        self.trigger_queue.set_policy(policy)
+
+    def set_machine_backend(self, backend):
+        # takes effect when the machine is built again, i.e. on the next reload or initial state
+        self.machine_backend = backend
+
+    def get_graph(self, title=None):
+        # the nested backend keeps no graph, build one from the same states and transitions
+        if self.machine is None:
+            return None
+        if hasattr(self.model, 'get_graph'):
+            return self.model.get_graph(title=title)
+        return build_graph(self.json_states, self.json_transitions, self.machine.initial, self.model.state, title)
 
-    def remove_all_new_matter_method(self):
-        current_matter_attributes = set(dir(Matter))
-        new_matter_attributes = current_matter_attributes - self.original_matter_attributes
-        if new_matter_attributes:
-            for attr in new_matter_attributes:
-                if callable(getattr(Matter, attr)):
-                    # print(f'del matter\'s attr={attr}')
-                    delattr(Matter, attr)
+    def set_worker_thread(self, enabled):
+        # the machine's signals reach the GUI through queued connections once they are emitted
+        # from the worker thread, in the order they were emitted
+        self.trigger_queue.set_worker_thread(enabled)
 
     def reload_config(self, config_name, STATES_CONFIG, TRANSITIONS_CONFIG_FOLDER, enable_default_enter, enable_default_exit, custom_matter=None):
         try:
-            self.remove_all_new_matter_method()
+            self.load_machine(config_name, STATES_CONFIG, TRANSITIONS_CONFIG_FOLDER, enable_default_enter, enable_default_exit, custom_matter)
+        except Exception as e:
+            self.warning_error_msg_box.setText(f'{e}')
+            self.warning_error_msg_box.setWindowTitle('Error')
+            self.warning_error_msg_box.exec()
+
+
+    def load_machine(self, config_name, STATES_CONFIG, TRANSITIONS_CONFIG_FOLDER, enable_default_enter, enable_default_exit, custom_matter=None, preloaded=None):
+        # same as reload_config() but raises instead of showing a message box, for headless use.
+        # preloaded is the result of read_machine_files(), e.g. read in a worker thread
+
+        # triggers still waiting were meant for the old machine
+        self.trigger_queue.clear()
+
+        # a fresh class drops the callbacks of the previous config in one go
+        self.matter_class = create_matter_class()
 
-            # reset the offset when reload, scale can be remained
-            self.offset_x = 0
-            self.offset_y = 0
+        # reset the offset when reload, scale can be remained
+        self.offset_x = 0
+        self.offset_y = 0
 
-            self.called_new_state_machine_signal.emit(config_name)
+        self.called_new_state_machine_signal.emit(config_name)
+        self.config_name = config_name
+        # the model of the current machine is of the old matter class, get it from the cache again
+        self.machine_signature = None
 
-            self.STATES_CONFIG = STATES_CONFIG
-            self.TRANSITIONS_CONFIG_FOLDER = TRANSITIONS_CONFIG_FOLDER
+        self.STATES_CONFIG = STATES_CONFIG
+        self.TRANSITIONS_CONFIG_FOLDER = TRANSITIONS_CONFIG_FOLDER
             
-            self.enable_default_enter = enable_default_enter
-            self.enable_default_exit = enable_default_exit
+        self.enable_default_enter = enable_default_enter
+        self.enable_default_exit = enable_default_exit
 
-            self.custom_matter = custom_matter
+        self.custom_matter = custom_matter
 
-            self.font.setPointSize(10)
+        self.enter_function_names = set()
+        self.exit_function_names = set()
+        self.conditions_allowed = {}
 
-            self.merged_transitions = {}
+        self.font.setPointSize(10)
+
+        self.merged_transitions = {}
 
-            self.states = []
+        self.states = []
+        self.state_by_path = None
             
+        if preloaded is None:
             self.json_states = self._load_states()
             self.json_transitions = self._load_transitions()
+        else:
+            self.json_states, self.json_transitions, invalid_files = preloaded
+            for file_path in invalid_files:
+                self.show_invalid_json_warning(file_path)
 
-            if self.json_states is not None:
-                self._build_states(self.json_states)
+        # on the JSON as read, _build_states() adds the default gates to it
+        self.validation_issues = validate_machine(self.json_states, self.json_transitions, custom_matter)
+        if self.validation_issues:
+            print(f'{config_name}: {summarize(self.validation_issues)}, see File > Validate')
 
-            self._load_state_positions()
+        if self.json_states is not None:
+            self._build_states(self.json_states)
 
-            self._layout_states()
+        self._load_state_positions()
 
-            initial_state_name = self._find_the_1st_initial_state(self.json_states)
-            self.set_init_state(initial_state_name)
+        self._layout_states()
 
-            if self.json_transitions is not None:
-                # print(f'json_transitions={json_transitions}')
-                self._connect_states(self.json_transitions)
+        # hashed once per load, set_init_state() looks up the cached machine with it
+        self.json_signature = definition_signature(self.json_states, self.json_transitions)
 
-        except Exception as e:
-            self.warning_error_msg_box.setText(f'{e}')
-            self.warning_error_msg_box.setWindowTitle('Error')
-            self.warning_error_msg_box.exec()
+        initial_state_name = self._find_the_1st_initial_state(self.json_states)
+        self.set_init_state(initial_state_name)
+
+        if self.json_transitions is not None:
+            # print(f'json_transitions={json_transitions}')
+            self._connect_states(self.json_transitions)
 
 
     def set_init_state(self, state_name=None):
         self.called_set_initial_state_signal.emit(state_name)
 
-        self.model = Matter()
+        # triggers still waiting were meant for the old state, and the one running in the worker
+        # thread must be done before the model is reset under it
+        self.trigger_queue.clear()
 
-        extra_args = dict(auto_transitions=False, show_conditions=True, show_state_attributes=True)
-        if state_name is not None:
-            extra_args['initial'] = state_name
+        # highlights still waiting belong to the old machine
+        self.transition_animator.stop()
+
+        signature = self._machine_signature()
+        if self.machine is None or signature != self.machine_signature:
+            self.machine, self.model = self._get_machine(signature, state_name)
+        else:
+            self._reset_machine(state_name)
+
+        if self.coverage.is_running() and self.coverage.machine is not self.machine:
+            # the IDs were given to the states and transitions of the old machine
+            report = self.coverage.stop_session()
+            print(f'coverage session stopped, the machine changed\n{format_report(report, limit=10)}')
+            self.coverage_stopped_signal.emit(report)
 
-        self.machine = CustomStateMachine(model=self.model,
-                                          states=self.json_states,
-                                          send_event=True,
-                                          ignore_invalid_triggers=True, 
-                                          transitions=self.json_transitions, 
-                                          **extra_args)
-        
         # print(f'current={self.model.state}') 
-        for state in self.states:
-            if self.model.state == self.get_full_path(state):
-                self.set_current_last_state(state, None)
+        state = self.find_state_by_path(self.model.state)
+        if state is not None:
+            self.set_current_last_state(state, None)
 
         self.update()
 
+    def _machine_signature(self):
+        # the backend and the states and transitions the machine is built from
+        return self.machine_backend.name, self.json_signature
+
+    def _get_machine(self, signature, state_name):
+        cached = self.machine_cache.pop(self.config_name, None)
+        if cached is not None and cached[0] == signature:
+            signature, machine, model = cached
+            # the machine only knows the callback names, the model takes the ones of the current matter class
+            model.__class__ = self.matter_class
+            self.machine, self.model = machine, model
+            self._reset_machine(state_name)
+        else:
+            model = self.matter_class()
+            machine = create_machine(self.machine_backend, model, self.json_states, self.json_transitions, state_name)
+
+        self.machine_signature = signature
+        self.machine_cache[self.config_name] = (signature, machine, model)
+        while len(self.machine_cache) > self.machine_cache_size:
+            self.machine_cache.pop(next(iter(self.machine_cache)))
+        return machine, model
+
+    def _reset_machine(self, state_name=None):
+        # puts the model back to an initial state without building the machine again
+        self._cancel_timeouts()
+
+        if state_name is None:
+            state_name = self.machine.initial
+        else:
+            # get_graph() and a later reset start from the chosen state, as a new machine would
+            self.machine.initial = state_name
+        self.machine.set_state(self._initial_state_names(state_name), model=self.model)
+
+    def _initial_state_names(self, state_name):
+        # like the constructor, a compound initial state goes down to its initial children and a
+        # parallel one (a list of initials) to all of them
+        if isinstance(state_name, list):
+            return [self._initial_state_names(name) for name in state_name]
+        initial = self.machine.get_state(state_name).initial
+        if not initial:
+            return state_name
+        separator = self.machine.state_cls.separator
+        if isinstance(initial, list):
+            return [self._initial_state_names(state_name + separator + name) for name in initial]
+        return self._initial_state_names(state_name + separator + initial)
+
+    def _cancel_timeouts(self):
+        # timeouts of the states the model is in would fire into the new initial state
+        cancel_timeouts(self.machine, self.model)
+
+    def take_snapshot(self):
+        if self.machine is None:
+            return None
+        return capture(self.machine, self.model, self.conditions_allowed, self.json_signature, self.config_name)
+
+    def restore_snapshot(self, snapshot):
+        if self.machine is None:
+            raise SnapshotError('No machine loaded')
+        if snapshot['signature'] != self.json_signature:
+            raise SnapshotError(f'The snapshot was taken from another machine ({snapshot["config_name"]})')
+
+        # triggers still waiting were meant for the state before
+        self.trigger_queue.clear()
+        self.transition_animator.stop()
+
+        restore(self.machine, self.model, snapshot)
+        for name, allowed in snapshot['conditions_allowed'].items():
+            self.setup_conditions_allowed_slot(name, allowed)
+
+        state = self.find_state_by_path(self.model.state)
+        if state is not None:
+            self.set_current_last_state(state, None)
+        self.update()
+
+    def find_state_by_path(self, full_path):
+        if self.state_by_path is None:
+            self.state_by_path = {self.get_full_path(state): state for state in self.states}
+        return self.state_by_path.get(full_path)
+
     def save_settings(self, settings):
         settings.setValue(f"{self.__class__.__name__}/offset_x", self.offset_x)
         settings.setValue(f"{self.__class__.__name__}/offset_y", self.offset_y)
@@ -235,10 +504,30 @@ class StateMachineWidget(QWidget):
             self.scale_factor = float(scale_factor)
 
     def _adjust_all_states(self):
+        # one bottom-up pass gives the same rects as _adjust_parent() on every state, without
+        # collecting the descendants of every ancestor again and again
         for state in self.states:
-            self._adjust_parent(state)
+            if state.parent is None:
+                self._adjust_subtree(state)
         self.update()
 
+    def _adjust_subtree(self, state):
+        # fits state around its descendants, returns their (min_x, min_y, max_x, max_y) or None
+        extents = None
+        for child in state.children:
+            child_extents = self._adjust_subtree(child)
+            for current in (self._child_extents(child), child_extents):
+                if current is None:
+                    continue
+                if extents is None:
+                    extents = current
+                else:
+                    extents = (min(extents[0], current[0]), min(extents[1], current[1]),
+                               max(extents[2], current[2]), max(extents[3], current[3]))
+        if extents is not None:
+            state.rect = self._parent_rect(*extents)
+        return extents
+
     def _find_the_1st_initial_state(self, state_list, parent_path=None):
         if state_list is None:
             return None
@@ -300,14 +589,11 @@ class StateMachineWidget(QWidget):
         if target_state:
             print(f'Rename state from {target_state.name} to {new_state_name}')
             target_state.name = new_state_name
+            self.state_by_path = None
 
-        for state in self.states:
-            state.outgoing_transitions.clear()
-        self.merged_transitions.clear()
-
-        if self.json_transitions is not None:
-            self._connect_states(self.json_transitions)
-        self._adjust_all_states()
+            self._reconnect_transitions([old_state_name, new_state_name])
+            self._adjust_parent(target_state)
+        self.update()
 
 
     def state_added_slot(self, names):
@@ -322,17 +608,13 @@ class StateMachineWidget(QWidget):
         state = State(state_name, parent=parent_state)
         self.states.append(state)
         parent_state.children.append(state)
+        self.state_by_path = None
 
         self._layout_children(parent_state, parent_state.rect[0] + 20,  parent_state.rect[1] + 20)
 
-
-        for state in self.states:
-            state.outgoing_transitions.clear()
-        self.merged_transitions.clear()
-
-        if self.json_transitions is not None:
-            self._connect_states(self.json_transitions)
-        self._adjust_all_states()
+        self._reconnect_transitions([state_name])
+        self._adjust_parent(state)
+        self.update()
 
     def state_removed_slot(self, names):
         if names is None or len(names) == 0:
@@ -345,44 +627,44 @@ class StateMachineWidget(QWidget):
         else:
             state_name = names[-1]
 
+        removed_state = None
         if parent_chain is None:
             root_states = [state for state in self.states if state.parent is None]
-            for root in root_states[:]:  # 复制一份列表，避免在遍历过程中修改列表导致问题
+            for root in root_states:
                 if root.name == state_name:
-                    print(f'remove {root.name}')
-                    # 递归删除子状态
-                    self._recursive_remove_states(root)
-                    if root in self.states:
-                        self.states.remove(root)
+                    removed_state = root
+                    break
         else:
             parent_state = self.find_state_by_parent_chain(key=parent_chain)
             print(f'#### removed parent_chain={parent_chain} state_name={state_name}, parent_state={parent_state.name}')
 
-            for child in parent_state.children[:]:  # 复制一份列表，避免在遍历过程中修改列表导致问题
+            for child in parent_state.children:
                 if child.name == state_name:
-                    print(f'remove {child.name}')
-                    # 递归删除子状态
-                    self._recursive_remove_states(child)
-                    if child in self.states:
-                        self.states.remove(child)
+                    removed_state = child
                     parent_state.children.remove(child)
                     break
 
-        for state in self.states:
-            state.outgoing_transitions.clear()
-        self.merged_transitions.clear()
-
-        if self.json_transitions is not None:
-            self._connect_states(self.json_transitions)
+        if removed_state is None:
+            return
 
-        self._adjust_all_states()
+        print(f'remove {removed_state.name}')
+        removed_states = [removed_state] + self._get_all_children(removed_state)
+        removed_names = set(state.name for state in removed_states)
+        # 递归删除子状态, one pass over the list instead of one remove() per state
+        removed_states = set(removed_states)
+        self.states = [state for state in self.states if state not in removed_states]
+        self.state_by_path = None
+        self._recursive_remove_states(removed_state)
+
+        self._reconnect_transitions(removed_names)
+        # the removed state still knows its parent, so its former ancestors get re-bounded
+        self._adjust_parent(removed_state)
+        self.update()
 
     def _recursive_remove_states(self, state):
         # 先递归删除子状态
-        for child in state.children[:]:
+        for child in state.children:
             self._recursive_remove_states(child)
-            if child in self.states:
-                self.states.remove(child)
         # 清空当前状态的子状态列表
         state.children = []
 
@@ -493,6 +775,96 @@ class StateMachineWidget(QWidget):
 
     def paintEvent(self, event):
         painter = QPainter(self)
+        self.paint_stats.begin_frame()
+
+        # the updated area in scene coordinates, with some room for pens and arrows
+        rect = QRectF(event.rect())
+        margin = 25
+        visible_rect = QRectF((rect.x() - self.offset_x) / self.scale_factor - margin,
+                              (rect.y() - self.offset_y) / self.scale_factor - margin,
+                              rect.width() / self.scale_factor + margin * 2,
+                              rect.height() / self.scale_factor + margin * 2)
+        self.paint_diagram(painter, visible_rect)
+
+        self.paint_stats.end_frame()
+        if self.debug_overlay_enabled:
+            self.draw_debug_overlay(painter)
+
+    def draw_debug_overlay(self, painter : QPainter):
+        painter.resetTransform()
+        font = QFont('Consolas')
+        font.setStyleHint(QFont.Monospace)
+        font.setPointSize(9)
+        painter.setFont(font)
+
+        lines = self.paint_stats.overlay_lines()
+        font_metrics = QFontMetrics(font)
+        line_height = font_metrics.height()
+        width = max(font_metrics.horizontalAdvance(line) for line in lines) + 16
+        height = line_height * len(lines) + 12
+
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(QColor(0, 0, 0, 170))
+        painter.drawRoundedRect(8, 8, width, height, 6, 6)
+
+        painter.setPen(QPen(QColor(255, 255, 255), 1))
+        for i, line in enumerate(lines):
+            painter.drawText(16, 14 + line_height * (i + 1) - font_metrics.descent(), line)
+
+    def set_debug_overlay(self, enabled):
+        self.debug_overlay_enabled = enabled
+        self.update()
+
+    def start_coverage_session(self, name=None):
+        if self.machine is None:
+            return False
+        self.coverage.start_session(self.machine, name or self.config_name)
+        self.update()
+        return True
+
+    def stop_coverage_session(self):
+        report = self.coverage.stop_session()
+        self.update()
+        return report
+
+    def set_coverage_heat_map(self, enabled):
+        self.coverage_heat_map_enabled = enabled
+        self.update()
+
+    def coverage_heat_values(self):
+        # painting asks on every frame, the heat is only computed again once a counter moved or
+        # the states changed (every change of the states drops state_by_path)
+        if self.coverage_heat_cache is not None:
+            revision, state_by_path, heat = self.coverage_heat_cache
+            if revision == self.coverage.revision and state_by_path is not None and state_by_path is self.state_by_path:
+                return heat
+
+        revision = self.coverage.revision
+        # the tracker knows state paths, the canvas draws State objects
+        state_heat, transition_heat = self.coverage.heat()
+        states = {}
+        for path, heat in state_heat.items():
+            state = self.find_state_by_path(path)
+            if state is not None:
+                states[state] = heat
+        transitions = {}
+        for (source_path, dest_path), heat in transition_heat.items():
+            key = (self.find_state_by_path(source_path), self.find_state_by_path(dest_path))
+            if key in self.merged_transitions:
+                transitions[key] = heat
+        heat = (states, transitions)
+        self.coverage_heat_cache = (revision, self.state_by_path, heat)
+        return heat
+
+    def paint_diagram(self, painter : QPainter, visible_rect=None):
+        # also used to render the diagram offscreen, see diagram_export.py
+        self.cull_rect = visible_rect
+        try:
+            self._paint_diagram(painter)
+        finally:
+            self.cull_rect = None
+
+    def _paint_diagram(self, painter : QPainter):
         painter.setRenderHint(QPainter.Antialiasing)
         
         # black background
@@ -501,6 +873,8 @@ class StateMachineWidget(QWidget):
 
         painter.translate(self.offset_x, self.offset_y)
 
+        self.coverage_heat = self.coverage_heat_values() if self.coverage_heat_map_enabled else None
+
         painter.scale(self.scale_factor, self.scale_factor)
         self.font.setPointSizeF(10*self.scale_factor)
         self.font.setBold(False)
@@ -526,6 +900,8 @@ class StateMachineWidget(QWidget):
             pen_color = Qt.GlobalColor.black
         elif state == self.weak_state:
             painter.setBrush(Qt.GlobalColor.gray)
+        elif self.coverage_heat is not None:
+            painter.setBrush(heat_color(self.coverage_heat[0].get(state), 90))
         elif state.level == 0:
             painter.setBrush(self.root_state_color)
         else:
@@ -536,6 +912,11 @@ class StateMachineWidget(QWidget):
     def set_line_style(self, painter, state, transition_key):
         if self.focus_state is state or self.focus_transition == transition_key:
             pen = QPen(state.color, 4)
+        elif self.coverage_heat is not None:
+            heat = self.coverage_heat[1].get(transition_key)
+            pen = QPen(heat_color(heat), 1 if heat is None else 3)
+            if heat is None:
+                pen.setStyle(Qt.PenStyle.DashLine)
         else:
             pen = QPen(self.opposite_color, 1)
 
@@ -572,6 +953,12 @@ class StateMachineWidget(QWidget):
             new_y = y + font_height
             painter.drawText(x, new_y, conditions)
 
+    def trigger_name_rect(self, x, y, triggers, conditions):
+        # the conditions are drawn under the triggers once the transition has the focus
+        font_height = self.get_text_height()
+        width = max(self.get_text_width(triggers), self.get_text_width(conditions))
+        return QRectF(x, y - font_height, width, font_height * 2)
+
     def set_current_last_state(self, current, last):
 
         self.hightlight_state = current
@@ -583,50 +970,45 @@ class StateMachineWidget(QWidget):
 
     def set_black_theme(self):
         self.root_state_color = QColor('#1d1d1d') # Qt.GlobalColor.black # QColor('#2b2b2b')
+        self.background_color = QColor('#2b2b2b')
         self.opposite_color = Qt.GlobalColor.white
         self.level_colors = LEVEL_COLORS_BLACK_THEME
 
     
     def set_white_theme(self):
         self.root_state_color = QColor('#f4f4f4') # Qt.GlobalColor.white
+        self.background_color = QColor(Qt.GlobalColor.white)
         self.opposite_color = Qt.GlobalColor.black
         self.level_colors = LEVEL_COLORS_WHITE_THEME
 
     def update_final_current_state(self):
 
-        for state in self.states:
-            if self.model.state == self.get_full_path(state):
-                self.hightlight_state = state
+        state = self.find_state_by_path(self.model.state)
+        if state is not None:
+            self.hightlight_state = state
 
         self.update()
-        self.transitions_timer_is_running = False
 
+    def animation_frame_slot(self, phase, source, dest):
+        if phase == 'leave':
+            self.set_current_last_state(current=None, last=source)
+        elif phase == 'cross':
+            self.set_current_last_state(current=dest, last=source)
+        elif phase == 'arrive':
+            self.set_current_last_state(current=dest, last=None)
+        else:
+            self.update_final_current_state()
 
     def set_source_conditions_focus(self, source_name, dest_name, conditions):
-        for key, data in self.merged_transitions.items():
-            _source = data['source']
-            _dest = data['dest']
-
-            source_full_name = self.get_full_path(_source)
-            # dest_full_name = self.get_full_path(_dest)
-
-            conditions_list = data['conditions']
-            if source_full_name == source_name:
-                result = any(_conditions == conditions for _conditions in conditions_list)
-                if result is True:                    
-                    # self.set_start_state(_source)
-                    # print(f'source={_source.name} current={self.current_state.name} source_name={source_name}')
-                    # assert(_source == self.current_state)
-                    if self.animation_enabled is True:
-                        self.transitions_timer.singleShot(150,   lambda current=None,  last=_source:  self.set_current_last_state(current, last))
-                        self.transitions_timer.singleShot(400,   lambda current=_dest, last=_source:  self.set_current_last_state(current, last))
-                        self.transitions_timer.singleShot(650,   lambda current=_dest, last=None:     self.set_current_last_state(current, last))
-                        self.transitions_timer.singleShot(850 ,  lambda current=_dest, last=None:     self.update_final_current_state())
-                    else:
-                        self.set_current_last_state(current=_dest, last=None)
-                        self.transitions_timer.singleShot(0 ,  lambda:self.update_final_current_state())
+        source = self.find_state_by_path(source_name)
+        # an empty dest is a transition back to the source
+        dest = self.find_state_by_path(dest_name) if dest_name else source
+        if source is None or dest is None:
+            return
 
-                    self.transitions_timer_is_running = True
+        data = self.merged_transitions.get((source, dest))
+        if data is not None and conditions in data['conditions']:
+            self.transition_animator.enqueue(source, dest)
 
     def _draw_state(self, painter : QPainter, state):
         # 0. 计算名字锚点长度
@@ -638,24 +1020,32 @@ class StateMachineWidget(QWidget):
         anchor_x, anchor_y, anchor_width, anchor_height = [round(anchor_x), round(anchor_y), round(anchor_width), round(anchor_height)]
         state.name_rect = [anchor_x, anchor_y, anchor_width, anchor_height]
 
-        # 1. 绘制矩形
-        self.set_state_rect_style(painter, state)
+        color_index = min(state.level, len(self.level_colors) - 1)
+        state.color = self.level_colors[color_index]
 
-        radius = 10
         if state.children is None or len(state.children) == 0:
-            painter.drawRoundedRect(round(x), round(y), round(anchor_width+self.rect_2_name_margin*2), round(anchor_height+self.rect_2_name_margin*2), radius, radius)
+            rect = (round(x), round(y), round(anchor_width+self.rect_2_name_margin*2), round(anchor_height+self.rect_2_name_margin*2))
         else:
-            painter.drawRoundedRect(round(x), round(y), round(w), round(h), radius, radius)
-        
-        # 2. 绘制名字矩形
-        color_index = min(state.level, len(self.level_colors) - 1)
-        state.color = self.level_colors[color_index]
-        painter.setBrush(self.level_colors[color_index])
-        painter.drawRect(*state.name_rect)
+            rect = (round(x), round(y), round(w), round(h))
 
-        # 3. 绘制状态名
-        painter.setPen(QPen(QColor(255, 255, 255), 1))
-        painter.drawText(anchor_x + 5, anchor_y + anchor_height - round(self.rect_2_name_margin/2*self.scale_factor), state.name)
+        if self.cull_rect is not None and not self.cull_rect.intersects(QRectF(*rect)):
+            self.paint_stats.states_culled += 1
+        else:
+            self.paint_stats.states_drawn += 1
+
+            # 1. 绘制矩形
+            self.set_state_rect_style(painter, state)
+
+            radius = 10
+            painter.drawRoundedRect(*rect, radius, radius)
+            
+            # 2. 绘制名字矩形
+            painter.setBrush(self.level_colors[color_index])
+            painter.drawRect(*state.name_rect)
+
+            # 3. 绘制状态名
+            painter.setPen(QPen(QColor(255, 255, 255), 1))
+            painter.drawText(anchor_x + 5, anchor_y + anchor_height - round(self.rect_2_name_margin/2*self.scale_factor), state.name)
 
         # 4. 递归绘制子状态
         for child in state.children:
@@ -738,6 +1128,18 @@ class StateMachineWidget(QWidget):
                 radius = 30  # 圆弧半径
                 arc_center_x = start_x + radius
                 arc_center_y = start_y
+
+                text_x = round(arc_center_x) - round(self.get_text_width(triggers) / 2)
+                text_y = round(arc_center_y - radius - 15)  # 上移 15 像素
+
+                if self.cull_rect is not None:
+                    bounds = QRectF(arc_center_x - radius, arc_center_y - radius, radius * 2, radius * 2)
+                    if not self.cull_rect.intersects(bounds.united(self.trigger_name_rect(text_x, text_y, triggers, conditions))):
+                        self.paint_stats.transitions_culled += 1
+                        # still needed by the hit test
+                        data['triggers_pos'] = (text_x, text_y)
+                        continue
+                self.paint_stats.transitions_drawn += 1
                 start_angle = 180 * 16  # 起始角度，16 是 Qt 角度的缩放因子
                 span_angle = -180 * 16  # 跨度角度，负号表示逆时针
                 
@@ -760,9 +1162,6 @@ class StateMachineWidget(QWidget):
                 painter.drawPolygon(QPointF(arrow_x, arrow_y), QPointF(arrow_x1, arrow_y1), QPointF(arrow_x2, arrow_y2))
 
                 # 3. trigger - condition name
-                text_x = round(arc_center_x) - round(self.get_text_width(triggers) / 2)
-                text_y = round(arc_center_y - radius - 15)  # 上移 15 像素
-
                 self.draw_trigger_name(text_x, text_y, painter, source, key, triggers, conditions)
             else:
                 # 1. 曲线 (贝塞尔曲线路径)
@@ -784,6 +1183,18 @@ class StateMachineWidget(QWidget):
                 # 添加三次贝塞尔曲线
                 path.cubicTo(control_x, control_y1, control_x, control_y2, end_x, end_y)
 
+                mid_x = round(path.pointAtPercent(0.5).x()) - round(self.get_text_width(triggers) / 2)
+                mid_y = round(path.pointAtPercent(0.5).y())
+
+                if self.cull_rect is not None:
+                    bounds = path.boundingRect().united(self.trigger_name_rect(mid_x, mid_y - 15, triggers, conditions))
+                    if not self.cull_rect.intersects(bounds):
+                        self.paint_stats.transitions_culled += 1
+                        # still needed by the hit test
+                        data['triggers_pos'] = (mid_x, mid_y - 15)
+                        continue
+                self.paint_stats.transitions_drawn += 1
+
                 self.set_line_style(painter, source, key)
                 
                 painter.drawPath(path)
@@ -800,9 +1211,6 @@ class StateMachineWidget(QWidget):
                 painter.drawPolygon(QPointF(end_x, end_y), QPointF(arrow_x1, arrow_y1), QPointF(arrow_x2, arrow_y2))
 
                 # 3. trigger and condition name
-                mid_x = round(path.pointAtPercent(0.5).x()) - round(self.get_text_width(triggers) / 2)
-                mid_y = round(path.pointAtPercent(0.5).y())
-
                 self.draw_trigger_name(mid_x, mid_y - 15, painter, source, key, triggers, conditions)
 
 
@@ -969,7 +1377,11 @@ class StateMachineWidget(QWidget):
             self.focus_transition = None
             self.focus_state = None
 
+        hit_test_start = time.perf_counter()
         state = self.inside_the_state(event.x(), event.y())
+        transition = self.above_the_transition(event.x(), event.y())
+        self.paint_stats.record_hit_test(time.perf_counter() - hit_test_start)
+
         if state is not None:
 
             if event.button() == Qt.LeftButton:
@@ -979,7 +1391,6 @@ class StateMachineWidget(QWidget):
 
             self.focus_state = state
 
-        transition = self.above_the_transition(event.x(), event.y())
         if transition is not None:
             transition_key, triggers, connditions_list = transition
             self.focus_transition = transition_key
@@ -992,6 +1403,8 @@ class StateMachineWidget(QWidget):
         self.update()
 
     def mouseMoveEvent(self, event):
+        # panning and dragging are timed for the paint stats, the scan of the states included
+        move_start = time.perf_counter()
         if self.is_dragging_all:
             dx = event.x() - self.last_pos.x()
             dy = event.y() - self.last_pos.y()
@@ -1028,6 +1441,7 @@ class StateMachineWidget(QWidget):
                     state.drag_start_y = event.y()
 
                     self.update()
+        self.paint_stats.record_mouse_move(time.perf_counter() - move_start)
 
     def _move_children(self, parent, dx, dy):
         for child in parent.children:
@@ -1049,42 +1463,36 @@ class StateMachineWidget(QWidget):
 
                 # 遍历所有子元素
                 for child in all_children:
-                    # 更新 min_x
-                    if child.rect[0] < min_x:
-                        min_x = child.rect[0]
-                    # 更新 min_y
-                    if child.rect[1] < min_y:
-                        min_y = child.rect[1]
-                    # 更新 max_x
-                    if child.children is None or len(child.children) == 0:
-                        current_max_x = child.rect[0] + self.get_text_width(child.name) + self.rect_2_name_margin*3
-                        if current_max_x > max_x:
-                            max_x = current_max_x
-                        # 更新 max_y
-                        current_max_y = round(child.rect[1]) + round(self.get_text_height()+self.rect_2_name_margin*2)
-                        if current_max_y > max_y:
-                            max_y = current_max_y
+                    child_min_x, child_min_y, child_max_x, child_max_y = self._child_extents(child)
+                    min_x = min(min_x, child_min_x)
+                    min_y = min(min_y, child_min_y)
+                    max_x = max(max_x, child_max_x)
+                    max_y = max(max_y, child_max_y)
 
-                    else:
-                        current_max_x = child.rect[0] + child.rect[2]
-                        if current_max_x > max_x:
-                            max_x = current_max_x
-                        # 更新 max_y
-                        current_max_y = child.rect[1] + child.rect[3]
-                        if current_max_y > max_y:
-                            max_y = current_max_y
-
-                # 增加一些边距
-                margin = 10
-                name_y_margin = 50
-                new_x = min_x - margin
-                new_y = min_y - margin - name_y_margin
-                new_w = max_x - new_x + margin
-                new_h = max_y - new_y + margin
-
-                parent.rect = (new_x, new_y, new_w, new_h)
+                parent.rect = self._parent_rect(min_x, min_y, max_x, max_y)
             parent = parent.parent
 
+    def _child_extents(self, child):
+        min_x = child.rect[0]
+        min_y = child.rect[1]
+        if child.children is None or len(child.children) == 0:
+            max_x = child.rect[0] + self.get_text_width(child.name) + self.rect_2_name_margin*3
+            max_y = round(child.rect[1]) + round(self.get_text_height()+self.rect_2_name_margin*2)
+        else:
+            max_x = child.rect[0] + child.rect[2]
+            max_y = child.rect[1] + child.rect[3]
+        return min_x, min_y, max_x, max_y
+
+    def _parent_rect(self, min_x, min_y, max_x, max_y):
+        # 增加一些边距
+        margin = 10
+        name_y_margin = 50
+        new_x = min_x - margin
+        new_y = min_y - margin - name_y_margin
+        new_w = max_x - new_x + margin
+        new_h = max_y - new_y + margin
+        return (new_x, new_y, new_w, new_h)
+
     def _get_all_children(self, state):
         all_children = []
         for child in state.children:
@@ -1186,60 +1594,37 @@ class StateMachineWidget(QWidget):
 
     def _load_states(self):
         try:
-            with open(self.STATES_CONFIG, 'r') as f:
-                return json.load(f)
-        except FileNotFoundError:
-            return None
+            return read_states_file(self.STATES_CONFIG)
         except json.JSONDecodeError:
-            text = f'File {self.STATES_CONFIG} is not an valid JSON'
-            print(text)
-            self.warning_error_msg_box.setText(text)
-            self.warning_error_msg_box.setWindowTitle('Warning')
-            self.warning_error_msg_box.show()
+            self.show_invalid_json_warning(self.STATES_CONFIG)
+            return None
 
     def _load_transitions(self):
-        merged_json = []
-        try:
-            # 遍历指定目录下的所有文件
-            for filename in os.listdir(self.TRANSITIONS_CONFIG_FOLDER):
-                if filename.endswith('.json'):
-                    file_path = os.path.join(self.TRANSITIONS_CONFIG_FOLDER, filename)
-                    try:
-                        with open(file_path, 'r') as f:
-                            data = json.load(f)
-                            merged_json.extend(data)
-                    except FileNotFoundError:
-                        print(f"文件 {file_path} 未找到。")
-                    except json.JSONDecodeError:
-                        text = f'File {file_path} is not an valid JSON'
-                        print(text)
-                        self.warning_error_msg_box.setText(text)
-                        self.warning_error_msg_box.setWindowTitle('Warning')
-                        self.warning_error_msg_box.show()
-            return merged_json
-        except FileNotFoundError:
-            return None
+        merged_json, invalid_files = read_transitions_folder(self.TRANSITIONS_CONFIG_FOLDER)
+        for file_path in invalid_files:
+            self.show_invalid_json_warning(file_path)
+        return merged_json
+
+    def show_invalid_json_warning(self, file_path):
+        text = f'File {file_path} is not an valid JSON'
+        print(text)
+        self.warning_error_msg_box.setText(text)
+        self.warning_error_msg_box.setWindowTitle('Warning')
+        self.warning_error_msg_box.show()
 
     def _connect_states(self, transitions):
-        for transition in transitions:
-
-            source_name = transition['source']
-            dest_name = transition['dest']
-            trigger = transition['trigger']
-            conditions = transition['conditions']
-
-            if len(dest_name) == 0:
-                dest_name = source_name
+        # transition_links[i] is the (source, dest) states transition i is drawn between, and
+        # transition_segments maps every state name used in a source/dest path to the transitions
+        # using it, so an edit of the states only has to reconnect the transitions it can affect
+        self.transition_links = [None] * len(transitions)
+        self.transition_segments = {}
 
-            source_state = self._find_state_by_name(source_name)
-            dest_state = self._find_state_by_name(dest_name)
+        for index, transition in enumerate(transitions):
+            for name in (transition['source'], transition['dest']):
+                for segment in name.split('_'):
+                    self.transition_segments.setdefault(segment, set()).add(index)
 
-            if source_state and dest_state:
-                source_state.outgoing_transitions.append({
-                    'trigger': trigger,
-                    'dest': dest_state,
-                    'conditions': conditions
-                })
+            self._link_transition(index, transition)
 
         for state in self.states:
             for transition in state.outgoing_transitions:
@@ -1257,6 +1642,70 @@ class StateMachineWidget(QWidget):
                     self.merged_transitions[key]['triggers'].append(transition['trigger'])
                     self.merged_transitions[key]['conditions'].append(transition['conditions'])
 
+    def _link_transition(self, index, transition):
+        source_name = transition['source']
+        dest_name = transition['dest']
+        trigger = transition['trigger']
+        conditions = transition['conditions']
+
+        if len(dest_name) == 0:
+            dest_name = source_name
+
+        source_state = self._find_state_by_name(source_name)
+        dest_state = self._find_state_by_name(dest_name)
+
+        link = None
+        if source_state and dest_state:
+            source_state.outgoing_transitions.append({
+                'trigger': trigger,
+                'dest': dest_state,
+                'conditions': conditions,
+                'index': index
+            })
+            link = (source_state, dest_state)
+        self.transition_links[index] = link
+        return link
+
+    def _reconnect_transitions(self, state_names):
+        if self.json_transitions is None:
+            return
+
+        indices = set()
+        for name in state_names:
+            indices.update(self.transition_segments.get(name, ()))
+
+        changed_keys = set()
+        changed_sources = set()
+        for index in indices:
+            old_link = self.transition_links[index]
+            if old_link is not None:
+                source = old_link[0]
+                source.outgoing_transitions = [transition for transition in source.outgoing_transitions if transition['index'] != index]
+                changed_keys.add(old_link)
+
+            new_link = self._link_transition(index, self.json_transitions[index])
+            if new_link is not None:
+                changed_keys.add(new_link)
+                changed_sources.add(new_link[0])
+
+        # keep the order of the transitions files, like a full _connect_states() does
+        for source in changed_sources:
+            source.outgoing_transitions.sort(key=lambda transition: transition['index'])
+
+        for key in changed_keys:
+            self._merge_transitions(key)
+
+    def _merge_transitions(self, key):
+        source, dest = key
+        transitions = [transition for transition in source.outgoing_transitions if transition['dest'] is dest]
+        if len(transitions) == 0:
+            self.merged_transitions.pop(key, None)
+            return
+
+        data = self.merged_transitions.setdefault(key, {'source': source, 'dest': dest})
+        data['triggers'] = [transition['trigger'] for transition in transitions]
+        data['conditions'] = [transition['conditions'] for transition in transitions]
+
     def _find_state_by_name(self, name, current_states=None):
         if current_states is None:
             current_states = self.states
@@ -1285,32 +1734,40 @@ class StateMachineWidget(QWidget):
         return full_path
 
     def trigger_transition(self, trigger):
-        # to clear all the focus
+        # safe to call from any thread, returns a Future with the result of the trigger
+        return self.trigger_queue.submit(trigger)
+
+    def clear_focus_slot(self):
         self.focus_transition = None
         self.focus_state = None
+        self.update()
 
-        try:
-            if self.transitions_timer_is_running is True:
-                # print(f'transitions_timer_is_running={self.transitions_timer_is_running}')
-                # self.warning_error_msg_box.setText('Slow down, it\'s processing.')
-                # self.warning_error_msg_box.setWindowTitle('Oops')
-                # self.warning_error_msg_box.exec()
-                return
+    def run_trigger(self, trigger):
+        # to clear all the focus, on the GUI thread when the trigger runs in the worker
+        self.clear_focus_signal.emit()
 
-            actions = []
-            custom_trigger = get_attr_optional(self.custom_matter, trigger)
-            if custom_trigger is not None:
-                custom_trigger(actions)
+        self.trigger_local.in_trigger = True
+        try:
+            with self.profiler.trigger(trigger):
+                actions = []
+                custom_trigger = get_attr_optional(self.custom_matter, trigger)
+                if custom_trigger is not None:
+                    custom_trigger(actions)
 
-            self.called_trigger_signal.emit(trigger, actions)
-            getattr(self.model, trigger)()
+                self.called_trigger_events.emit(trigger, actions)
+                result = getattr(self.model, trigger)()
 
             # 重绘界面以更新当前状态显示
-            self.update()
+            self.repaint_signal.emit()
+            return result
         except AttributeError as e:
             print(f"Invalid trigger: {trigger}")
         except MachineError as e:
             print(f"Invalid trigger: {trigger} {e}")
+        finally:
+            self.trigger_local.in_trigger = False
+            self.flush_events()
+        return None
 
     def create_conditions_function(self, old_name, return_code, signal):
 
@@ -1321,7 +1778,7 @@ class StateMachineWidget(QWidget):
             signal.emit(source, dest, old_name, return_code, [])
             return return_code
         new_conditions_function.__name__ = old_name
-        return new_conditions_function
+        return self.profiled(old_name, new_conditions_function)
     
     def create_custom_conditions_function(self, old_name, custom_conditions, signal):
         def new_conditions_function(self, event: EventData):
@@ -1337,7 +1794,7 @@ class StateMachineWidget(QWidget):
             signal.emit(source, dest, old_name, return_code, actions)
             return return_code
         new_conditions_function.__name__ = old_name
-        return new_conditions_function
+        return self.profiled(old_name, new_conditions_function)
 
     def create_custom_enter_state_function(self, old_name, custom_gate, signal):
         def enter_state_function(self, event: EventData):
@@ -1348,7 +1805,7 @@ class StateMachineWidget(QWidget):
             custom_gate(actions)
             signal.emit(source, dest, old_name, actions)
         enter_state_function.__name__ = old_name
-        return enter_state_function
+        return self.profiled(old_name, enter_state_function)
     
     def create_custom_exit_state_function(self, old_name, custom_gate, signal):
         def exit_state_function(self, event: EventData):
@@ -1359,7 +1816,7 @@ class StateMachineWidget(QWidget):
             custom_gate(actions)
             signal.emit(source, dest, old_name, actions)
         exit_state_function.__name__ = old_name
-        return exit_state_function
+        return self.profiled(old_name, exit_state_function)
     
 
     def create_enter_state_function(self, old_name, signal):
@@ -1378,44 +1835,66 @@ class StateMachineWidget(QWidget):
         exit_state_function.__name__ = old_name
         return exit_state_function
     
+    def hot_swap_custom_matter(self, custom_matter, old_functions):
+        # the machine and its current state stay, only the wrappers of the functions that were
+        # added, removed or edited in the custom matter get rebound
+        new_functions = get_matter_functions(custom_matter)
+        changed_names = set()
+        for name in old_functions.keys() | new_functions.keys():
+            if name not in old_functions or name not in new_functions or old_functions[name].__code__ != new_functions[name].__code__:
+                changed_names.add(name)
+
+        self.custom_matter = custom_matter
+
+        for name in changed_names:
+            if name in self.enter_function_names:
+                self.setup_enter_state_function(name)
+            if name in self.exit_function_names:
+                self.setup_exit_state_function(name)
+            if name in self.conditions_allowed:
+                self.setup_conditions_allowed_slot(name, self.conditions_allowed[name])
+
+        return sorted(changed_names)
+
     def setup_enter_state_function(self, enter_state_function_name):
+        self.enter_function_names.add(enter_state_function_name)
         custom_gate = get_attr_optional(self.custom_matter, enter_state_function_name)
         if custom_gate is not None:
-            new_func = self.create_custom_enter_state_function(enter_state_function_name, custom_gate, self.called_enter_state_signal)
+            new_func = self.create_custom_enter_state_function(enter_state_function_name, custom_gate, self.called_enter_state_events)
         else:
-            new_func = self.create_enter_state_function(enter_state_function_name, self.called_enter_state_signal)
-        setattr(Matter, enter_state_function_name, new_func)
+            new_func = self.create_enter_state_function(enter_state_function_name, self.called_enter_state_events)
+        setattr(self.matter_class, enter_state_function_name, new_func)
 
     def setup_exit_state_function(self, exit_state_function_name):
+        self.exit_function_names.add(exit_state_function_name)
         custom_gate = get_attr_optional(self.custom_matter, exit_state_function_name)
         if custom_gate is not None:
-            new_func = self.create_custom_exit_state_function(exit_state_function_name, custom_gate, self.called_enter_state_signal)
+            new_func = self.create_custom_exit_state_function(exit_state_function_name, custom_gate, self.called_enter_state_events)
         else:
-            new_func = self.create_exit_state_function(exit_state_function_name, self.called_exit_state_signal)
-        setattr(Matter, exit_state_function_name, new_func)
+            new_func = self.create_exit_state_function(exit_state_function_name, self.called_exit_state_events)
+        setattr(self.matter_class, exit_state_function_name, new_func)
 
     def setup_conditions_allowed_slot(self, conditions, allowed):
         if conditions is None:
             return
 
+        self.conditions_allowed[conditions] = allowed
         custom_conditions = get_attr_optional(self.custom_matter, conditions)
         if custom_conditions is not None:
-            new_func = self.create_custom_conditions_function(conditions, custom_conditions, self.called_condition_signal)
+            new_func = self.create_custom_conditions_function(conditions, custom_conditions, self.called_condition_events)
         else:
-            new_func = self.create_conditions_function(conditions, bool(allowed.lower() == 'yes'), self.called_condition_signal)
+            new_func = self.create_conditions_function(conditions, bool(allowed.lower() == 'yes'), self.called_condition_events)
 
-        setattr(Matter, conditions, new_func)
+        setattr(self.matter_class, conditions, new_func)
 
     def focus_slot(self, function_type, focus_name):
         if function_type == FunctionType.state:
-            state_name = focus_name[0]
-            for state in self.states:
-                full_path = self.get_full_path(state)
-                if full_path == state_name:
-                    self.focus_state = state
-                    self.focus_transition = None
-                    self.update()
-                    return
+            state = self.find_state_by_path(focus_name[0])
+            if state is not None:
+                self.focus_state = state
+                self.focus_transition = None
+                self.update()
+                return
 
         elif function_type == FunctionType.trigger:
             source_name = focus_name[0]
@@ -1423,19 +1902,8 @@ class StateMachineWidget(QWidget):
 
             print(f'source_name={source_name} dest_name={dest_name}')
 
-            source = None
-            dest = None
-
-            for state in self.states:
-                full_path = self.get_full_path(state)
-                if full_path == source_name:
-                    source = state
-                    for state in self.states:
-                        full_path = self.get_full_path(state)
-                        if full_path == dest_name:
-                            dest = state
-                            break
-                    break
+            source = self.find_state_by_path(source_name)
+            dest = self.find_state_by_path(dest_name)
             if source is not None and dest is not None:
                 self.focus_transition = (source, dest)
                 self.focus_state = None
@@ -1443,18 +1911,33 @@ class StateMachineWidget(QWidget):
                 return
 
     def get_text_width(self, text):
-        new_font = QFont(self.font.family(), self.font.pointSize(), self.font.weight(), self.font.italic())
-        new_font.setBold(False)
-        font_metrics = QFontMetrics(new_font)
-        text_length = font_metrics.horizontalAdvance(text)
-        return text_length
+        return self._text_metrics(text)
 
     def get_text_height(self):
+        return self._text_metrics(None)
+
+    def _text_metrics(self, text):
+        # the bold flag is dropped below, so the weight is not part of the key
+        key = (self.font.family(), self.font.pointSize(), self.font.italic(), text)
+        value = self.text_metrics_cache.get(key)
+        if value is not None:
+            self.paint_stats.font_cache_hits += 1
+            return value
+        self.paint_stats.font_cache_misses += 1
+
         new_font = QFont(self.font.family(), self.font.pointSize(), self.font.weight(), self.font.italic())
         new_font.setBold(False)
         font_metrics = QFontMetrics(new_font)
-        font_height = font_metrics.height()
-        return font_height
+        if text is None:
+            value = font_metrics.height()
+        else:
+            value = font_metrics.horizontalAdvance(text)
+
+        # zooming goes through many point sizes, keep it bounded
+        if len(self.text_metrics_cache) > 8192:
+            self.text_metrics_cache.clear()
+        self.text_metrics_cache[key] = value
+        return value
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -1466,7 +1949,9 @@ class MainWindow(QMainWindow):
         self.setWindowIcon(QIcon('sm.png'))
         self.settings = QSettings("Philips", app_name)
 
+
         self.json_viewer = StateMachineJsonViewer()
+        self.profiler_panel = None
 
         self.sm_border_widget = QWidget(self)
         self.sm_border_widget.setLayout(QVBoxLayout())
@@ -1480,39 +1965,42 @@ class MainWindow(QMainWindow):
 
         # state machine
         self.state_machine = StateMachineWidget(icon=self.windowIcon())
-        self.state_machine.called_trigger_signal.connect(self.trigger_name_slot)
+        self.state_machine.called_events_signal.connect(self.events_slot)
+
+        # all timeout states fire from the Qt event loop, and run where the triggers run
+        self.timeout_driver = QtTimeoutDriver(self, self.state_machine.trigger_queue.run_callback)
+        get_timeout_scheduler().set_driver(self.timeout_driver)
 
-        self.state_machine.called_condition_signal.connect(self.condition_message_slot)
-        self.state_machine.called_enter_state_signal.connect(self.enter_state_message_slot)
-        self.state_machine.called_exit_state_signal.connect(self.exit_state_message_slot)
 
         self.state_machine.called_set_initial_state_signal.connect(self.state_machine_init_slot)
         self.state_machine.called_new_state_machine_signal.connect(self.new_state_machine_slot)
 
-        self.state_machine.reload_config(self.config_page.config_name_combobox.currentText(),
-                                         self.config_page.main_resource_input.text(), 
-                                         self.config_page.secondary_resource_input.text(),
-                                         self.config_page.enable_default_enter_checkbox.isChecked(),
-                                         self.config_page.enable_default_exit_checkbox.isChecked(),
-                                         self.config_page.get_matter_lib())
+        # with fast start the window is shown first and the machine is loaded afterwards
+        self.fast_start = self.config_page.fast_start_checkbox.isChecked()
+        self.loader = None
+
+        # before the first load, the machine is built with it
+        self.state_machine.set_machine_backend(MachineBackend(self.config_page.machine_backend_options.currentIndex()))
+
+        if not self.fast_start:
+            self.state_machine.reload_config(self.config_page.config_name_combobox.currentText(),
+                                             self.config_page.main_resource_input.text(), 
+                                             self.config_page.secondary_resource_input.text(),
+                                             self.config_page.enable_default_enter_checkbox.isChecked(),
+                                             self.config_page.enable_default_exit_checkbox.isChecked(),
+                                             self.config_page.get_matter_lib())
         
         self.state_machine.set_animation(bool(self.config_page.animation_options.currentIndex()))
+        self.state_machine.set_animation_speed(ANIMATION_SPEEDS[self.config_page.animation_speed_options.currentIndex()])
+        self.state_machine.set_trigger_queue_policy(TriggerPolicy(self.config_page.trigger_queue_options.currentIndex()))
+        self.state_machine.set_worker_thread(bool(self.config_page.callback_thread_options.currentIndex()))
 
         # table view
         self.table_view_w_search = TableViewContainsSearchWidget()
 
-        if self.state_machine.json_transitions is not None:
-            self.table_view_w_search.set_transitions(self.config_page.config_name_combobox.currentText(), self.state_machine.json_transitions)
-            for row, transition in enumerate(self.state_machine.json_transitions):
-                condition = transition['conditions']
-                self.state_machine.setup_conditions_allowed_slot(condition, 'Yes')
-        else:
-            self.table_view_w_search.clear_transitions()
-        
-        self._load_conditions_allowed()
-
-        if self.state_machine.json_states is not None:
-            self.json_viewer.set_json_data(self.state_machine.json_states)
+        if not self.fast_start:
+            self.populate_transitions_table()
+            self.populate_json_viewer()
 
         # theme
         self.set_theme(Theme(self.config_page.theme_options.currentIndex()))
@@ -1608,6 +2096,36 @@ class MainWindow(QMainWindow):
         settings_action = file_menu.addAction("Configure")
         settings_action.setShortcut('Ctrl+G')
         settings_action.triggered.connect(self.open_config_page)
+        profiler_action = file_menu.addAction("Profiler")
+        profiler_action.setShortcut('Ctrl+P')
+        profiler_action.triggered.connect(self.open_profiler_panel)
+        validate_action = file_menu.addAction("Validate")
+        validate_action.setShortcut('Ctrl+Shift+V')
+        validate_action.triggered.connect(self.show_validation_slot)
+        file_menu.addSeparator()
+        debug_overlay_action = file_menu.addAction("Debug Overlay")
+        debug_overlay_action.setShortcut('Ctrl+Shift+D')
+        debug_overlay_action.setCheckable(True)
+        debug_overlay_action.toggled.connect(self.state_machine.set_debug_overlay)
+        self.record_paint_stats_action = file_menu.addAction("Record Paint Stats...")
+        self.record_paint_stats_action.setCheckable(True)
+        self.record_paint_stats_action.toggled.connect(self.record_paint_stats_slot)
+        file_menu.addSeparator()
+        self.coverage_session_action = file_menu.addAction("Coverage Session")
+        self.coverage_session_action.setShortcut('Ctrl+Shift+C')
+        self.coverage_session_action.setCheckable(True)
+        self.coverage_session_action.toggled.connect(self.coverage_session_slot)
+        coverage_heat_map_action = file_menu.addAction("Coverage Heat Map")
+        coverage_heat_map_action.setShortcut('Ctrl+Shift+H')
+        coverage_heat_map_action.setCheckable(True)
+        coverage_heat_map_action.toggled.connect(self.state_machine.set_coverage_heat_map)
+        save_coverage_action = file_menu.addAction("Save Coverage Sessions...")
+        save_coverage_action.triggered.connect(self.save_coverage_slot)
+        file_menu.addSeparator()
+        save_snapshot_action = file_menu.addAction("Save Snapshot...")
+        save_snapshot_action.triggered.connect(self.save_snapshot_slot)
+        restore_snapshot_action = file_menu.addAction("Restore Snapshot...")
+        restore_snapshot_action.triggered.connect(self.restore_snapshot_slot)
         menubar.addMenu(file_menu)
 
         # load settings
@@ -1617,7 +2135,13 @@ class MainWindow(QMainWindow):
         self.table_view_w_search.trigger_signal.connect(self.trigger_slot)
         self.config_page.config_changed_signal.connect(self.reload_config)
         self.config_page.animation_changed_signal.connect(self.state_machine.set_animation)
+        self.config_page.animation_speed_changed_signal.connect(self.state_machine.set_animation_speed)
+        self.config_page.trigger_queue_policy_changed_signal.connect(self.state_machine.set_trigger_queue_policy)
+        self.config_page.worker_thread_changed_signal.connect(self.state_machine.set_worker_thread)
+        self.config_page.machine_backend_changed_signal.connect(self.state_machine.set_machine_backend)
+        self.state_machine.coverage_stopped_signal.connect(lambda report: self.coverage_session_action.setChecked(False))
         self.config_page.theme_changed_signal.connect(self.set_theme)
+        self.config_page.custom_matter_changed_signal.connect(self.hot_reload_custom_matter_slot)
 
         # self.table_view_w_search.init_state_signal.connect(self.init_state_slot)
         self.table_view_w_search.table_view.condition_allowed_changed.connect(self.state_machine.setup_conditions_allowed_slot)
@@ -1631,8 +2155,31 @@ class MainWindow(QMainWindow):
         self.json_viewer.state_removed_signal.connect(self.state_machine.state_removed_slot)
         self.json_viewer.state_rename_signal.connect(self.state_machine.state_rename_slot)
 
+        # progress of the loading in fast start
+        self.loading_progress = QProgressBar()
+        self.loading_progress.setMaximumWidth(300)
+        self.loading_progress.setTextVisible(True)
+        self.loading_progress.hide()
+        self.statusBar().addPermanentWidget(self.loading_progress)
+
         timer = QTimer()
-        timer.singleShot(100, self.state_machine._adjust_all_states)
+        if self.fast_start:
+            self.start_deferred_loading()
+        else:
+            timer.singleShot(100, self.state_machine._adjust_all_states)
+
+    def events_slot(self, events):
+        event_slots = {
+            'trigger': self.trigger_name_slot,
+            'condition': self.condition_message_slot,
+            'enter': self.enter_state_message_slot,
+            'exit': self.exit_state_message_slot,
+        }
+        # one append to the log for the whole batch
+        with self.text_edit.batched_append():
+            for kind, args, log_time in events:
+                self.text_edit.log_time = log_time
+                event_slots[kind](*args)
 
     def trigger_name_slot(self, trigger, actions=None):
         self.text_edit.append_log(object_name=self.config_page.config_name_combobox.currentText(),
@@ -1699,9 +2246,13 @@ class MainWindow(QMainWindow):
 
 
     def reload_config(self):
-        self._save_conditions_allowed()
+        if self.is_loading():
+            # nothing was loaded yet that could be saved
+            self.cancel_deferred_loading()
+        else:
+            self._save_conditions_allowed()
+            self.state_machine._save_state_positions()
 
-        self.state_machine._save_state_positions()
         self.state_machine.reload_config(self.config_page.config_name_combobox.currentText(),
                                          self.config_page.main_resource_input.text(), 
                                          self.config_page.secondary_resource_input.text(),
@@ -1709,19 +2260,93 @@ class MainWindow(QMainWindow):
                                          self.config_page.enable_default_exit_checkbox.isChecked(),
                                          self.config_page.get_matter_lib())
 
+        self.populate_transitions_table()
+        self.populate_json_viewer()
+
+    def populate_transitions_table(self):
         if self.state_machine.json_transitions is not None:
             self.table_view_w_search.set_transitions(self.config_page.config_name_combobox.currentText(), self.state_machine.json_transitions)
-            for row, transition in enumerate(self.state_machine.json_transitions):
-                condition = transition['conditions']
+            for condition in dict.fromkeys(transition['conditions'] for transition in self.state_machine.json_transitions):
                 self.state_machine.setup_conditions_allowed_slot(condition, 'Yes')
         else:
             self.table_view_w_search.clear_transitions()
 
         self._load_conditions_allowed()
 
+    def populate_json_viewer(self):
         if self.state_machine.json_states is not None:
             self.json_viewer.set_json_data(self.state_machine.json_states)
 
+    def start_deferred_loading(self):
+        states_config = self.config_page.main_resource_input.text()
+        transitions_config_folder = self.config_page.secondary_resource_input.text()
+
+        def build_machine(preloaded):
+            # keep the view restored by load_settings(), loading resets it
+            view = (self.state_machine.offset_x, self.state_machine.offset_y)
+            try:
+                self.state_machine.load_machine(self.config_page.config_name_combobox.currentText(),
+                                                states_config,
+                                                transitions_config_folder,
+                                                self.config_page.enable_default_enter_checkbox.isChecked(),
+                                                self.config_page.enable_default_exit_checkbox.isChecked(),
+                                                self.config_page.get_matter_lib(),
+                                                preloaded=preloaded)
+            finally:
+                self.state_machine.offset_x, self.state_machine.offset_y = view
+            self.state_machine._adjust_all_states()
+
+        self.loader = DeferredLoader(self)
+        self.loader.add_step('Reading the config files', lambda result: read_machine_files(states_config, transitions_config_folder), background=True)
+        self.loader.add_step('Building the state machine', build_machine)
+        self.loader.add_step('Loading the transitions table', lambda result: self.populate_transitions_table())
+        self.loader.add_step('Loading the JSON tree', lambda result: self.populate_json_viewer())
+        self.loader.progress_signal.connect(self.loading_progress_slot)
+        self.loader.finished_signal.connect(self.loading_finished_slot)
+        self.loader.failed_signal.connect(self.loading_failed_slot)
+        self.loader.start()
+
+    def is_loading(self):
+        return self.loader is not None and self.loader.is_running()
+
+    def cancel_deferred_loading(self):
+        if self.loader is not None:
+            self.loader.cancel()
+            self.loader = None
+        self.loading_progress.hide()
+
+    def loading_progress_slot(self, done, total, label):
+        self.loading_progress.setMaximum(total)
+        self.loading_progress.setValue(done)
+        self.loading_progress.setFormat(f'{label} %v/%m' if label else '%v/%m')
+        self.loading_progress.show()
+
+    def loading_finished_slot(self):
+        self.loader = None
+        self.loading_progress.hide()
+
+    def loading_failed_slot(self, label, error):
+        self.cancel_deferred_loading()
+        self.state_machine.warning_error_msg_box.setText(f'{label}: {error}')
+        self.state_machine.warning_error_msg_box.setWindowTitle('Error')
+        self.state_machine.warning_error_msg_box.exec()
+
+
+    def hot_reload_custom_matter_slot(self):
+        old_functions = get_matter_functions(self.state_machine.custom_matter)
+        try:
+            custom_matter = self.config_page.get_matter_lib()
+        except Exception as e:
+            # keep running with the functions loaded before, the next save will try again
+            print(f'hot reload failed: {e}')
+            return
+        if custom_matter is None:
+            return
+
+        changed_names = self.state_machine.hot_swap_custom_matter(custom_matter, old_functions)
+        self.text_edit.append_log(object_name=self.config_page.config_name_combobox.currentText(),
+                                  function_name='HotReload',
+                                  function_params=changed_names)
 
     def set_theme(self, current_theme):
         # print(f'current_theme={current_theme}')
@@ -2008,6 +2633,107 @@ class MainWindow(QMainWindow):
         self.config_page.show()
         self.config_page.activateWindow()
 
+    def open_profiler_panel(self):
+        if self.profiler_panel is None:
+            self.profiler_panel = ProfilerPanel(self.state_machine.profiler, self.state_machine.set_profiling, icon=self.windowIcon())
+        self.profiler_panel.show()
+        self.profiler_panel.activateWindow()
+
+    def show_validation_slot(self):
+        # the issues found when the config was loaded, python machine_validator.py checks without the app
+        issues = self.state_machine.validation_issues
+        msg_box = QMessageBox(self)
+        msg_box.setWindowTitle('Validate')
+        if not issues:
+            msg_box.setIcon(QMessageBox.Information)
+            msg_box.setText('No issue found in the states and transitions.')
+        else:
+            has_error = any(issue.severity == ERROR for issue in issues)
+            msg_box.setIcon(QMessageBox.Warning if has_error else QMessageBox.Information)
+            msg_box.setText(summarize(issues))
+            lines = [format_issue(issue) for issue in issues[:1000]]
+            if len(issues) > len(lines):
+                lines.append(f'... {len(issues) - len(lines)} more')
+            msg_box.setDetailedText('\n'.join(lines))
+        msg_box.exec()
+
+    def record_paint_stats_slot(self, checked):
+        paint_stats = self.state_machine.paint_stats
+        if not checked:
+            paint_stats.stop_recording()
+            self.state_machine.update()
+            return
+
+        file_path, _ = QFileDialog.getSaveFileName(self, "Record Paint Stats", "paint_stats.csv", "CSV File (*.csv)")
+        if not file_path:
+            self.record_paint_stats_action.setChecked(False)
+            return
+        try:
+            paint_stats.start_recording(file_path)
+        except OSError as e:
+            self.record_paint_stats_action.setChecked(False)
+            QMessageBox.warning(self, 'Warning', f'{e}')
+            return
+        self.state_machine.update()
+
+    def coverage_session_slot(self, checked):
+        if checked:
+            if not self.state_machine.start_coverage_session():
+                self.coverage_session_action.setChecked(False)
+            return
+
+        report = self.state_machine.stop_coverage_session()
+        if report is None:
+            return
+        msg_box = QMessageBox(self)
+        msg_box.setWindowTitle('Coverage')
+        msg_box.setIcon(QMessageBox.Information)
+        text = format_report(report, limit=1000)
+        msg_box.setText('\n'.join(text.split('\n')[:3]))
+        msg_box.setDetailedText(text)
+        msg_box.exec()
+
+    def save_coverage_slot(self):
+        coverage = self.state_machine.coverage
+        if not coverage.sessions and not coverage.is_running():
+            QMessageBox.information(self, 'Coverage', 'No coverage session yet.')
+            return
+        file_path, _ = QFileDialog.getSaveFileName(self, "Save Coverage Sessions", "coverage.json", "Json File (*.json)")
+        if not file_path:
+            return
+        try:
+            coverage.save_sessions(file_path)
+        except OSError as e:
+            QMessageBox.warning(self, 'Warning', f'{e}')
+
+    def save_snapshot_slot(self):
+        try:
+            snapshot = self.state_machine.take_snapshot()
+        except SnapshotError as e:
+            QMessageBox.warning(self, 'Warning', f'{e}')
+            return
+        if snapshot is None:
+            return
+        file_path, _ = QFileDialog.getSaveFileName(self, "Save Snapshot", f'{self.state_machine.config_name}.smsnap', "Snapshot (*.smsnap)")
+        if not file_path:
+            return
+        try:
+            write_snapshot(file_path, snapshot)
+        except (OSError, SnapshotError) as e:
+            QMessageBox.warning(self, 'Warning', f'{e}')
+
+    def restore_snapshot_slot(self):
+        file_path, _ = QFileDialog.getOpenFileName(self, "Restore Snapshot", "", "Snapshot (*.smsnap)")
+        if not file_path:
+            return
+        try:
+            snapshot = read_snapshot(file_path)
+            self.state_machine.restore_snapshot(snapshot)
+        except (OSError, SnapshotError) as e:
+            QMessageBox.warning(self, 'Warning', f'{e}')
+            return
+        self.table_view_w_search.table_view._set_all_conditions_allowed(snapshot['conditions_allowed'])
+
     def trigger_slot(self, row):
         if len(row) >= 5:
             # source = row[0]
@@ -2019,13 +2745,22 @@ class MainWindow(QMainWindow):
             self.state_machine.trigger_transition(trigger)
 
     def closeEvent(self, event):
-        self._save_conditions_allowed()
-        
-        self.state_machine._save_state_positions()
+        if self.is_loading():
+            # saving a half loaded config would overwrite the files with nothing
+            self.cancel_deferred_loading()
+        else:
+            self._save_conditions_allowed()
+            self.state_machine._save_state_positions()
+
+        self.state_machine.trigger_queue.clear()
+        self.state_machine.trigger_queue.stop_worker_thread()
+        self.state_machine.paint_stats.stop_recording()
 
         self.save_settings()
 
         self.config_page._close()
+        if self.profiler_panel is not None:
+            self.profiler_panel.close()
 
         event.accept()
 
@@ -0,0 +1,248 @@
+import heapq
+import itertools
+import threading
+import time
+
+from PyQt5.QtCore import Qt, QObject, QTimer, pyqtSignal
+from transitions.extensions.states import Timeout
+
+
+class TimeoutScheduler:
+    """
+    One heap of deadlines shared by every timeout state of every model, so thousands of timeouts
+    cost one timer instead of one thread each. A driver (Qt event loop, asyncio loop or a single
+    thread) is told when the earliest deadline changes and calls run_due() once it has passed.
+    """
+
+    def __init__(self, driver=None):
+        self.heap = []
+        self.counter = itertools.count()
+        self.lock = threading.RLock()
+        self.cancelled_count = 0
+        self.driver = None
+        self.set_driver(driver if driver is not None else ThreadTimeoutDriver())
+
+    def set_driver(self, driver):
+        with self.lock:
+            old_driver = self.driver
+            self.driver = driver
+            driver.attach(self)
+        if old_driver is not None:
+            old_driver.detach()
+        self.wakeup_driver()
+
+    def schedule(self, delay, callback, *args):
+        # the entry itself is the handle, cancel() flags it and run_due() skips it
+        entry = [time.monotonic() + delay, next(self.counter), callback, args, False]
+        with self.lock:
+            heapq.heappush(self.heap, entry)
+            is_earliest = self.heap[0] is entry
+        if is_earliest:
+            self.wakeup_driver()
+        return entry
+
+    def cancel(self, entry):
+        with self.lock:
+            if entry[4]:
+                return
+            entry[4] = True
+            self.cancelled_count += 1
+            # drop the cancelled entries once they are the majority, pushing keeps the heap small
+            if self.cancelled_count > 64 and self.cancelled_count * 2 > len(self.heap):
+                self.heap = [item for item in self.heap if not item[4]]
+                heapq.heapify(self.heap)
+                self.cancelled_count = 0
+
+    def next_delay(self):
+        with self.lock:
+            while self.heap and self.heap[0][4]:
+                heapq.heappop(self.heap)
+                self.cancelled_count -= 1
+            if not self.heap:
+                return None
+            return max(0.0, self.heap[0][0] - time.monotonic())
+
+    def run_due(self):
+        now = time.monotonic()
+        due = []
+        with self.lock:
+            while self.heap and self.heap[0][0] <= now:
+                entry = heapq.heappop(self.heap)
+                if entry[4]:
+                    self.cancelled_count -= 1
+                    continue
+                entry[4] = True
+                due.append(entry)
+
+        for deadline, sequence, callback, args, cancelled in due:
+            try:
+                callback(*args)
+            except Exception as e:
+                print(f'timeout callback {callback} failed: {e}')
+
+        self.wakeup_driver()
+
+    def wakeup_driver(self):
+        driver = self.driver
+        if driver is not None:
+            driver.wakeup(self.next_delay())
+
+    def pending_count(self):
+        with self.lock:
+            return len(self.heap) - self.cancelled_count
+
+
+class ThreadTimeoutDriver:
+    """
+    Runs the scheduler on one daemon thread, for machines used without an event loop.
+    """
+
+    def __init__(self):
+        self.scheduler = None
+        self.condition = threading.Condition()
+        self.thread = None
+        self.running = False
+
+    def attach(self, scheduler):
+        self.scheduler = scheduler
+
+    def detach(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+
+    def wakeup(self, delay):
+        if delay is None and self.thread is None:
+            return
+        with self.condition:
+            if self.thread is None:
+                self.running = True
+                self.thread = threading.Thread(target=self.loop, daemon=True)
+                self.thread.start()
+            self.condition.notify()
+
+    def loop(self):
+        while True:
+            with self.condition:
+                if not self.running:
+                    return
+                delay = self.scheduler.next_delay()
+                if delay is None or delay > 0:
+                    self.condition.wait(delay)
+                    continue
+            self.scheduler.run_due()
+
+
+class QtTimeoutDriver(QObject):
+    """
+    Runs the scheduler from one single shot QTimer in the thread the driver lives in. With a
+    run_callback (e.g. TriggerQueue.run_callback) the due timeouts are handed to it instead, so
+    they run where the triggers run. It returns a Future, a cancelled one rearms the timer.
+    """
+
+    wakeup_signal = pyqtSignal()
+
+    def __init__(self, parent=None, run_callback=None):
+        super().__init__(parent)
+        self.scheduler = None
+        self.run_callback = run_callback
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setTimerType(Qt.PreciseTimer)
+        self.timer.timeout.connect(self.timeout_slot)
+        # timeouts may be scheduled from any thread, the timer is only touched from its own
+        self.wakeup_signal.connect(self.rearm_slot, Qt.QueuedConnection)
+
+    def attach(self, scheduler):
+        self.scheduler = scheduler
+
+    def detach(self):
+        self.scheduler = None
+
+    def wakeup(self, delay):
+        self.wakeup_signal.emit()
+
+    def rearm_slot(self):
+        if self.scheduler is None:
+            return
+        delay = self.scheduler.next_delay()
+        if delay is None:
+            self.timer.stop()
+        else:
+            self.timer.start(int(delay * 1000 + 0.999))
+
+    def timeout_slot(self):
+        if self.scheduler is None:
+            return
+        if self.run_callback is None:
+            self.scheduler.run_due()
+            return
+        future = self.run_callback(self.scheduler.run_due)
+        # the due timeouts are still in the heap, e.g. the queue was cleared before they ran
+        future.add_done_callback(lambda future: future.cancelled() and self.wakeup(None))
+
+
+class AsyncioTimeoutDriver:
+    """
+    Runs the scheduler from one call_later() handle on an asyncio loop.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.scheduler = None
+        self.handle = None
+
+    def attach(self, scheduler):
+        self.scheduler = scheduler
+
+    def detach(self):
+        self.scheduler = None
+        self.loop.call_soon_threadsafe(self.rearm)
+
+    def wakeup(self, delay):
+        self.loop.call_soon_threadsafe(self.rearm)
+
+    def rearm(self):
+        if self.handle is not None:
+            self.handle.cancel()
+            self.handle = None
+        if self.scheduler is None:
+            return
+        delay = self.scheduler.next_delay()
+        if delay is not None:
+            self.handle = self.loop.call_later(delay, self.timeout)
+
+    def timeout(self):
+        self.handle = None
+        if self.scheduler is not None:
+            self.scheduler.run_due()
+
+
+default_scheduler = None
+
+
+def get_timeout_scheduler():
+    global default_scheduler
+    if default_scheduler is None:
+        default_scheduler = TimeoutScheduler()
+    return default_scheduler
+
+
+class ScheduledTimeout(Timeout):
+    """
+    Drop-in replacement of the Timeout state feature which puts its timers on the shared
+    TimeoutScheduler instead of starting a threading.Timer per state entry.
+    """
+
+    def enter(self, event_data):
+        if self.timeout > 0:
+            entry = get_timeout_scheduler().schedule(self.timeout, self._process_timeout, event_data)
+            self.runner[id(event_data.model)] = entry
+        # skip Timeout.enter(), it would start its own thread
+        return super(Timeout, self).enter(event_data)
+
+    def exit(self, event_data):
+        entry = self.runner.pop(id(event_data.model), None)
+        if entry is not None:
+            get_timeout_scheduler().cancel(entry)
+        return super(Timeout, self).exit(event_data)
@@ -0,0 +1,121 @@
+import time
+from collections import deque
+
+from PyQt5.QtCore import Qt, QObject, QTimer, pyqtSignal
+
+
+class TransitionAnimator(QObject):
+    """
+    Plays the highlight of taken transitions one after the other from a single frame timer.
+    Every highlight walks through the same key frames: the source dims, the source and the
+    destination are both shown, the destination stays, then the final state is shown.
+
+    New highlights are queued instead of interrupting the one playing. The more are waiting,
+    the faster they are played, and beyond max_backlog the oldest ones are skipped.
+    """
+
+    # (time in ms, phase) of one highlight at normal speed
+    KEY_FRAMES = [(150, 'leave'), (400, 'cross'), (650, 'arrive'), (850, 'final')]
+
+    frame_signal = pyqtSignal(str, object, object)
+
+    def __init__(self, frame_interval=16, max_backlog=16, parent=None):
+        super().__init__(parent)
+        self.max_backlog = max_backlog
+        self.speed = 1.0
+        self.enabled = True
+
+        self.queue = deque()
+        self.current = None
+        self.elapsed = 0.0
+        self.next_key_frame = 0
+        self.last_tick = None
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(frame_interval)
+        self.timer.setTimerType(Qt.PreciseTimer)
+        self.timer.timeout.connect(self.tick)
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+        if not enabled:
+            self.finish_all()
+
+    def set_speed(self, speed):
+        self.speed = max(0.1, speed)
+
+    def is_running(self):
+        return self.current is not None or len(self.queue) > 0
+
+    def backlog_full(self):
+        return len(self.queue) >= self.max_backlog
+
+    def enqueue(self, source, dest):
+        if not self.enabled:
+            # no animation, jump straight to the end
+            self.frame_signal.emit('arrive', source, dest)
+            self.frame_signal.emit('final', source, dest)
+            return
+
+        self.queue.append((source, dest))
+        while len(self.queue) > self.max_backlog:
+            self.queue.popleft()
+
+        if self.current is None:
+            self.start_next()
+
+    def start_next(self):
+        if len(self.queue) == 0:
+            self.current = None
+            self.timer.stop()
+            return
+
+        self.current = self.queue.popleft()
+        self.elapsed = 0.0
+        self.next_key_frame = 0
+        self.last_tick = time.perf_counter()
+        if not self.timer.isActive():
+            self.timer.start()
+
+    def tick(self):
+        if self.current is None:
+            self.timer.stop()
+            return
+
+        now = time.perf_counter()
+        # highlights waiting behind this one speed it up
+        self.elapsed += (now - self.last_tick) * 1000 * self.speed * (1 + len(self.queue))
+        self.last_tick = now
+
+        source, dest = self.current
+        while self.next_key_frame < len(self.KEY_FRAMES) and self.elapsed >= self.KEY_FRAMES[self.next_key_frame][0]:
+            phase = self.KEY_FRAMES[self.next_key_frame][1]
+            self.next_key_frame += 1
+            self.frame_signal.emit(phase, source, dest)
+
+        if self.next_key_frame >= len(self.KEY_FRAMES):
+            self.start_next()
+
+    def skip(self):
+        # interrupts the highlight playing and shows where it ends
+        if self.current is None:
+            return
+        source, dest = self.current
+        self.next_key_frame = len(self.KEY_FRAMES)
+        self.frame_signal.emit('arrive', source, dest)
+        self.frame_signal.emit('final', source, dest)
+        self.start_next()
+
+    def finish_all(self):
+        last = self.queue[-1] if self.queue else self.current
+        self.queue.clear()
+        self.current = None
+        self.timer.stop()
+        if last is not None:
+            self.frame_signal.emit('arrive', last[0], last[1])
+            self.frame_signal.emit('final', last[0], last[1])
+
+    def stop(self):
+        self.queue.clear()
+        self.current = None
+        self.timer.stop()
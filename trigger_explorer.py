@@ -0,0 +1,487 @@
+import sys, os
+import copy
+import json
+import time
+import random
+import argparse
+import configparser
+from concurrent.futures import ProcessPoolExecutor
+
+from transitions.core import MachineError
+
+from state_machine_core import MachineBackend, create_machine, create_matter_class, read_transitions_folder, resolve_path
+from machine_validator import SEPARATOR, collect_states, first_initial_state, load_custom_matter
+from machine_snapshot import restore_attributes
+
+
+STRATEGIES = ['bfs', 'dfs', 'random']
+
+# below this many states a BFS level is expanded in the main process, the pool costs more than it saves
+MIN_PARALLEL_LEVEL = 64
+
+
+def read_conditions_allowed(transitions_folder):
+    # the Yes/No of the transitions table, saved next to the transitions
+    config = configparser.ConfigParser()
+    config.optionxform = str
+    config.read(os.path.join(transitions_folder, 'conditions_allow.ini'))
+    if 'Conditions' in config:
+        return dict(config['Conditions'])
+    return {}
+
+
+def strip_timeouts(state_list):
+    # timeouts fire on time, not on a trigger, the explorer leaves them out
+    for state_data in state_list:
+        if isinstance(state_data, dict):
+            state_data.pop('timeout', None)
+            state_data.pop('on_timeout', None)
+            strip_timeouts(state_data.get('children', []))
+    return state_list
+
+
+def callback_names(state_list, transitions):
+    names = set()
+
+    def add(value):
+        if isinstance(value, str):
+            names.add(value)
+        elif isinstance(value, list):
+            names.update(item for item in value if isinstance(item, str))
+
+    stack = list(state_list)
+    while stack:
+        state_data = stack.pop()
+        if isinstance(state_data, dict):
+            add(state_data.get('on_enter'))
+            add(state_data.get('on_exit'))
+            stack.extend(state_data.get('children', []))
+    for transition in transitions:
+        for key in ('conditions', 'unless', 'prepare', 'before', 'after'):
+            add(transition.get(key))
+    return names
+
+
+def make_callback(name, custom_matter, allowed):
+    # like the widget: the custom matter function when there is one, else the Yes/No of the table
+    custom_function = getattr(custom_matter, name, None) if custom_matter is not None else None
+    if callable(custom_function):
+        def callback(self, event_data):
+            result = custom_function([])
+            return True if result is None else result
+    else:
+        def callback(self, event_data):
+            return allowed
+    callback.__name__ = name
+    return callback
+
+
+def state_key(state):
+    # the state of a model in parallel states is a list, the key has to be hashable
+    return tuple(state) if isinstance(state, list) else state
+
+
+def state_label(state):
+    return ','.join(state) if isinstance(state, tuple) else state
+
+
+class MachineRunner:
+    """
+    A nested machine of the definition with a single model. Before every trigger the model is put back
+    to the state being explored, which stands in for a clone of the model per branch at the cost of a
+    set_state(). Conditions answer like in the app, gates and conditions of the custom matter are called.
+    Without a custom function the machine is deterministic and every (state, trigger) only runs once,
+    later steps are looked up, which is what makes random walks of millions of steps affordable.
+    """
+
+    def __init__(self, json_states, json_transitions, conditions_allowed=None, custom_matter_file=None, all_triggers=False, snapshot=None):
+        json_states = strip_timeouts(copy.deepcopy(json_states))
+        json_transitions = copy.deepcopy(json_transitions)
+        conditions_allowed = conditions_allowed or {}
+        custom_matter = load_custom_matter(custom_matter_file) if custom_matter_file else None
+
+        matter_class = create_matter_class()
+        self.deterministic = True
+        for name in callback_names(json_states, json_transitions):
+            allowed = conditions_allowed.get(name, 'Yes').lower() == 'yes'
+            setattr(matter_class, name, make_callback(name, custom_matter, allowed))
+            if callable(getattr(custom_matter, name, None)):
+                # a custom function may answer differently on the next call
+                self.deterministic = False
+
+        states, _, _ = collect_states(json_states)
+        initial = first_initial_state(json_states, states)
+
+        self.model = matter_class()
+        # with all_triggers an invalid trigger raises the MachineError the explorer reports
+        self.machine = create_machine(MachineBackend.nested, self.model, json_states, json_transitions, initial,
+                                      ignore_invalid_triggers=not all_triggers)
+        if snapshot is not None:
+            # forks the explored model off a running one, no need to replay its way there
+            self.machine.set_state(snapshot['state'], model=self.model)
+            restore_attributes(self.model, snapshot['attributes'])
+        self.initial = state_key(self.model.state)
+        self.all_triggers = all_triggers
+
+        self.source_triggers = {}
+        for trigger, event in self.machine.events.items():
+            for source, transitions in event.transitions.items():
+                if transitions:
+                    self.source_triggers.setdefault(source, []).append(trigger)
+        self.all_trigger_names = tuple(self.machine.events)
+        self.triggers_cache = {}
+        # (state, trigger) -> (state after it, error)
+        self.step_cache = {}
+
+    def triggers(self, state):
+        # the triggers with a transition from the state or one of its parents
+        if self.all_triggers:
+            return self.all_trigger_names
+        triggers = self.triggers_cache.get(state)
+        if triggers is None:
+            found = []
+            for path in (state if isinstance(state, tuple) else (state,)):
+                parts = path.split(SEPARATOR)
+                for depth in range(1, len(parts) + 1):
+                    found.extend(self.source_triggers.get(SEPARATOR.join(parts[:depth]), ()))
+            triggers = self.triggers_cache[state] = tuple(dict.fromkeys(found))
+        return triggers
+
+    def step(self, state, trigger):
+        # returns (state after the trigger, None) or (None, error text)
+        if self.deterministic:
+            result = self.step_cache.get((state, trigger))
+            if result is None:
+                result = self.step_cache[(state, trigger)] = self.run_step(state, trigger)
+            return result
+        return self.run_step(state, trigger)
+
+    def run_step(self, state, trigger):
+        self.machine.set_state(list(state) if isinstance(state, tuple) else state, model=self.model)
+        try:
+            self.model.trigger(trigger)
+        except MachineError as e:
+            return None, f'MachineError: {e.value}'
+        except Exception as e:
+            return None, f'{type(e).__name__}: {e}'
+        return state_key(self.model.state), None
+
+    def expand(self, state):
+        return [(trigger,) + self.step(state, trigger) for trigger in self.triggers(state)]
+
+
+# the runner of a worker process, built once by init_worker()
+worker_runner = None
+
+
+def init_worker(definition):
+    global worker_runner
+    worker_runner = MachineRunner(*definition)
+
+
+def expand_states(states):
+    return [(state, worker_runner.expand(state)) for state in states]
+
+
+def run_dfs(runner, root, root_path, visited, max_depth, max_steps):
+    # returns ({state: path}, [(path, state, trigger, error)], steps), visited is updated
+    found = {root: root_path}
+    errors = []
+    steps = 0
+    stack = [(root, root_path)]
+    while stack:
+        state, path = stack.pop()
+        if max_depth is not None and len(path) >= max_depth:
+            continue
+        for trigger, next_state, error in runner.expand(state):
+            steps += 1
+            if error is not None:
+                errors.append((path, state, trigger, error))
+            elif next_state not in visited:
+                visited.add(next_state)
+                found[next_state] = path + [trigger]
+                stack.append((next_state, path + [trigger]))
+        if max_steps is not None and steps >= max_steps:
+            break
+    return found, errors, steps
+
+
+def explore_branch(root, root_path, visited, max_depth, max_steps):
+    return run_dfs(worker_runner, root, root_path, set(visited), max_depth, max_steps)
+
+
+def run_random_walks(runner, seed, walks, walk_length):
+    rnd = random.Random(seed)
+    found = {runner.initial: []}
+    errors = []
+    steps = 0
+    for _ in range(walks):
+        state, path = runner.initial, []
+        for _ in range(walk_length):
+            triggers = runner.triggers(state)
+            if not triggers:
+                break
+            trigger = rnd.choice(triggers)
+            next_state, error = runner.step(state, trigger)
+            steps += 1
+            if error is not None:
+                errors.append((path, state, trigger, error))
+                break
+            path = path + [trigger]
+            state = next_state
+            known = found.get(state)
+            if known is None or len(known) > len(path):
+                found[state] = path
+    return found, errors, steps
+
+
+def random_walks(seed, walks, walk_length):
+    return run_random_walks(worker_runner, seed, walks, walk_length)
+
+
+class TriggerExplorer:
+    """
+    Enumerates trigger sequences from the first initial state: breadth first or depth first with the
+    visited states deduplicated, or seeded random walks. Work is spread over a process pool, each
+    worker builds its own machine. The result has a shortest known trigger path to every state
+    reached and the sequences that raised, ready to be turned into test cases.
+    """
+
+    def __init__(self, json_states, json_transitions, conditions_allowed=None, custom_matter_file=None, all_triggers=False, jobs=None, snapshot=None):
+        # with a snapshot of machine_snapshot.py the paths start from its state instead
+        self.definition = (json_states, json_transitions, conditions_allowed, custom_matter_file, all_triggers, snapshot)
+        self.jobs = jobs or os.cpu_count() or 1
+        self.runner = MachineRunner(*self.definition)
+
+    def pool(self):
+        return ProcessPoolExecutor(max_workers=self.jobs, initializer=init_worker, initargs=(self.definition,))
+
+    def bfs(self, max_depth=None, max_steps=None):
+        start = time.perf_counter()
+        initial = self.runner.initial
+        # state -> (previous state, trigger), the path is put together once at the end
+        parents = {initial: None}
+        errors = {}
+        steps = 0
+        truncated = False
+
+        executor = self.pool() if self.jobs > 1 else None
+        try:
+            frontier = [initial]
+            depth = 0
+            while frontier:
+                if max_depth is not None and depth >= max_depth:
+                    truncated = True
+                    break
+                if max_steps is not None and steps >= max_steps:
+                    truncated = True
+                    break
+
+                if executor is None or len(frontier) < MIN_PARALLEL_LEVEL:
+                    expanded = [(state, self.runner.expand(state)) for state in frontier]
+                else:
+                    chunk_size = max(1, len(frontier) // (self.jobs * 4))
+                    chunks = [frontier[i:i + chunk_size] for i in range(0, len(frontier), chunk_size)]
+                    expanded = [item for chunk in executor.map(expand_states, chunks) for item in chunk]
+
+                next_frontier = []
+                for state, results in expanded:
+                    for trigger, next_state, error in results:
+                        steps += 1
+                        if error is not None:
+                            errors.setdefault((state, trigger, error), state)
+                        elif next_state not in parents:
+                            parents[next_state] = (state, trigger)
+                            next_frontier.append(next_state)
+                frontier = next_frontier
+                depth += 1
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        paths = {}
+
+        def path_to(state):
+            path = paths.get(state)
+            if path is None:
+                trail = []
+                current = state
+                while parents[current] is not None and current not in paths:
+                    current, trigger = parents[current]
+                    trail.append(trigger)
+                path = paths.get(current, []) + trail[::-1]
+                paths[state] = path
+            return path
+
+        for state in parents:
+            path_to(state)
+        error_list = [(paths[state], state, trigger, error) for (state, trigger, error) in errors]
+        return self.result('bfs', paths, error_list, steps, truncated, start)
+
+    def dfs(self, max_depth=None, max_steps=None):
+        start = time.perf_counter()
+        initial = self.runner.initial
+
+        # the branches below the initial state are explored in parallel, each one deduplicates on its own
+        roots = {}
+        errors = []
+        steps = 0
+        for trigger, next_state, error in self.runner.expand(initial):
+            steps += 1
+            if error is not None:
+                errors.append(([], initial, trigger, error))
+            elif next_state != initial and next_state not in roots:
+                roots[next_state] = [trigger]
+
+        found = {initial: []}
+        visited = {initial} | set(roots)
+        branch_steps = None if max_steps is None else max(1, (max_steps - steps) // max(1, len(roots)))
+
+        if self.jobs > 1 and len(roots) > 1:
+            with self.pool() as executor:
+                futures = [executor.submit(explore_branch, root, path, visited, max_depth, branch_steps)
+                           for root, path in roots.items()]
+                branches = [future.result() for future in futures]
+        else:
+            branches = [run_dfs(self.runner, root, path, set(visited), max_depth, branch_steps)
+                        for root, path in roots.items()]
+
+        truncated = False
+        for branch_found, branch_errors, branch_steps_done in branches:
+            self.merge(found, branch_found)
+            errors.extend(branch_errors)
+            steps += branch_steps_done
+            if branch_steps is not None and branch_steps_done >= branch_steps:
+                truncated = True
+        return self.result('dfs', found, errors, steps, truncated, start)
+
+    def random(self, walks=1000, walk_length=50, seed=0):
+        start = time.perf_counter()
+        found = {}
+        errors = []
+        steps = 0
+
+        if self.jobs > 1 and walks > 1:
+            jobs = min(self.jobs, walks)
+            shares = [walks // jobs + (1 if i < walks % jobs else 0) for i in range(jobs)]
+            with self.pool() as executor:
+                futures = [executor.submit(random_walks, seed + i, share, walk_length) for i, share in enumerate(shares)]
+                results = [future.result() for future in futures]
+        else:
+            results = [run_random_walks(self.runner, seed, walks, walk_length)]
+
+        for walk_found, walk_errors, walk_steps in results:
+            self.merge(found, walk_found)
+            errors.extend(walk_errors)
+            steps += walk_steps
+        return self.result('random', found, errors, steps, False, start)
+
+    @staticmethod
+    def merge(found, other):
+        # keeps the shortest path known to every state
+        for state, path in other.items():
+            known = found.get(state)
+            if known is None or len(known) > len(path):
+                found[state] = path
+
+    def result(self, strategy, paths, errors, steps, truncated, start):
+        # being in a state is being in its parents as well
+        reached = set()
+        for state in paths:
+            for path in (state if isinstance(state, tuple) else (state,)):
+                parts = path.split(SEPARATOR)
+                for depth in range(1, len(parts) + 1):
+                    reached.add(SEPARATOR.join(parts[:depth]))
+
+        unique_errors = {}
+        for path, state, trigger, error in errors:
+            key = (state, trigger, error)
+            known = unique_errors.get(key)
+            if known is None or len(known['path']) > len(path):
+                unique_errors[key] = {'path': path + [trigger], 'state': state_label(state), 'trigger': trigger, 'error': error}
+
+        return {
+            'strategy': strategy,
+            'initial': state_label(self.runner.initial),
+            'steps': steps,
+            'elapsed': time.perf_counter() - start,
+            'truncated': truncated,
+            'paths': {state_label(state): path for state, path in paths.items()},
+            'unreached': [name for name in self.runner.machine.get_nested_state_names() if name not in reached],
+            'errors': list(unique_errors.values()),
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Explore the trigger sequences of a machine and write the path to every state.')
+    parser.add_argument('name', nargs='?', help='config of config.json to explore, the current one when omitted')
+    parser.add_argument('-c', '--config', default='config.json', help='config file, default config.json')
+    parser.add_argument('--states', help='states JSON file, explored instead of a config')
+    parser.add_argument('--transitions', help='transitions folder, with --states')
+    parser.add_argument('--matter', help='custom matter file, with --states')
+    parser.add_argument('-s', '--strategy', default='bfs', choices=STRATEGIES, help='default bfs')
+    parser.add_argument('--max-depth', type=int, default=None, help='longest trigger sequence of bfs and dfs')
+    parser.add_argument('--max-steps', type=int, default=None, help='triggers to run at most, bfs and dfs')
+    parser.add_argument('--walks', type=int, default=1000, help='random walks, default 1000')
+    parser.add_argument('--walk-length', type=int, default=50, help='triggers per random walk, default 50')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the random walks, default 0')
+    parser.add_argument('--all-triggers', action='store_true', help='try every trigger in every state, invalid ones are reported as MachineError')
+    parser.add_argument('--snapshot', help='snapshot file to start from instead of the initial state, its conditions Yes/No are used')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='number of processes, default one per CPU')
+    parser.add_argument('-o', '--output', help='JSON file the paths and errors are written to')
+    args = parser.parse_args(argv)
+
+
+    if args.states:
+        states_file, transitions_folder, matter_file = args.states, args.transitions or '', args.matter
+    else:
+        with open(args.config, 'r') as f:
+            data = json.load(f)
+        configs = data.get('configs', {})
+        name = args.name or data.get('current_config')
+        if name not in configs:
+            parser.error(f'Config not found: {name}')
+        config = configs[name]
+        base_dir = os.path.dirname(os.path.abspath(args.config))
+        states_file = resolve_path(base_dir, config.get('main_resource', ''))
+        transitions_folder = resolve_path(base_dir, config.get('secondary_resource', ''))
+        matter_file = resolve_path(base_dir, config.get('custom_matter')) if config.get('enable_custom_matter') else None
+
+    with open(states_file, 'r') as f:
+        json_states = json.load(f)
+    json_transitions, invalid_files = read_transitions_folder(transitions_folder)
+    for file_path in invalid_files:
+        print(f'{file_path} is not a valid JSON, skipped')
+
+    conditions_allowed = read_conditions_allowed(transitions_folder)
+    snapshot = None
+    if args.snapshot:
+        from machine_snapshot import read_snapshot
+        snapshot = read_snapshot(args.snapshot)
+        conditions_allowed.update(snapshot['conditions_allowed'])
+
+    explorer = TriggerExplorer(json_states, json_transitions or [], conditions_allowed,
+                               matter_file, args.all_triggers, args.jobs, snapshot)
+    if args.strategy == 'random':
+        result = explorer.random(args.walks, args.walk_length, args.seed)
+    else:
+        result = getattr(explorer, args.strategy)(args.max_depth, args.max_steps)
+
+    print(f'{result["strategy"]}: {result["steps"]} steps in {result["elapsed"]:.2f} s, '
+          f'{len(result["paths"])} states reached from {result["initial"]}'
+          f'{" (stopped at the limit)" if result["truncated"] else ""}')
+    if result['unreached']:
+        print(f'unreached: {", ".join(result["unreached"][:20])}{" ..." if len(result["unreached"]) > 20 else ""}')
+    for error in result['errors'][:20]:
+        print(f'error after {" ".join(error["path"])}: {error["error"]}')
+    if len(result['errors']) > 20:
+        print(f'... {len(result["errors"]) - 20} more errors')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=4)
+    return 1 if result['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,243 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from enum import Enum
+
+from PyQt5.QtCore import Qt, QObject, QThread, QTimer, pyqtSignal, pyqtSlot
+
+
+class TriggerPolicy(Enum):
+    block       = 0
+    drop        = 1
+    coalesce    = 2
+
+    @property
+    def capitalized_name(self):
+        return self.name.capitalize()
+
+
+class TriggerWorker(QObject):
+    """
+    Lives in the worker thread and runs one trigger at a time for the TriggerQueue.
+    """
+
+    run_signal = pyqtSignal(object, object)
+    call_signal = pyqtSignal(object, object)
+    finished_signal = pyqtSignal()
+
+    def __init__(self, run, call):
+        super().__init__()
+        self.run = run
+        self.call = call
+        self.run_signal.connect(self.run_slot, Qt.QueuedConnection)
+        self.call_signal.connect(self.call_slot, Qt.QueuedConnection)
+
+    @pyqtSlot(object, object)
+    def run_slot(self, trigger, future):
+        self.run(trigger, future)
+        self.finished_signal.emit()
+
+    @pyqtSlot(object, object)
+    def call_slot(self, callback, future):
+        self.call(callback, future)
+
+
+class TriggerQueue(QObject):
+    """
+    Bounded FIFO of triggers which feeds the machine on the GUI thread. Triggers can be submitted
+    from any thread, each one gets a Future resolved with the trigger's result. While the machine
+    is busy (e.g. animating the last transition) triggers wait in the queue instead of being lost.
+
+    What happens when the queue is full depends on the policy:
+      block     the submitting thread waits for a free slot
+      drop      the new trigger is dropped, its future resolves to None
+      coalesce  a trigger already waiting with the same name absorbs the new one (also when the
+                queue is not full), otherwise it blocks like `block`
+
+The GUI thread pumps the queue itself and can never wait, its triggers are dropped when the queue
+is full whatever the policy.
+
+    With set_worker_thread(True) the triggers, and so the machine's callbacks, run in a worker
+    thread. The queue itself stays on the GUI thread and hands them over one at a time.
+    """
+
+    wakeup_signal = pyqtSignal()
+
+    def __init__(self, run_trigger, is_busy, max_size=256, policy=TriggerPolicy.block, parent=None):
+        super().__init__(parent)
+        self.run_trigger = run_trigger
+        self.is_busy = is_busy
+        self.max_size = max_size
+        self.policy = policy
+
+        # time spent per pump, the rest of the frame is left to painting and input
+        self.pump_budget = 0.010
+        self.retry_interval = 20
+
+        self.queue = deque()
+        # trigger -> future of the newest one of that name waiting, so coalescing does not scan the queue
+        self.waiting = {}
+        self.condition = threading.Condition()
+        self.dropped_count = 0
+
+        # held while a trigger runs, so clear() can wait for the one in flight
+        self.run_lock = threading.RLock()
+        # futures sent to the worker thread and not started yet, clear() cancels them
+        self.handed_over = set()
+
+        self.use_worker = False
+        self.worker = None
+        self.worker_thread = None
+        self.worker_running = False
+
+        self.retry_timer = QTimer(self)
+        self.retry_timer.setSingleShot(True)
+        self.retry_timer.timeout.connect(self.pump)
+
+        self.wakeup_signal.connect(self.pump, Qt.QueuedConnection)
+
+    def set_policy(self, policy):
+        with self.condition:
+            self.policy = policy
+            self.condition.notify_all()
+
+    def in_owner_thread(self):
+        return QThread.currentThread() is self.thread()
+
+    def submit(self, trigger):
+        future = Future()
+        owner_thread = self.in_owner_thread()
+
+        with self.condition:
+            if owner_thread and len(self.queue) == 0 and not self.is_busy() and not self.use_worker and not self.worker_running:
+                # nothing is waiting, run it right away so a click behaves as before
+                run_now = True
+            else:
+                run_now = False
+                if self.policy == TriggerPolicy.coalesce and trigger in self.waiting:
+                    return self.waiting[trigger]
+
+                if len(self.queue) >= self.max_size:
+                    # the GUI thread pumps the queue itself, so it can never wait for a free slot
+                    if not owner_thread:
+                        while len(self.queue) >= self.max_size and self.policy != TriggerPolicy.drop:
+                            self.condition.wait()
+                    if len(self.queue) >= self.max_size:
+                        self.dropped_count += 1
+                        future.set_result(None)
+                        return future
+
+                self.queue.append((trigger, future))
+                self.waiting[trigger] = future
+
+        if run_now:
+            self.run(trigger, future)
+        else:
+            self.wakeup_signal.emit()
+        return future
+
+    def set_worker_thread(self, enabled):
+        self.use_worker = enabled
+        if enabled and self.worker_thread is None:
+            self.worker_thread = QThread()
+            self.worker = TriggerWorker(self.run, self.call)
+            self.worker.moveToThread(self.worker_thread)
+            self.worker.finished_signal.connect(self.worker_finished_slot, Qt.QueuedConnection)
+            self.worker_thread.start()
+        elif not enabled and not self.worker_running:
+            # a trigger still running in the worker stops the thread when it is done
+            self.stop_worker_thread()
+
+    def stop_worker_thread(self):
+        if self.worker_thread is None:
+            return
+        self.worker_thread.quit()
+        self.worker_thread.wait()
+        self.worker = None
+        self.worker_thread = None
+
+    def worker_finished_slot(self):
+        self.worker_running = False
+        if not self.use_worker:
+            self.stop_worker_thread()
+        self.pump()
+
+    def run(self, trigger, future):
+        self.call(lambda: self.run_trigger(trigger), future)
+
+    def call(self, callback, future):
+        # started under the lock, so clear() either cancels the future or waits for it
+        with self.run_lock:
+            with self.condition:
+                self.handed_over.discard(future)
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(callback())
+            except Exception as e:
+                future.set_exception(e)
+
+    def run_callback(self, callback):
+        # runs callback where the triggers run, e.g. the due timeouts of the machine, so it never
+        # overlaps one of them. Its future is cancelled when clear() comes before it
+        future = Future()
+        if self.use_worker and self.worker is not None:
+            with self.condition:
+                self.handed_over.add(future)
+            self.worker.call_signal.emit(callback, future)
+        else:
+            self.call(callback, future)
+        return future
+
+    def pump(self):
+        deadline = time.perf_counter() + self.pump_budget
+        while True:
+            if self.worker_running:
+                # worker_finished_slot() pumps again
+                return
+
+            if self.is_busy():
+                self.retry_timer.start(self.retry_interval)
+                return
+
+            with self.condition:
+                if len(self.queue) == 0:
+                    return
+                trigger, future = self.queue.popleft()
+                if self.waiting.get(trigger) is future:
+                    del self.waiting[trigger]
+                self.condition.notify()
+
+            if self.use_worker:
+                self.worker_running = True
+                with self.condition:
+                    self.handed_over.add(future)
+                self.worker.run_signal.emit(trigger, future)
+                return
+
+            self.run(trigger, future)
+
+            if time.perf_counter() > deadline:
+                # give the event loop a turn before going on
+                self.retry_timer.start(0)
+                return
+
+    def clear(self):
+        with self.condition:
+            pending = [future for trigger, future in self.queue]
+            self.queue.clear()
+            self.waiting.clear()
+            # sent to the worker thread but not started, they would run against the reset model
+            pending.extend(self.handed_over)
+            self.handed_over.clear()
+            self.condition.notify_all()
+        for future in pending:
+            future.cancel()
+        # wait for a trigger still running in the worker thread
+        with self.run_lock:
+            pass
+
+    def pending_count(self):
+        with self.condition:
+            return len(self.queue)